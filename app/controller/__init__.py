@@ -1,2 +1,18 @@
 from modules.pokedex import PokemonNotFoundError
-from .pokedex import get_pokemon_description_translated
+from .pokedex import (
+    SpeciesIndexUnavailable,
+    TranslationPendingError,
+    cache_stats,
+    description_freshness_async,
+    export_descriptions_translated_async,
+    export_limit,
+    export_size_async,
+    flush_cache_writes,
+    get_pokemon_description_translated,
+    get_pokemon_description_translated_async,
+    get_pokemon_descriptions_translated_async,
+    publish_cache_stats,
+    publish_popularity,
+    record_popularity,
+    warm_popular,
+)
@@ -1,15 +1,399 @@
+from time import time
+import logging
 import os
 
-from modules import pokedex, shakespeare
+from modules import (
+    cache_backends,
+    deadline,
+    pokedex,
+    popularity,
+    shakespeare,
+    translation,
+)
 from modules.dynamo_cache import Cache
 
 
 TABLE_NAME = os.environ["CACHE_TABLE"]
 DUMMY = os.environ.get("DUMMY", "False").lower() == "true"
+# dynamodb, or sqlite: a file shared by the worker processes of one host
+CACHE_BACKEND = os.environ.get("CACHE_BACKEND", "dynamodb")
+CACHE_PATH = os.environ.get("CACHE_PATH", "/tmp/poke-bard-cache.sqlite")
+# cache puts are buffered and written in batches, off the request path; what
+# is buffered when an invocation ends gets at most the flush timeout
+CACHE_WRITE_BEHIND = os.environ.get("CACHE_WRITE_BEHIND", "False").lower() == "true"
+CACHE_FLUSH_TIMEOUT = float(os.environ.get("CACHE_FLUSH_TIMEOUT", "1"))
+# bumping a version leaves all its cached entries behind: descriptions after
+# changing how they are cleaned, translations after changing the engine
+DESCRIPTIONS_VERSION = int(os.environ.get("DESCRIPTIONS_VERSION", "1"))
+TRANSLATIONS_VERSION = int(os.environ.get("TRANSLATIONS_VERSION", "1"))
+BATCH_CONCURRENCY = int(os.environ.get("BATCH_CONCURRENCY", "8"))
+# species per export page, each page gets a request budget of its own
+EXPORT_PAGE_SIZE = int(os.environ.get("EXPORT_PAGE_SIZE", "50"))
+# species per export at most, 0 for no cap: mangum buffers whole responses,
+# and an export has to fit in the lambda invocation
+EXPORT_MAX_LIMIT = int(
+    os.environ.get(
+        "EXPORT_MAX_LIMIT", "250" if "AWS_LAMBDA_FUNCTION_VERSION" in os.environ else "0"
+    )
+)
+# remote (funtranslations), local, or remote+local (local while remote fails)
+TRANSLATION_ENGINE = os.environ.get("TRANSLATION_ENGINE", "remote")
+# popularity counts are kept per process, and merged into the table at most
+# once per interval; older counts lose half their weight per half life
+POPULARITY_KEY = "popularity:top"
+POPULARITY_SIZE = 100
+POPULARITY_INTERVAL = float(os.environ.get("POPULARITY_INTERVAL", "60"))
+POPULARITY_HALF_LIFE = float(os.environ.get("POPULARITY_HALF_LIFE", str(6*60*60)))
+# the warmer refreshes the top entries that go stale within the horizon, and
+# asks for at most WARM_TRANSLATIONS uncached translations per run: the
+# quota is shared with every process serving users, that it can not see
+WARM_TOP = int(os.environ.get("WARM_TOP", "20"))
+WARM_HORIZON = float(os.environ.get("WARM_HORIZON", str(2*60*60)))
+WARM_TRANSLATIONS = int(os.environ.get("WARM_TRANSLATIONS", "1"))
+# cache statistics are sent as gauges, and start over, once per interval
+CACHE_STATS_INTERVAL = float(os.environ.get("CACHE_STATS_INTERVAL", "60"))
+
+logger = logging.getLogger(__name__)
+
+BACKEND = cache_backends.get_backend(
+    CACHE_BACKEND, TABLE_NAME, CACHE_PATH, write_behind=CACHE_WRITE_BEHIND
+)
+# species descriptions are cached by canonical pokemon, translations by the
+# content of the text; so a translation outlives (and is shared across) species
+DESCRIPTIONS = Cache(
+    table_name=TABLE_NAME,
+    ttl=7*24*60*60,
+    soft_ttl=24*60*60,
+    dummy=DUMMY,
+    key=pokedex.description_key,
+    name="descriptions",
+    version=DESCRIPTIONS_VERSION,
+    backend=BACKEND,
+)
+TRANSLATIONS = Cache(
+    table_name=TABLE_NAME,
+    ttl=30*24*60*60,
+    dummy=DUMMY,
+    key=shakespeare.translation_key,
+    name="translations",
+    version=TRANSLATIONS_VERSION,
+    backend=BACKEND,
+)
+# no memory tier, every process merges its counts into the table's; v2
+# holds the time the counts were last decayed along with them
+POPULAR = Cache(
+    table_name=TABLE_NAME,
+    ttl=7*24*60*60,
+    dummy=DUMMY,
+    name="popularity",
+    backend=BACKEND,
+    memory_items=0,
+    version=2,
+)
+CACHES = [DESCRIPTIONS, TRANSLATIONS, POPULAR]
+POPULARITY = popularity.TopK(POPULARITY_SIZE)
+_popularity_published = time()
+_cache_stats_published = time()
+
+# bundled species are read from the artefact ahead of the cache, only the
+# others are fetched, cached and kept fresh
+fetch_description = DESCRIPTIONS(pokedex.fetch_pokemon_description)
+fetch_description_async = DESCRIPTIONS(pokedex.fetch_pokemon_description_async)
+ENGINE = translation.get_engine(TRANSLATION_ENGINE, TRANSLATIONS, BATCH_CONCURRENCY)
+
+
+class SpeciesIndexUnavailable(RuntimeError):
+    def __init__(self):
+        super().__init__("Species index unavailable, pokeapi could not be reached")
+
+
+class TranslationPendingError(shakespeare.TranslationPendingError):
+    """
+    The description is known but its translation is queued, `description`
+    holds the untranslated text (or the local engine's translation) meanwhile.
+    """
+
+    def __init__(self, name, description):
+        super().__init__(description)
+        self.name = name
+        self.description = description
+
+
+def _store_deferred_translation(text, translated):
+    TRANSLATIONS.put(shakespeare.translation_key(text), translated)
+
+
+shakespeare.SCHEDULER.on_translated.append(_store_deferred_translation)
+
+
+def _meanwhile(error, description):
+    # a fallback engine leaves its translation on the pending error
+    return getattr(error, "translation", None) or description
 
 
-@Cache(table_name=TABLE_NAME, ttl=24*60*60, dummy=DUMMY)
 def get_pokemon_description_translated(pokemon_id: str) -> str:
-    name, description = pokedex.get_pokemon_description(pokemon_id)
-    description = shakespeare.get_shakesperean_translation(description)
+    name = pokedex.resolve_pokemon_id(pokemon_id)
+    name, description = pokedex.from_bundle(name) or fetch_description(name)
+    try:
+        description = ENGINE.translate(description)
+    except shakespeare.TranslationPendingError as error:
+        raise TranslationPendingError(name, _meanwhile(error, description))
+    return name, description
+
+
+async def get_pokemon_description_translated_async(pokemon_id: str) -> str:
+    name = await pokedex.resolve_pokemon_id_async(pokemon_id)
+    name, description = pokedex.from_bundle(name) or await fetch_description_async(
+        name
+    )
+    try:
+        description = await ENGINE.atranslate(description)
+    except shakespeare.TranslationPendingError as error:
+        raise TranslationPendingError(name, _meanwhile(error, description))
     return name, description
+
+
+def flush_cache_writes(timeout: float = CACHE_FLUSH_TIMEOUT) -> int:
+    """
+    Writes the buffered cache puts, if writes are behind, within `timeout`
+    seconds. Returns how many were written, what is left stays buffered.
+    """
+    if not isinstance(BACKEND, cache_backends.WriteBehindBackend):
+        return 0
+    try:
+        return BACKEND.flush(timeout)
+    except Exception:
+        logger.exception("Could not flush %s cache writes", len(BACKEND))
+        return 0
+
+
+def cache_stats() -> dict:
+    """
+    Rolling statistics of every cache, by namespace.
+    """
+    return {cache.namespace: cache.stats.snapshot() for cache in CACHES}
+
+
+def publish_cache_stats(force: bool = False) -> dict:
+    """
+    Sends the statistics of every cache as gauges, if the interval went by
+    since the last time (or `force`). Returns what was sent, by namespace.
+    """
+    global _cache_stats_published
+    now = time()
+    if not force and now - _cache_stats_published < CACHE_STATS_INTERVAL:
+        return {}
+    _cache_stats_published = now
+    return {cache.namespace: cache.publish_stats() for cache in CACHES}
+
+
+async def description_freshness_async(name: str):
+    """
+    Seconds the cached description of the (canonical) pokemon stays fresh,
+    None if it is not cached.
+    """
+    try:
+        return await DESCRIPTIONS.afreshness(pokedex.description_key(name))
+    except KeyError:
+        return None
+
+
+async def get_pokemon_descriptions_translated_async(pokemon_ids) -> dict:
+    """
+    Batch version of `get_pokemon_description_translated_async`.
+
+    Returns a dict pokemon_id -> (name, description), or the
+    `PokemonNotFoundError` / `TranslationPendingError` for that id. Other
+    errors are raised.
+    """
+    results = {}
+    names = {}
+    for pokemon_id in dict.fromkeys(pokemon_ids):
+        try:
+            names[pokemon_id] = await pokedex.resolve_pokemon_id_async(pokemon_id)
+        except pokedex.PokemonNotFoundError as error:
+            results[pokemon_id] = error
+
+    bundled = {name: pokedex.from_bundle(name) for name in names.values()}
+    descriptions = await DESCRIPTIONS.amany(
+        pokedex.fetch_pokemon_description_async,
+        [name for name, described in bundled.items() if described is None],
+        concurrency=BATCH_CONCURRENCY,
+    )
+    descriptions.update(
+        (name, described) for name, described in bundled.items() if described
+    )
+    for description in descriptions.values():
+        if isinstance(description, BaseException) and not isinstance(
+            description, pokedex.PokemonNotFoundError
+        ):
+            raise description
+
+    translations = await ENGINE.atranslate_many(
+        description[1]
+        for description in descriptions.values()
+        if not isinstance(description, BaseException)
+    )
+    for translated in translations.values():
+        if isinstance(translated, BaseException) and not isinstance(
+            translated, shakespeare.TranslationPendingError
+        ):
+            raise translated
+
+    for pokemon_id, name in names.items():
+        description = descriptions[name]
+        if isinstance(description, BaseException):
+            results[pokemon_id] = description
+        else:
+            name, description = description
+            translated = translations[description]
+            if isinstance(translated, shakespeare.TranslationPendingError):
+                results[pokemon_id] = TranslationPendingError(
+                    name, _meanwhile(translated, description)
+                )
+            else:
+                results[pokemon_id] = (name, translated)
+    return {pokemon_id: results[pokemon_id] for pokemon_id in dict.fromkeys(pokemon_ids)}
+
+
+async def export_size_async() -> int:
+    """
+    Number of species an export goes through, `SpeciesIndexUnavailable` if
+    the species index can not be had.
+    """
+    index = await pokedex.get_species_index_async()
+    if index is None:
+        raise SpeciesIndexUnavailable()
+    return len(index)
+
+
+def export_limit(limit: int = None):
+    """
+    Species an export of `limit` goes through at most, EXPORT_MAX_LIMIT
+    caps it.
+    """
+    if not EXPORT_MAX_LIMIT:
+        return limit
+    return min(limit or EXPORT_MAX_LIMIT, EXPORT_MAX_LIMIT)
+
+
+async def export_descriptions_translated_async(after: int = 0, limit: int = None):
+    """
+    Async generator of `(number, name, description, pending)` for every species
+    with a description, in national pokedex order, from number `after + 1`
+    on (`limit` species at most).
+
+    Species are read a page at a time through the caches (bulk reads, gaps
+    filled from upstream, at most BATCH_CONCURRENCY at once), so memory does
+    not grow with the export and the first page goes out as soon as it is
+    ready (on lambda mangum holds it until the end). Each page gets a request
+    budget of its own, within the server's deadline if it set one: pages stop
+    once what is left of it would not fit another page as slow as the slowest
+    so far, the export is resumed after the last number yielded.
+    """
+    end = await export_size_async()
+    if limit is not None:
+        end = min(end, after + limit)
+    deadline.lift_request_budget()  # the export outlives a single request budget
+    slowest = 0.0
+    for start in range(after, end, EXPORT_PAGE_SIZE):
+        left = deadline.remaining()
+        if left is not None and start > after and left < slowest:
+            logger.info("Export stopped after %s, out of time", start)
+            return
+        stop = min(start + EXPORT_PAGE_SIZE, end)
+        numbers = [str(number) for number in range(start + 1, stop + 1)]
+        started = time()
+        with deadline.budget(deadline.REQUEST_BUDGET), shakespeare.background():
+            results = await get_pokemon_descriptions_translated_async(numbers)
+        slowest = max(slowest, time() - started)
+        for number in numbers:
+            result = results[number]
+            # species without a description are skipped too, or an export
+            # would stop (and every resume fail) at them
+            if isinstance(result, pokedex.PokemonNotFoundError):
+                continue
+            if isinstance(result, TranslationPendingError):
+                yield int(number), result.name, result.description, True
+            else:
+                yield (int(number), *result, False)
+
+
+def record_popularity(name: str) -> bool:
+    """
+    Counts a request for the (canonical) pokemon. True when the counts are
+    due to be published.
+    """
+    POPULARITY.add(name)
+    return time() - _popularity_published >= POPULARITY_INTERVAL
+
+
+def publish_popularity() -> dict:
+    """
+    Merges this process' counts into the shared ones, returns the result.
+
+    Shared counts are decayed by the time since they were last updated, by
+    any process; updates are conditional, concurrent ones are merged again.
+    """
+    global _popularity_published
+    _popularity_published = time()
+    counts = POPULARITY.pop()
+
+    def merge(shared):
+        now = time()
+        updated, shared = shared or (now, {})
+        merged = popularity.merge(
+            shared, counts, now - updated, POPULARITY_HALF_LIFE, POPULARITY_SIZE
+        )
+        return (now, merged)
+
+    _, shared = POPULAR.update(POPULARITY_KEY, merge)
+    return shared
+
+
+def _translation_cached(text):
+    try:
+        TRANSLATIONS.freshness(shakespeare.translation_key(text))
+    except KeyError:
+        return False
+    return True
+
+
+def warm_popular(
+    top: int = WARM_TOP,
+    horizon: float = WARM_HORIZON,
+    translations: int = WARM_TRANSLATIONS,
+) -> list:
+    """
+    Refreshes the `top` most requested pokemon whose descriptions go stale
+    within `horizon` seconds (or are not cached), so their users never wait
+    for pokeapi. Descriptions whose translation is not cached are only
+    translated while the run has `translations` left. Returns the names that
+    were refreshed.
+    """
+    counts = publish_popularity()
+    names = sorted(counts, key=counts.get, reverse=True)[:top]
+    warmed = []
+    for name in names:
+        if pokedex.from_bundle(name) is not None:
+            continue  # never cached, never stale
+        try:
+            if DESCRIPTIONS.freshness(pokedex.description_key(name)) > horizon:
+                continue
+        except KeyError:
+            pass
+        try:
+            name, description = DESCRIPTIONS.warm(pokedex.fetch_pokemon_description, name)
+            # translations are cached by text, only a changed description
+            # needs (and spends quota on) a new one
+            if translations > 0 and not _translation_cached(description):
+                translations -= 1
+                with shakespeare.background():
+                    ENGINE.translate(description)
+        except (pokedex.PokemonNotFoundError, shakespeare.TranslationPendingError):
+            continue
+        except Exception:
+            logger.exception("Could not warm %s", name)
+            continue
+        warmed.append(name)
+    return warmed
@@ -1,17 +1,25 @@
+import asyncio
 import os
 import logging
 
-from doglessdata import DataDogMetrics
 from fastapi import FastAPI, responses, status
-from mangum import Mangum
 
-from v1.routers import router
+from modules import compression, deadline, http_client, tracing
+from v1.routers import internal_router, router
+import controller
 
 
 STAGE = os.environ.get("STAGE", "dev")
 LAMBDA = "AWS_LAMBDA_FUNCTION_VERSION" in os.environ
 DEBUG = STAGE == "dev"
 ROOT_PATH = f"/{STAGE}" if LAMBDA else ""
+# cache statistics and such, served on dev unless told otherwise
+INTERNAL_ROUTES = os.environ.get("INTERNAL_ROUTES", str(DEBUG)).lower() == "true"
+# left for Lambda to wrap up, out of the invocation's remaining time
+LAMBDA_MARGIN = 0.5
+# seconds between cache warming runs in the container, 0 disables them; on
+# Lambda a schedule invokes `warm_handler` instead
+WARM_INTERVAL = float(os.environ.get("WARM_INTERVAL", "0" if LAMBDA else "600"))
 
 APP = FastAPI(
     title="OpenBard",
@@ -26,12 +34,22 @@ APP = FastAPI(
     debug=DEBUG,
 )
 APP.include_router(router)
+if INTERNAL_ROUTES:
+    APP.include_router(internal_router)
+APP.add_middleware(compression.CompressionMiddleware)
+APP.add_middleware(deadline.DeadlineMiddleware)
+APP.add_middleware(tracing.TracingMiddleware)
 
-metrics = DataDogMetrics(global_tags=["api"])
 logger = logging.getLogger(__name__)
 
 
-@metrics.timeit
+@APP.exception_handler(deadline.DeadlineExceeded)
+async def deadline_exceeded(request, error):
+    return responses.JSONResponse(
+        {"detail": str(error)}, status_code=status.HTTP_504_GATEWAY_TIMEOUT
+    )
+
+
 @APP.get("/")
 async def get_root():
     return responses.RedirectResponse(
@@ -39,4 +57,98 @@ async def get_root():
     )
 
 
-lambda_handler = Mangum(app=APP)
+_background = []
+
+
+async def _warm_periodically():
+    loop = asyncio.get_running_loop()
+    while True:
+        await asyncio.sleep(WARM_INTERVAL)
+        try:
+            warmed = await loop.run_in_executor(None, controller.warm_popular)
+            logger.info("Warmed %s", warmed)
+        except Exception:
+            logger.exception("Cache warming failed")
+
+
+async def _publish_cache_stats_periodically():
+    while True:
+        await asyncio.sleep(controller.pokedex.CACHE_STATS_INTERVAL)
+        try:
+            controller.publish_cache_stats(force=True)
+        except Exception:
+            logger.exception("Could not publish cache statistics")
+
+
+@APP.on_event("startup")
+async def start_background_tasks():
+    loop = asyncio.get_running_loop()
+    if WARM_INTERVAL > 0:
+        _background.append(loop.create_task(_warm_periodically()))
+    if not LAMBDA:
+        _background.append(loop.create_task(_publish_cache_stats_periodically()))
+
+
+@APP.on_event("shutdown")
+async def close_http_client():
+    for task in _background:
+        task.cancel()
+    _background.clear()
+    await http_client.close_client()
+
+
+@APP.on_event("shutdown")
+async def flush_cache_writes():
+    # on Lambda `_wrap_up` flushes, within what is left of the invocation
+    if LAMBDA:
+        return
+    await asyncio.get_running_loop().run_in_executor(None, controller.flush_cache_writes)
+
+
+_lambda_handler = None
+
+
+def lambda_handler(event, context):
+    """
+    Mangum adapter, built on the first invocation and reused while warm; the
+    container deployment never imports it.
+
+    Lifespan events are off: mangum would run them on every invocation, and
+    shutdown would close the pooled http client warm invocations reuse. What
+    an invocation has to do when it ends is done by `_wrap_up`.
+    """
+    global _lambda_handler
+    if _lambda_handler is None:
+        from mangum import Mangum
+
+        _lambda_handler = Mangum(app=APP, lifespan="off")
+    # requests get no more than the invocation has left
+    with deadline.budget(_invocation_budget(context)):
+        response = _lambda_handler(event, context)
+    _wrap_up(context)
+    return response
+
+
+def _invocation_budget(context):
+    remaining = getattr(context, "get_remaining_time_in_millis", None)
+    if remaining is None:
+        return deadline.REQUEST_BUDGET
+    return remaining() / 1000 - LAMBDA_MARGIN
+
+
+def warm_handler(event, context):
+    """
+    Scheduled entry point, refreshes the most requested pokemon before their
+    cached descriptions go stale.
+    """
+    warmed = controller.warm_popular()
+    _wrap_up(context)
+    return {"warmed": warmed}
+
+
+def _wrap_up(context):
+    # threads freeze between invocations, buffered writes go out before that
+    timeout = min(controller.pokedex.CACHE_FLUSH_TIMEOUT, _invocation_budget(context))
+    if timeout > 0:
+        controller.flush_cache_writes(timeout)
+    controller.publish_cache_stats()
@@ -0,0 +1,119 @@
+"""
+Read-only bundle of species descriptions, built once at packaging time and
+shipped inside the artefact, so known species never need pokeapi.
+
+    python -m modules.bundle [bundle_path] [species_index_path]
+"""
+import asyncio
+import logging
+import os
+import sqlite3
+import sys
+
+BUNDLE_PATH = os.environ.get(
+    "POKEDEX_BUNDLE", os.path.join(os.path.dirname(__file__), "pokedex.sqlite")
+)
+BUILD_CONCURRENCY = 10
+
+logger = logging.getLogger(__name__)
+
+
+class Bundle:
+    def __init__(self, path):
+        """
+        Opens the bundle read-only; pages are read from the file on demand, so
+        resident memory stays at sqlite's (small) page cache.
+        """
+        self.connection = sqlite3.connect(
+            f"file:{path}?mode=ro&immutable=1", uri=True, check_same_thread=False
+        )
+        self.connection.execute("PRAGMA cache_size = -256")  # KiB
+
+    def lookup(self, pokemon_id: str):
+        """
+        `(name, description)` by name or national pokedex number, KeyError if
+        the species is not in the bundle.
+        """
+        if pokemon_id.isdecimal():
+            query = "SELECT name, description FROM species WHERE number = ?"
+            parameter = int(pokemon_id)
+        else:
+            query = "SELECT name, description FROM species WHERE name = ?"
+            parameter = pokemon_id
+        row = self.connection.execute(query, (parameter,)).fetchone()
+        if row is None:
+            raise KeyError(pokemon_id)
+        return row
+
+
+def write_bundle(path, rows):
+    """
+    Writes `(number, name, description)` rows as a new bundle at `path`.
+    """
+    temporary = f"{path}.tmp"
+    if os.path.exists(temporary):
+        os.remove(temporary)
+    connection = sqlite3.connect(temporary)
+    with connection:
+        connection.execute(
+            "CREATE TABLE species ("
+            " number INTEGER PRIMARY KEY,"
+            " name TEXT NOT NULL UNIQUE,"
+            " description TEXT NOT NULL)"
+        )
+        connection.executemany("INSERT INTO species VALUES (?, ?, ?)", rows)
+    connection.execute("VACUUM")
+    connection.close()
+    os.replace(temporary, path)
+
+
+_BUNDLE = None
+
+
+def get_bundle():
+    """
+    The shipped bundle, None if there is none.
+    """
+    global _BUNDLE
+    if _BUNDLE is None and os.path.exists(BUNDLE_PATH):
+        _BUNDLE = Bundle(BUNDLE_PATH)
+    return _BUNDLE
+
+
+async def _fetch_all(index):
+    from . import pokedex
+
+    semaphore = asyncio.Semaphore(BUILD_CONCURRENCY)
+
+    async def fetch(number, name):
+        async with semaphore:
+            try:
+                _, description = await pokedex.fetch_pokemon_description_async(name)
+            except ValueError:  # no english entries
+                logger.warning("Skipping %s, no description available", name)
+                return None
+            return number, name, description
+
+    rows = await asyncio.gather(
+        *(fetch(number, name) for number, name in enumerate(index.names, 1))
+    )
+    return [row for row in rows if row is not None]
+
+
+def build(path, index_path=None):
+    from . import pokedex
+
+    if index_path:
+        index = pokedex.SpeciesIndex.load(index_path)
+    else:
+        index = pokedex.get_species_index()
+    rows = asyncio.run(_fetch_all(index))
+    write_bundle(path, rows)
+    return len(rows)
+
+
+if __name__ == "__main__":
+    path = sys.argv[1] if len(sys.argv) > 1 else BUNDLE_PATH
+    index_path = sys.argv[2] if len(sys.argv) > 2 else None
+    count = build(path, index_path)
+    print(f"{count} descriptions written to {path}")
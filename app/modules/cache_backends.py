@@ -0,0 +1,444 @@
+"""
+Persistence behind `dynamo_cache.Cache`. Backends store flat items, dicts
+with the `key`, the encoded `blob`, and the `ttl` and `fresh` timestamps;
+expired items are never returned.
+
+    dynamodb  shared by every lambda and container, a network round trip away
+    sqlite    a WAL file on the host, shared by the worker processes there
+"""
+from collections import OrderedDict
+from contextlib import nullcontext
+from functools import lru_cache
+from time import monotonic, sleep, time
+import logging
+import sqlite3
+import threading
+
+from . import deadline
+from .metrics import LazyMetrics
+
+BATCH_GET_SIZE = 100  # BatchGetItem limit
+BATCH_WRITE_SIZE = 25  # BatchWriteItem limit
+BATCH_RETRIES = 5
+SQLITE_BATCH_SIZE = 500  # under sqlite's 999 variables per statement
+SQLITE_PURGE_INTERVAL = 1000  # puts between deletes of expired rows
+
+metrics = LazyMetrics(global_tags=["dynamodb:cache"])
+logger = logging.getLogger(__name__)
+
+
+@lru_cache()
+def _dynamodb_resource():
+    """
+    Built on first use (not when functions get decorated), and shared by every
+    Cache for the life of the process, so warm invocations reuse it.
+    """
+    import boto3
+    from botocore.config import Config
+
+    # the request budget bounds waits further, this bounds each call
+    config = Config(
+        connect_timeout=deadline.DYNAMODB_TIMEOUT,
+        read_timeout=deadline.DYNAMODB_TIMEOUT,
+        retries={"max_attempts": 2},
+    )
+    return boto3.resource("dynamodb", config=config)
+
+
+class Backend:
+    tier = None  # tells backends apart in metrics
+
+    def get(self, key):
+        """
+        The item, None if there is none or it expired.
+        """
+        raise NotImplementedError
+
+    def get_many(self, keys) -> dict:
+        """
+        Dict key -> item, missing and expired keys are left out.
+        """
+        items = {}
+        for key in keys:
+            item = self.get(key)
+            if item is not None:
+                items[key] = item
+        return items
+
+    def put(self, item):
+        raise NotImplementedError
+
+    def put_many(self, items):
+        for item in items:
+            self.put(item)
+
+    def put_if(self, item, previous) -> bool:
+        """
+        Puts `item` only if the stored item's blob is still `previous` (None:
+        there is no item, or it expired). False if someone else wrote first.
+        """
+        raise NotImplementedError
+
+
+class DynamoDBBackend(Backend):
+    tier = "dynamodb"
+
+    def __init__(self, table_name, dynamodb=None):
+        self.table_name = table_name
+        self._dynamodb = dynamodb
+        self._table = None
+
+    @property
+    def dynamodb(self):
+        if self._dynamodb is None:
+            self._dynamodb = _dynamodb_resource()
+        return self._dynamodb
+
+    @dynamodb.setter
+    def dynamodb(self, dynamodb):
+        self._dynamodb = dynamodb
+
+    @property
+    def table(self):
+        if self._table is None:
+            self._table = self.dynamodb.Table(self.table_name)
+        return self._table
+
+    @table.setter
+    def table(self, table):
+        self._table = table
+
+    @staticmethod
+    def _live(item):
+        # dynamodb deletes expired items lazily, they can outlive their ttl
+        if item and float(item["ttl"]) > time():
+            return item
+        return None
+
+    def get(self, key):
+        return self._live(self.table.get_item(Key={"key": key}).get("Item"))
+
+    def get_many(self, keys):
+        """
+        One BatchGetItem per 100 keys, unprocessed keys are asked again.
+        """
+        keys = list(keys)
+        items = {}
+        for start in range(0, len(keys), BATCH_GET_SIZE):
+            deadline.check()
+            chunk = keys[start : start + BATCH_GET_SIZE]
+            request = {self.table.name: {"Keys": [{"key": key} for key in chunk]}}
+            for attempt in range(BATCH_RETRIES):
+                response = self.dynamodb.batch_get_item(RequestItems=request)
+                for item in response["Responses"].get(self.table.name, []):
+                    if self._live(item):
+                        items[item["key"]] = item
+                request = response.get("UnprocessedKeys")
+                if not request:
+                    break
+                sleep(0.05 * 2 ** attempt)
+        return items
+
+    def put(self, item):
+        return self.table.put_item(Item=item)
+
+    def put_if(self, item, previous):
+        from botocore.exceptions import ClientError
+
+        if previous is None:
+            condition = "attribute_not_exists(#key) OR #ttl <= :now"
+            values = {":now": int(time())}
+        else:
+            condition = "#blob = :previous"
+            values = {":previous": previous}
+        try:
+            self.table.put_item(
+                Item=item,
+                ConditionExpression=condition,
+                ExpressionAttributeNames={"#key": "key", "#ttl": "ttl", "#blob": "blob"},
+                ExpressionAttributeValues=values,
+            )
+        except ClientError as error:
+            if error.response["Error"]["Code"] == "ConditionalCheckFailedException":
+                return False
+            raise
+        return True
+
+    def put_many(self, items):
+        """
+        One BatchWriteItem per 25 items, unprocessed items are sent again
+        with backoff, within the request budget.
+        """
+        # a request can not hold two writes to the same key
+        items = list({item["key"]: item for item in items}.values())
+        for start in range(0, len(items), BATCH_WRITE_SIZE):
+            requests = [
+                {"PutRequest": {"Item": item}}
+                for item in items[start : start + BATCH_WRITE_SIZE]
+            ]
+            for attempt in range(BATCH_RETRIES):
+                deadline.check()
+                response = self.dynamodb.batch_write_item(
+                    RequestItems={self.table.name: requests}
+                )
+                requests = response.get("UnprocessedItems", {}).get(self.table.name)
+                if not requests:
+                    break
+                sleep(0.05 * 2 ** attempt)
+            else:
+                raise RuntimeError(f"{len(requests)} cache items left unprocessed")
+
+
+class SQLiteBackend(Backend):
+    tier = "sqlite"
+
+    def __init__(self, path, table_name="cache"):
+        """
+        One sqlite file in WAL mode: readers never block on the writer, so
+        every worker process on the host can share it. Each thread gets its
+        own connection.
+        """
+        self.path = path
+        self.table_name = '"%s"' % table_name.replace('"', '""')
+        self.local = threading.local()
+        self.puts = 0
+        self._connect()  # creates the table, and fails early on a bad path
+
+    def _connect(self):
+        connection = getattr(self.local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=deadline.DYNAMODB_TIMEOUT)
+            connection.execute("PRAGMA journal_mode = WAL")
+            connection.execute("PRAGMA synchronous = NORMAL")  # a cache, not a ledger
+            with connection:
+                connection.execute(
+                    f"CREATE TABLE IF NOT EXISTS {self.table_name} ("
+                    " key TEXT PRIMARY KEY,"
+                    " blob BLOB NOT NULL,"
+                    " ttl REAL NOT NULL,"
+                    " fresh REAL NOT NULL)"
+                )
+            self.local.connection = connection
+        return connection
+
+    def get(self, key):
+        row = (
+            self._connect()
+            .execute(
+                f"SELECT key, blob, ttl, fresh FROM {self.table_name}"
+                " WHERE key = ? AND ttl > ?",
+                (key, time()),
+            )
+            .fetchone()
+        )
+        return self._item(row) if row else None
+
+    def get_many(self, keys):
+        keys = list(keys)
+        connection = self._connect()
+        items = {}
+        for start in range(0, len(keys), SQLITE_BATCH_SIZE):
+            chunk = keys[start : start + SQLITE_BATCH_SIZE]
+            rows = connection.execute(
+                f"SELECT key, blob, ttl, fresh FROM {self.table_name}"
+                f" WHERE key IN ({', '.join('?' * len(chunk))}) AND ttl > ?",
+                (*chunk, time()),
+            )
+            for row in rows:
+                items[row[0]] = self._item(row)
+        return items
+
+    @staticmethod
+    def _item(row):
+        key, blob, ttl, fresh = row
+        return {"key": key, "blob": blob, "ttl": ttl, "fresh": fresh}
+
+    def put(self, item):
+        self.put_many([item])
+
+    def put_many(self, items):
+        rows = [
+            (item["key"], item["blob"], item["ttl"], item.get("fresh", item["ttl"]))
+            for item in items
+        ]
+        connection = self._connect()
+        with connection:  # one transaction, one fsync of the WAL
+            connection.executemany(
+                f"INSERT OR REPLACE INTO {self.table_name} VALUES (?, ?, ?, ?)", rows
+            )
+        self.puts += len(rows)
+        if self.puts >= SQLITE_PURGE_INTERVAL:
+            self.puts = 0
+            self.purge()
+
+    def put_if(self, item, previous):
+        row = (item["blob"], item["ttl"], item.get("fresh", item["ttl"]), item["key"])
+        connection = self._connect()
+        with connection:  # the delete takes the write lock until the commit
+            if previous is None:
+                connection.execute(
+                    f"DELETE FROM {self.table_name} WHERE key = ? AND ttl <= ?",
+                    (item["key"], time()),
+                )
+                cursor = connection.execute(
+                    f"INSERT OR IGNORE INTO {self.table_name} (blob, ttl, fresh, key)"
+                    " VALUES (?, ?, ?, ?)",
+                    row,
+                )
+            else:
+                cursor = connection.execute(
+                    f"UPDATE {self.table_name} SET blob = ?, ttl = ?, fresh = ?"
+                    " WHERE key = ? AND blob = ? AND ttl > ?",
+                    (*row, previous, time()),
+                )
+        return cursor.rowcount == 1
+
+    def purge(self):
+        """
+        Deletes the expired rows, reads skip them meanwhile.
+        """
+        connection = self._connect()
+        with connection:
+            connection.execute(f"DELETE FROM {self.table_name} WHERE ttl <= ?", (time(),))
+
+
+class WriteBehindBackend(Backend):
+    def __init__(self, backend, delay=1.0, max_items=1000):
+        """
+        Puts go to an in-process buffer, and reach `backend` in batches of
+        `BATCH_WRITE_SIZE`: from a background thread once a batch is full or
+        every `delay` seconds, and on `flush` (on lambda, frozen threads never
+        run, the invocation flushes when it ends). Puts to the same key are
+        coalesced, reads see the buffered ones. Failed batches are buffered
+        again; past `max_items` the oldest puts are dropped.
+        """
+        self.backend = backend
+        self.tier = backend.tier
+        self.delay = delay
+        self.max_items = max_items
+        self.buffer = OrderedDict()  # key -> (item, monotonic time buffered)
+        self.lock = threading.Lock()
+        self.flushing = threading.Lock()
+        self.wake = threading.Event()
+        self.worker = None
+
+    def __len__(self):
+        return len(self.buffer)
+
+    def _buffered(self, key):
+        with self.lock:
+            entry = self.buffer.get(key)
+        if entry is not None and float(entry[0]["ttl"]) > time():
+            return entry[0]
+        return None
+
+    def get(self, key):
+        item = self._buffered(key)
+        return item if item is not None else self.backend.get(key)
+
+    def get_many(self, keys):
+        keys = list(keys)
+        items = {}
+        for key in keys:
+            item = self._buffered(key)
+            if item is not None:
+                items[key] = item
+        missing = [key for key in keys if key not in items]
+        if missing:
+            items.update(self.backend.get_many(missing))
+        return items
+
+    def put(self, item):
+        self.put_many([item])
+
+    def put_many(self, items):
+        now = monotonic()
+        with self.lock:
+            for item in items:
+                entry = self.buffer.get(item["key"])
+                # a coalesced put waits as long as the one it replaces
+                self.buffer[item["key"]] = (item, entry[1] if entry else now)
+            self._trim()
+            full = len(self.buffer) >= BATCH_WRITE_SIZE
+            if self.worker is None:
+                self.worker = threading.Thread(target=self._run, daemon=True)
+                self.worker.start()
+        metrics.gauge("cache_write_buffer", len(self.buffer))
+        if full:
+            self.wake.set()
+
+    def put_if(self, item, previous):
+        # never buffered, the condition is checked against the backend's item
+        return self.backend.put_if(item, previous)
+
+    def _trim(self):
+        dropped = 0
+        while len(self.buffer) > self.max_items:
+            self.buffer.popitem(last=False)
+            dropped += 1
+        if dropped:
+            logger.warning("Cache write buffer full, dropped %s puts", dropped)
+            metrics.increment("cache_write_dropped", dropped)
+
+    def _run(self):
+        while True:
+            self.wake.wait(self.delay)
+            self.wake.clear()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Cache write-behind flush failed")
+
+    def _take(self):
+        with self.lock:
+            batch = []
+            while self.buffer and len(batch) < BATCH_WRITE_SIZE:
+                key = next(iter(self.buffer))
+                batch.append((key, self.buffer.pop(key)))
+        return batch
+
+    def _restore(self, batch):
+        with self.lock:
+            for key, entry in reversed(batch):
+                if key not in self.buffer:  # unless a newer put replaced it
+                    self.buffer[key] = entry
+                    self.buffer.move_to_end(key, last=False)
+            self._trim()
+
+    def flush(self, timeout=None):
+        """
+        Writes everything buffered, within `timeout` seconds if given. What
+        could not be written stays buffered. Returns the number of items
+        written.
+        """
+        written = 0
+        limit = deadline.budget(timeout) if timeout is not None else nullcontext()
+        with self.flushing, limit:
+            while True:
+                batch = self._take()
+                if not batch:
+                    break
+                try:
+                    self.backend.put_many([item for _, (item, _) in batch])
+                except Exception:
+                    self._restore(batch)
+                    raise
+                written += len(batch)
+                oldest = min(buffered for _, (_, buffered) in batch)
+                metrics.histogram("cache_flush_latency", (monotonic() - oldest) * 1e3)
+        metrics.gauge("cache_write_buffer", len(self.buffer))
+        return written
+
+
+def get_backend(name, table_name, path=None, write_behind=False) -> Backend:
+    """
+    `dynamodb` (the `table_name` table) or `sqlite` (the `table_name` table of
+    the file at `path`); buffered by a `WriteBehindBackend` if `write_behind`.
+    """
+    if name == "dynamodb":
+        backend = DynamoDBBackend(table_name)
+    elif name == "sqlite":
+        backend = SQLiteBackend(path, table_name)
+    else:
+        raise ValueError(f"Unknown cache backend `{name}`")
+    return WriteBehindBackend(backend) if write_behind else backend
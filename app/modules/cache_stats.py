@@ -0,0 +1,146 @@
+from collections import Counter
+from math import frexp
+import threading
+
+from .popularity import TopK
+
+
+class Histogram:
+    def __init__(self):
+        """
+        Counts per bucket, buckets grow by a factor of sqrt(2): constant memory
+        and constant time per value, percentiles within 19% of the truth.
+        """
+        self.buckets = Counter()
+        self.count = 0
+        self.total = 0.0
+        self.maximum = 0.0
+
+    @staticmethod
+    def _bucket(value):
+        if value <= 0:
+            return float("-inf")
+        mantissa, exponent = frexp(value)  # value = mantissa * 2 ** exponent
+        return 2 * exponent + (mantissa >= 0.7071)
+
+    @staticmethod
+    def _middle(bucket):
+        # bucket b spans [2 ** (b/2 - 1), 2 ** (b/2 - 0.5)), this is its
+        # geometric middle (0 for the bucket of zeros)
+        return 2 ** (bucket / 2 - 0.75)
+
+    def record(self, value):
+        self.buckets[self._bucket(value)] += 1
+        self.count += 1
+        self.total += value
+        self.maximum = max(self.maximum, value)
+
+    def percentile(self, percentile):
+        """
+        Middle of the bucket the percentile falls in, 0 without values.
+        """
+        if not self.count:
+            return 0.0
+        rank = percentile * self.count
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen >= rank:
+                return min(self._middle(bucket), self.maximum)
+        return self.maximum
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "mean": self.total / self.count if self.count else 0.0,
+            "p50": self.percentile(0.5),
+            "p95": self.percentile(0.95),
+            "p99": self.percentile(0.99),
+            "max": self.maximum,
+        }
+
+
+class CacheStats:
+    def __init__(self, hot_keys=20, sample=8):
+        """
+        Rolling statistics of one cache, since the last `reset`: hits and
+        misses per tier, item sizes (bytes), get and put latencies (ms), and
+        the `hot_keys` most requested keys (approximate: one request in
+        `sample` is counted, in a count-min sketch). Cheap enough to keep on,
+        about a microsecond per operation.
+        """
+        self.hot_keys = hot_keys
+        self.sample = sample
+        self.requests = 0
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.lookups = Counter()  # (event, tier)
+            self.sizes = Histogram()
+            self.get_latency = Histogram()
+            self.put_latency = Histogram()
+            self.hot = TopK(self.hot_keys)
+
+    def count(self, event, tier):
+        self.lookups[(event, tier)] += 1
+
+    def requested(self, key):
+        # hot keys are the ones that show up in a sample anyway
+        self.requests += 1
+        if self.requests % self.sample == 0:
+            self.hot.add(key, self.sample)
+
+    def got(self, seconds):
+        self.get_latency.record(seconds * 1e3)
+
+    def put(self, seconds):
+        self.put_latency.record(seconds * 1e3)
+
+    def stored(self, size):
+        self.sizes.record(size)
+
+    def hit_ratios(self):
+        """
+        Dict tier -> hits, misses, and the ratio of lookups that reached the
+        tier and were hits there.
+        """
+        tiers = {tier for _, tier in self.lookups if tier is not None}
+        ratios = {}
+        for tier in sorted(tiers):
+            hits = self.lookups[("cache_hit", tier)]
+            misses = self.lookups[("cache_miss", tier)]
+            ratios[tier] = {
+                "hits": hits,
+                "misses": misses,
+                "ratio": hits / (hits + misses) if hits + misses else 0.0,
+            }
+        return ratios
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                "tiers": self.hit_ratios(),
+                "item_size": self.sizes.summary(),
+                "get_latency": self.get_latency.summary(),
+                "put_latency": self.put_latency.summary(),
+                "hot_keys": self.hot.top(),
+            }
+
+    def publish(self, metrics, tags):
+        """
+        Sends the snapshot as gauges (tagged with `tags`), and starts over.
+        """
+        snapshot = self.snapshot()
+        for tier, ratio in snapshot["tiers"].items():
+            metrics.gauge("cache_hit_ratio", ratio["ratio"], tags=tags + [f"tier:{tier}"])
+        for name in ["item_size", "get_latency", "put_latency"]:
+            for statistic in ["p50", "p99", "max"]:
+                metrics.gauge(
+                    f"cache_{name}",
+                    snapshot[name][statistic],
+                    tags=tags + [f"statistic:{statistic}"],
+                )
+        self.reset()
+        return snapshot
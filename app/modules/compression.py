@@ -0,0 +1,243 @@
+"""
+Negotiated response compression, `br` (when the brotli package is there) or
+`gzip`, for textual bodies of at least MINIMUM_SIZE bytes; smaller ones cost
+more to inflate than they save on the wire.
+
+Compressed representations carry the weak form of the ETag, any `If-None-Match`
+check is a weak comparison anyway.
+"""
+from time import time
+from typing import Optional
+import os
+import zlib
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.responses import Response
+
+from .dynamo_cache import MemoryCache
+
+try:
+    import brotli
+except ImportError:  # gzip only
+    brotli = None
+
+MINIMUM_SIZE = int(os.environ.get("COMPRESSION_MINIMUM_SIZE", "512"))
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+# precompressed bodies are compressed once, they can afford the best levels
+PRECOMPRESSED_GZIP_LEVEL = 9
+PRECOMPRESSED_BROTLI_QUALITY = 11
+PRECOMPRESSED_TTL = 3600
+COMPRESSIBLE = (
+    "text/",
+    "application/json",
+    "application/x-ndjson",
+    "application/javascript",
+)
+ENCODINGS = ("br", "gzip") if brotli else ("gzip",)  # in order of preference
+
+PRECOMPRESSED = MemoryCache(max_items=1024, max_size=2 * 1024 * 1024)
+
+
+def negotiate(accept_encoding) -> Optional[str]:
+    """
+    The preferred encoding `Accept-Encoding` allows, None for the identity.
+    """
+    if not accept_encoding:
+        return None
+    weights = {}
+    for entry in accept_encoding.split(","):
+        coding, _, parameters = entry.strip().partition(";")
+        weight = 1.0
+        parameter, _, value = parameters.strip().partition("=")
+        if parameter.strip() == "q":
+            try:
+                weight = float(value)
+            except ValueError:
+                continue
+        weights[coding.strip().lower()] = weight
+    wildcard = weights.get("*", 0.0)
+    accepted = [
+        encoding for encoding in ENCODINGS if weights.get(encoding, wildcard) > 0
+    ]
+    if not accepted:
+        return None
+    return max(accepted, key=lambda encoding: weights.get(encoding, wildcard))
+
+
+def is_compressible(content_type) -> bool:
+    return bool(content_type) and content_type.startswith(COMPRESSIBLE)
+
+
+def compress(body: bytes, encoding: str, best=False) -> bytes:
+    if encoding == "br":
+        quality = PRECOMPRESSED_BROTLI_QUALITY if best else BROTLI_QUALITY
+        return brotli.compress(body, quality=quality)
+    level = PRECOMPRESSED_GZIP_LEVEL if best else GZIP_LEVEL
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    return compressor.compress(body) + compressor.flush()
+
+
+class StreamCompressor:
+    def __init__(self, encoding):
+        """
+        Compresses a body a chunk at a time, every chunk is flushed so what
+        was sent so far can be inflated without waiting for the rest.
+        """
+        self.encoding = encoding
+        if encoding == "br":
+            self.compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+        else:
+            self.compressor = zlib.compressobj(
+                GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS
+            )
+
+    def compress(self, chunk: bytes) -> bytes:
+        if self.encoding == "br":
+            return self.compressor.process(chunk) + self.compressor.flush()
+        return self.compressor.compress(chunk) + self.compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        if self.encoding == "br":
+            return self.compressor.finish()
+        return self.compressor.flush()
+
+
+def mark_encoded(headers: MutableHeaders, encoding, length=None):
+    """
+    Headers of a representation compressed in `encoding`, `length` bytes long
+    (unknown when streamed).
+    """
+    headers["content-encoding"] = encoding
+    if length is None:
+        if "content-length" in headers:
+            del headers["content-length"]
+    else:
+        headers["content-length"] = str(length)
+    headers.add_vary_header("Accept-Encoding")
+    etag = headers.get("etag")
+    if etag and not etag.startswith("W/"):
+        headers["etag"] = f"W/{etag}"
+
+
+def precompressed(key, body: bytes, encoding) -> bytes:
+    """
+    `body` compressed in `encoding`, done once per `key`: a key derived from
+    what the body is rendered from (its ETag) changes whenever the body does.
+    """
+    cache_key = f"{key}:{encoding}"
+    try:
+        return PRECOMPRESSED.get(cache_key)
+    except KeyError:
+        pass
+    encoded = compress(body, encoding, best=True)
+    PRECOMPRESSED.put(cache_key, encoded, time() + PRECOMPRESSED_TTL)
+    return encoded
+
+
+def represent(
+    headers: MutableHeaders, size: int, encoding, minimum_size=None
+) -> Optional[str]:
+    """
+    Sets the `Vary` (and, when encoded, weak ETag) of the representation a
+    body of `size` bytes goes out as, returns its encoding: None below the
+    size threshold, or without an encoding. No body is needed.
+    """
+    minimum_size = MINIMUM_SIZE if minimum_size is None else minimum_size
+    if size < minimum_size:
+        return None
+    if encoding is None:
+        headers.add_vary_header("Accept-Encoding")
+        return None
+    mark_encoded(headers, encoding)
+    return encoding
+
+
+def precompress(response, key, encoding, minimum_size=None):
+    """
+    Compresses a rendered `response` in `encoding` (as negotiated), reusing
+    the body compressed before for `key`. Left as is below the size
+    threshold, or without an encoding.
+    """
+    encoding = represent(response.headers, len(response.body), encoding, minimum_size)
+    if encoding is not None:
+        response.body = precompressed(key, response.body, encoding)
+        response.headers["content-length"] = str(len(response.body))
+    return response
+
+
+def not_modified(headers: MutableHeaders):
+    """
+    `304` standing for a `represent`ed body: same validators, caching headers
+    and `Vary`, no representation metadata.
+    """
+    headers = {
+        name: value for name, value in headers.items() if not name.startswith("content-")
+    }
+    return Response(status_code=304, headers=headers)
+
+
+class CompressionMiddleware:
+    def __init__(self, app, minimum_size=None):
+        """
+        ASGI middleware, compresses the textual responses of at least
+        `minimum_size` bytes (MINIMUM_SIZE by default) in the encoding the
+        client prefers. Streamed responses are compressed as they go.
+        Responses that already have a `Content-Encoding` are left alone.
+        """
+        self.app = app
+        self.minimum_size = MINIMUM_SIZE if minimum_size is None else minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        encoding = negotiate(Headers(scope=scope).get("accept-encoding"))
+        start = None
+        stream = None
+
+        async def send_compressed(message):
+            nonlocal start, stream
+            if message["type"] == "http.response.start":
+                headers = Headers(raw=message.get("headers", []))
+                if "content-encoding" in headers or not is_compressible(
+                    headers.get("content-type")
+                ):
+                    await send(message)
+                else:
+                    start = message  # held until the size is known
+                return
+            if message["type"] != "http.response.body" or start is None:
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more = message.get("more_body", False)
+            if stream is None:
+                headers = MutableHeaders(raw=list(start.get("headers", [])))
+                small = not more and len(body) < self.minimum_size
+                if small or encoding is None:
+                    if not small:
+                        headers.add_vary_header("Accept-Encoding")
+                    await send(dict(start, headers=headers.raw))
+                    await send(message)
+                    start = None
+                    return
+                if not more:
+                    body = compress(body, encoding)
+                    mark_encoded(headers, encoding, len(body))
+                    await send(dict(start, headers=headers.raw))
+                    await send(dict(message, body=body))
+                    start = None
+                    return
+                mark_encoded(headers, encoding)
+                await send(dict(start, headers=headers.raw))
+                stream = StreamCompressor(encoding)
+
+            body = stream.compress(body)
+            if not more:
+                body += stream.finish()
+            await send(dict(message, body=body, more_body=more))
+
+        await self.app(scope, receive, send_compressed)
@@ -0,0 +1,226 @@
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from time import monotonic, sleep
+import asyncio
+import os
+
+# seconds a request may take end to end, and per upstream hop
+REQUEST_BUDGET = float(os.environ.get("REQUEST_BUDGET", "10"))
+POKEAPI_TIMEOUT = float(os.environ.get("POKEAPI_TIMEOUT", "3"))
+TRANSLATION_TIMEOUT = float(os.environ.get("TRANSLATION_TIMEOUT", "5"))
+DYNAMODB_TIMEOUT = float(os.environ.get("DYNAMODB_TIMEOUT", "1"))
+
+# monotonic time the current request has to be answered by, None if unbounded
+_DEADLINE = ContextVar("deadline", default=None)
+# the deadline the server set around the request budget (lambda's invocation)
+_SERVER_DEADLINE = ContextVar("server_deadline", default=None)
+
+
+class DeadlineExceeded(TimeoutError):
+    outcome = "timeout"  # span outcome
+
+    def __init__(self):
+        super().__init__("Request budget exhausted waiting for upstream services")
+
+
+@contextmanager
+def budget(seconds):
+    """
+    Everything within (and the tasks it starts) has to finish in `seconds`,
+    or in what is left of an enclosing budget if that is less.
+    """
+    deadline = monotonic() + seconds
+    current = _DEADLINE.get()
+    if current is not None:
+        deadline = min(deadline, current)
+    token = _DEADLINE.set(deadline)
+    try:
+        yield
+    finally:
+        _DEADLINE.reset(token)
+
+
+def unbounded():
+    """
+    Drops the budget for the rest of the current context, for background
+    work that outlives the request that started it.
+    """
+    _DEADLINE.set(None)
+
+
+def lift_request_budget():
+    """
+    Drops the request budget for the rest of the current context, keeping
+    the deadline the server set around it; for responses that outlive a
+    single request budget, but not the Lambda invocation.
+    """
+    _DEADLINE.set(_SERVER_DEADLINE.get())
+
+
+def remaining():
+    """
+    Seconds left, None without a budget.
+    """
+    deadline = _DEADLINE.get()
+    if deadline is None:
+        return None
+    return deadline - monotonic()
+
+
+def check():
+    left = remaining()
+    if left is not None and left <= 0:
+        raise DeadlineExceeded()
+
+
+def timeout(default: float) -> float:
+    """
+    Timeout for the next hop: its own `default`, or what is left of the
+    budget if that is less. Raises `DeadlineExceeded` if nothing is left.
+    """
+    check()
+    left = remaining()
+    return default if left is None else min(default, left)
+
+
+def _is_timeout(error) -> bool:
+    # requests, httpx and botocore timeouts share no base class, but a name
+    return isinstance(error, (TimeoutError, asyncio.TimeoutError)) or any(
+        "Timeout" in cls.__name__ for cls in type(error).__mro__
+    )
+
+
+def is_transient(error) -> bool:
+    """
+    Worth trying again: timeouts, connection errors, and 5xx answers.
+    """
+    if isinstance(error, DeadlineExceeded):
+        return False
+    if _is_timeout(error):
+        return True
+    if any("Connect" in cls.__name__ for cls in type(error).__mro__):
+        return True
+    status_code = getattr(getattr(error, "response", None), "status_code", None)
+    return isinstance(status_code, int) and status_code >= 500
+
+
+@contextmanager
+def hop(default: float):
+    """
+    Yields the timeout for one upstream call, see `timeout`. If the call times
+    out because the budget ran out, it raises `DeadlineExceeded` instead.
+    """
+    seconds = timeout(default)
+    try:
+        yield seconds
+    except Exception as error:
+        if _is_timeout(error) and not isinstance(error, DeadlineExceeded):
+            left = remaining()
+            if left is not None and left <= 0.01:
+                raise DeadlineExceeded() from error
+        raise
+
+
+def retry(function, *args, attempts=3, backoff=0.05, **kwargs):
+    """
+    Calls `function` until it succeeds, at most `attempts` times, retrying
+    transient errors only, with exponential backoff; never sleeps past the
+    budget. Only for idempotent calls.
+    """
+    for attempt in range(attempts):
+        try:
+            return function(*args, **kwargs)
+        except Exception as error:
+            pause = backoff * 2 ** attempt
+            left = remaining()
+            if (
+                attempt + 1 == attempts
+                or not is_transient(error)
+                or (left is not None and left <= pause)
+            ):
+                raise
+            sleep(pause)
+
+
+class LatencyTracker:
+    def __init__(self, percentile=0.95, window=200, minimum=0.02, samples=20):
+        """
+        Recent latencies of one kind of call. `threshold` is the latency past
+        which a duplicate request is worth sending, None while there are not
+        `samples` yet.
+        """
+        self.percentile = percentile
+        self.minimum = minimum
+        self.samples = samples
+        self.latencies = deque(maxlen=window)
+
+    def record(self, seconds):
+        self.latencies.append(seconds)
+
+    def threshold(self):
+        if len(self.latencies) < self.samples:
+            return None
+        ordered = sorted(self.latencies)
+        return max(self.minimum, ordered[int(self.percentile * (len(ordered) - 1))])
+
+
+async def hedged(factory, tracker: LatencyTracker, attempts=2):
+    """
+    Awaits `factory()`, and starts a duplicate if it is slower than the
+    tracker's threshold, or a retry if it fails with a transient error; at
+    most `attempts` in total. The first success wins, the rest are
+    cancelled. Only for idempotent calls.
+    """
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    tasks = {asyncio.ensure_future(factory())}
+    launched = 1
+    try:
+        while True:
+            wait = tracker.threshold() if launched < attempts else None
+            left = remaining()
+            if left is not None:
+                if left <= 0:
+                    raise DeadlineExceeded()
+                wait = left if wait is None else min(wait, left)
+            done, tasks = await asyncio.wait(
+                tasks, timeout=wait, return_when=asyncio.FIRST_COMPLETED
+            )
+            for task in done:
+                error = task.exception()
+                if error is None:
+                    tracker.record(loop.time() - started)
+                    return task.result()
+                if tasks or (launched < attempts and is_transient(error)):
+                    continue  # another attempt is (or will be) in flight
+                raise error
+            if not done:
+                check()
+            if launched < attempts and (not done or not tasks):
+                tasks.add(asyncio.ensure_future(factory()))
+                launched += 1
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+class DeadlineMiddleware:
+    def __init__(self, app, seconds=None):
+        """
+        ASGI middleware, every request gets a budget of `seconds`
+        (REQUEST_BUDGET by default), within any the server already set.
+        """
+        self.app = app
+        self.seconds = REQUEST_BUDGET if seconds is None else seconds
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        token = _SERVER_DEADLINE.set(_DEADLINE.get())
+        try:
+            with budget(self.seconds):
+                await self.app(scope, receive, send)
+        finally:
+            _SERVER_DEADLINE.reset(token)
@@ -1,20 +1,36 @@
 #!/usr/bin/env python
 
+from collections import Counter, OrderedDict
+from contextlib import contextmanager
 from copy import copy
 from decimal import Decimal
 from functools import wraps, lru_cache
-from time import time
+from time import perf_counter, time
+import asyncio
+import contextvars
 import hashlib
 import json
 import logging
 import os
+import threading
+import zlib
 
-from doglessdata import DataDogMetrics
-import boto3
+import msgpack
 
-metrics = DataDogMetrics(global_tags=["dynamodb:cache"])
+from . import cache_backends, deadline, tracing
+from .cache_stats import CacheStats
+from .metrics import LazyMetrics
+
+metrics = LazyMetrics(global_tags=["dynamodb:cache"])
 logger = logging.getLogger(__name__)
 
+FORMAT_VERSION = 1
+COMPRESS_THRESHOLD = 512  # bytes, smaller values rarely shrink
+UPDATE_ATTEMPTS = 5  # conditional puts before an update gives up
+_RAW = 0
+_ZLIB = 1
+_EXT_TUPLE = 1
+
 
 def format_dynamo_record(raw_record):
     """
@@ -43,92 +59,750 @@ def format_dynamo_record(raw_record):
         )
     return record
 
-def _hash_args(args):
-    try:
-        hash(args)
-        return args
-    except TypeError:
-        try:
-            ahash = hashlib.sha1(args).hexdigest()
-            return ahash
-        except TypeError:
-            values = tuple((_hash_args(arg) for arg in args))
-            return values
-
-
-def _hash_kwargs(kwargs):
-    try:
-        hash(kwargs)
-        return kwargs
-    except TypeError:
-        try:
-            ahash = hashlib.sha1(kwargs).hexdigest()
-            return ahash
-        except TypeError:
-            values = tuple((_hash_args(kwarg) for kwarg in kwargs))
-            return values
+def _pack_default(value):
+    if isinstance(value, tuple):
+        return msgpack.ExtType(_EXT_TUPLE, _packb(list(value)))
+    raise TypeError(f"{type(value)} not suported")
+
+
+def _ext_hook(code, data):
+    if code == _EXT_TUPLE:
+        return tuple(_unpackb(data))
+    return msgpack.ExtType(code, data)
+
+
+def _packb(value):
+    # strict_types, so tuples reach _pack_default instead of becoming lists
+    return msgpack.packb(
+        value, default=_pack_default, strict_types=True, use_bin_type=True
+    )
+
+
+def _unpackb(data):
+    return msgpack.unpackb(
+        data, ext_hook=_ext_hook, raw=False, strict_map_key=False
+    )
+
+
+def encode_value(value, compress_threshold=COMPRESS_THRESHOLD):
+    """
+    Compact binary encoding for cached values: a version byte, a codec byte,
+    and the msgpack payload; zlib compressed when it is above the threshold
+    and compression pays off. Tuples round-trip as tuples.
+    """
+    payload = _packb(value)
+    codec = _RAW
+    if len(payload) >= compress_threshold:
+        compressed = zlib.compress(payload, 6)
+        if len(compressed) < len(payload):
+            payload = compressed
+            codec = _ZLIB
+    return bytes((FORMAT_VERSION, codec)) + payload
+
+
+def decode_value(serialized):
+    """
+    Inverse of `encode_value`, also reads the legacy json strings.
+    """
+    if isinstance(serialized, str):
+        return json.loads(serialized)
+    serialized = bytes(serialized)
+    version, codec = serialized[0], serialized[1]
+    if version != FORMAT_VERSION:
+        raise ValueError(f"Unknown cache value format {version}")
+    payload = serialized[2:]
+    if codec == _ZLIB:
+        payload = zlib.decompress(payload)
+    return _unpackb(payload)
+
+
+def _canonical(value):
+    if isinstance(value, (bytes, bytearray)):
+        return {"bytes": bytes(value).hex()}
+    if isinstance(value, (set, frozenset)):
+        return sorted(value, key=make_hasheable)
+    raise TypeError(f"{type(value)} can not be part of a cache key")
+
+
+def make_hasheable(*values):
+    """
+    Canonical text of the values: equal for equal values in any process
+    (dicts in any order, kwargs with their values), unlike `str` or `hash`.
+    """
+    return json.dumps(
+        values,
+        sort_keys=True,
+        separators=(",", ":"),
+        ensure_ascii=False,
+        default=_canonical,
+    )
 
 
-def make_hasheable(args, kwargs):
+def function_key(function, args, kwargs):
     """
-    Not all Python objects are good candidates for table keys.
-    This ensures the hash of the object is stable.
+    Key of a call, by the function's qualified name and its arguments; so
+    functions that share a cache never share entries.
     """
-    hasheable_args = _hash_args(args)
-    hasheable_kwargs = _hash_kwargs(kwargs)
-    return str((hasheable_args, hasheable_kwargs))
+    return f"{function.__module__}.{function.__qualname__}:{make_hasheable(args, kwargs)}"
+
+
+def digest_key(namespace, version, key):
+    """
+    `namespace:vVERSION:digest`, 32 hex characters of digest whatever the
+    length of the key; digests spread evenly over the table's partitions.
+    """
+    digest = hashlib.blake2b(key.encode("utf-8"), digest_size=16).hexdigest()
+    return f"{namespace}:v{version}:{digest}"
+
+
+class MemoryCache:
+    def __init__(self, *, max_items=512, max_size=4 * 1024 * 1024):
+        """
+        Bounded in-process LRU, the first layer in front of the backend.
+
+        Entries are kept serialized (their length is the accounted size), and
+        expire at the same timestamp as the backend item they mirror.
+        """
+        self.max_items = max_items
+        self.max_size = max_size
+        self.size = 0
+        self.items = OrderedDict()
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.items)
+
+    def get(self, key):
+        return self.lookup(key)[0]
+
+    def lookup(self, key):
+        """
+        `(serialized, fresh)` for the key, `fresh` is the timestamp the entry
+        goes stale at.
+        """
+        with self.lock:
+            serialized, expires, fresh = self.items[key]
+            if expires <= time():
+                self._drop(key)
+                raise KeyError("Item expired")
+            self.items.move_to_end(key)
+        return serialized, fresh
+
+    def put(self, key, serialized, expires, fresh=None):
+        if len(serialized) > self.max_size:
+            return
+        if fresh is None:
+            fresh = expires
+        with self.lock:
+            if key in self.items:
+                self._drop(key)
+            self.items[key] = (serialized, expires, fresh)
+            self.size += len(serialized)
+            while len(self.items) > self.max_items or self.size > self.max_size:
+                self._drop(next(iter(self.items)))
+
+    def clear(self):
+        with self.lock:
+            self.items.clear()
+            self.size = 0
+
+    def _drop(self, key):
+        serialized, _, _ = self.items.pop(key)
+        self.size -= len(serialized)
+
+
+def _in_executor(function, *args):
+    """
+    Runs `function` in the default executor within a copy of the caller's
+    context, `run_in_executor` alone does not carry it: backends check the
+    request's deadline budget.
+    """
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    return loop.run_in_executor(None, context.run, function, *args)
+
+
+class SingleFlight:
+    def __init__(self):
+        """
+        Merges concurrent calls that share a key into a single execution, every
+        caller gets the same result, or the same exception.
+
+        Works for threads (`do`) and for asyncio tasks (`ado`). A task whose
+        call is cancelled leaves it to one of the tasks waiting on it.
+        """
+        self.lock = threading.Lock()
+        self.calls = {}
+        self.futures = {}
+        self.coalesced = 0
+
+    def _coalesced(self):
+        self.coalesced += 1
+        metrics.increment("cache_coalesced")
+
+    def do(self, key, function, *args, **kwargs):
+        with self.lock:
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = self.calls[key] = {"done": threading.Event()}
+        if not leader:
+            self._coalesced()
+            call["done"].wait()
+            if "error" in call:
+                raise call["error"]
+            return call["result"]
+
+        try:
+            call["result"] = function(*args, **kwargs)
+            return call["result"]
+        except BaseException as error:
+            call["error"] = error
+            raise
+        finally:
+            with self.lock:
+                del self.calls[key]
+            call["done"].set()
+
+    async def ado(self, key, function, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        flight = (loop, key)
+        future = self.futures.get(flight)
+        if future is not None:
+            self._coalesced()
+        while future is not None:
+            try:
+                return await asyncio.shield(future)
+            except asyncio.CancelledError:
+                if not future.cancelled():
+                    raise  # this caller was cancelled, not the call
+            future = self.futures.get(flight)  # another follower took over
+
+        future = self.futures[flight] = loop.create_future()
+        try:
+            result = await function(*args, **kwargs)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as error:
+            future.set_exception(error)
+            future.exception()  # retrieved, waiters (if any) will re-raise it
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            del self.futures[flight]
 
 
 class Cache:
-    def __init__(self, *, table_name=None, ttl=3600, dummy=False):
+    def __init__(
+        self,
+        *,
+        table_name=None,
+        ttl=3600,
+        soft_ttl=None,
+        dummy=False,
+        key=None,
+        name=None,
+        memory_items=512,
+        memory_size=4 * 1024 * 1024,
+        backend=None,
+        namespace=None,
+        version=1,
+    ):
         """
-        Simple cache that uses in-memory and dynamodb as persisntence layers.
+        Simple cache that uses in-memory and a `cache_backends.Backend` as
+        persisntence layers, the `table_name` dynamodb table by default.
+
+        `key`, if given, is called with the decorated function's arguments and
+        returns the key, instead of deriving it from the function's name and
+        arguments. Keys are stored as digests within `namespace` (`name` by
+        default) and `version`: bumping the version leaves every entry of the
+        namespace behind at once, to expire by ttl, no scan needed.
+
+        With a `soft_ttl` (shorter than `ttl`), entries older than it are
+        still returned, and the decorated function refreshes them in the
+        background; a failed refresh keeps the stale value until `ttl`.
+
+        `name` tells caches apart in traces.
         """
         self.ttl = ttl
-        self.table = boto3.resource("dynamodb").Table(table_name)
+        self.soft_ttl = soft_ttl
+        self.key = key
+        self.name = name
+        self.namespace = namespace or name or "cache"
+        self.version = version
+        self.table_name = table_name
+        if backend is None:
+            backend = cache_backends.DynamoDBBackend(table_name)
+        self.backend = backend
         self.dummy = dummy
+        self.memory = MemoryCache(max_items=memory_items, max_size=memory_size)
+        self.counters = Counter()
+        self.flight = SingleFlight()
+        self.refreshing = set()
+        self.refreshing_lock = threading.Lock()
+        self.tasks = set()
+        # table reads are hedged past their p95
+        self.latency = deadline.LatencyTracker()
+        self.stats = CacheStats()
 
-    @metrics.timeit
-    def get(self, key):
+    def _count(self, event, tier=None):
+        self.counters[(event, tier)] += 1
+        self.stats.count(event, tier)
+        if tier is None:
+            metrics.increment(event)
+        else:
+            metrics.increment(event, tags=[f"tier:{tier}"])
+
+    def _get_memory(self, key):
+        try:
+            value, fresh = self.memory.lookup(key)
+        except KeyError:
+            self._count("cache_miss", "memory")
+            raise
+        self._count("cache_hit", "memory")
+        return decode_value(value), fresh
+
+    def _get_memory_many(self, keys):
+        values = {}
+        for key in keys:
+            try:
+                values[key] = self._get_memory(key)
+            except KeyError:
+                pass
+        return values
+
+    def _read_item(self, key):
+        return self.backend.get(key)
+
+    def _get_table(self, key):
+        deadline.check()
+        item = deadline.retry(self._read_item, key)
+        return self._decode_item(key, item)
+
+    def _get_table_many(self, keys):
+        keys = list(keys)
+        items = self.backend.get_many(keys)
+        values = {}
+        for key in keys:
+            try:
+                values[key] = self._decode_item(key, items.get(key))
+            except KeyError:
+                pass
+        return values
+
+    def _decode_item(self, key, item):
+        """
+        `(value, fresh)` of a backend item.
+        """
+        if item:
+            self._count("cache_hit", self.backend.tier)
+            if "blob" in item:
+                value = bytes(item["blob"])
+            else:
+                value = item["value"]  # json, written before FORMAT_VERSION 1
+            expires = float(item["ttl"])
+            fresh = float(item.get("fresh", expires))
+            self.memory.put(key, value, expires, fresh)
+            value = decode_value(value)
+            return value, fresh
+        else:
+            self._count("cache_miss", self.backend.tier)
+            raise KeyError("Item not found")
+
+    def _put_table(self, item):
+        return self.backend.put(item)
+
+    def _put_table_many(self, items):
+        self.backend.put_many(items)
+
+    def _prepare_put(self, key, value):
+        item = self._make_item(key, value)
+        self.memory.put(key, item["blob"], item["ttl"], item["fresh"])
+        return item
+
+    def _make_item(self, key, value):
+        blob = encode_value(value)
+        self.stats.stored(len(blob))
+        now = time()
+        ttl = int(now + self.ttl)
+        fresh = int(now + self.soft_ttl) if self.soft_ttl else ttl
+        # flat item of plain types: no format_dynamo_record pass needed
+        return {
+            "key": key,
+            "blob": blob,
+            "ttl": ttl,
+            "fresh": fresh,
+        }
+
+    def _lookup_tiers(self, key):
         if self.dummy:
             logger.debug("Dummy get")
             raise KeyError("Item not found")
-        response = self.table.get_item(Key={"key": key})
-        item = response.get("Item")
-        if item:
-            metrics.increment("cache_hit")
-            value = item["Value"]
-            value = json.loads(value)
-            return value
-        else:
-            metrics.increment("cache_miss")
+        try:
+            return self._get_memory(key)
+        except KeyError:
+            return self._get_table(key)
+
+    async def _alookup_tiers(self, key):
+        if self.dummy:
+            logger.debug("Dummy get")
             raise KeyError("Item not found")
+        try:
+            return self._get_memory(key)
+        except KeyError:
+            item = await deadline.hedged(
+                lambda: _in_executor(self._read_item, key), self.latency
+            )
+            return self._decode_item(key, item)
+
+    def _lookup(self, key):
+        start = perf_counter()
+        with tracing.span("cache_get", self.name) as current:
+            try:
+                entry = self._lookup_tiers(key)
+            except KeyError:
+                current.outcome = "miss"
+                raise
+            finally:
+                self.stats.got(perf_counter() - start)
+            current.outcome = "hit" if entry[1] > time() else "stale"
+            return entry
+
+    async def _alookup(self, key):
+        start = perf_counter()
+        with tracing.span("cache_get", self.name) as current:
+            try:
+                entry = await self._alookup_tiers(key)
+            except KeyError:
+                current.outcome = "miss"
+                raise
+            finally:
+                self.stats.got(perf_counter() - start)
+            current.outcome = "hit" if entry[1] > time() else "stale"
+            return entry
+
+    def _lookup_many(self, keys):
+        if self.dummy:
+            logger.debug("Dummy get")
+            return {}
+        start = perf_counter()
+        entries = self._get_memory_many(keys)
+        missing = [key for key in keys if key not in entries]
+        if missing:
+            entries.update(self._get_table_many(missing))
+        self.stats.got(perf_counter() - start)
+        return entries
+
+    async def _alookup_many(self, keys):
+        if self.dummy:
+            logger.debug("Dummy get")
+            return {}
+        start = perf_counter()
+        entries = self._get_memory_many(keys)
+        missing = [key for key in keys if key not in entries]
+        if missing:
+            found = await _in_executor(self._get_table_many, missing)
+            entries.update(found)
+        self.stats.got(perf_counter() - start)
+        return entries
+
+    @contextmanager
+    def _put_span(self):
+        """
+        The `cache_put` span, its latency also goes to the stats.
+        """
+        start = perf_counter()
+        with tracing.span("cache_put", self.name):
+            yield
+        self.stats.put(perf_counter() - start)
+
+    def _request(self, key):
+        """
+        Item key of a key requested by a caller, counted for the hot keys.
+        """
+        self.stats.requested(key)
+        return self.item_key(key)
+
+    def publish_stats(self):
+        """
+        Sends the rolling statistics as gauges tagged by namespace, returns
+        them, and starts a new window.
+        """
+        return self.stats.publish(metrics, [f"namespace:{self.namespace}"])
+
+    def item_key(self, key):
+        """
+        The key entries are stored under, for a key of this cache.
+        """
+        return digest_key(self.namespace, self.version, key)
+
+    def get(self, key):
+        value, _ = self._lookup(self._request(key))
+        return value
 
-    @metrics.timeit
     def put(self, key, value):
-        value = json.dumps(value)
+        return self._store(self.item_key(key), value)
+
+    def _store(self, key, value):
         if self.dummy:
             logger.debug("Dummy put")
             return False
-        ttl = time() + self.ttl
-        item = {
-            "key": key,
-            "value": value,
-            "ttl": ttl,
+        with self._put_span():
+            item = self._prepare_put(key, value)
+            return self._put_table(item)
+
+    def update(self, key, function, attempts=UPDATE_ATTEMPTS):
+        """
+        Stores `function(value)`, for the value stored in the backend (None if
+        there is none), unless someone else stores one in between: then it is
+        read and `function` called again, up to `attempts` times. Returns what
+        was stored. For values shared (and updated) by every process.
+        """
+        key = self.item_key(key)
+        if self.dummy:
+            logger.debug("Dummy update")
+            return function(None)
+        for _ in range(attempts):
+            deadline.check()
+            item = self.backend.get(key)
+            previous = bytes(item["blob"]) if item else None
+            value = function(None if previous is None else decode_value(previous))
+            with self._put_span():
+                updated = self._make_item(key, value)
+                if self.backend.put_if(updated, previous):
+                    self.memory.put(key, updated["blob"], updated["ttl"], updated["fresh"])
+                    return value
+            metrics.increment("cache_update_conflict")
+        raise RuntimeError(f"`{key}` could not be updated, every attempt conflicted")
+
+    async def aget(self, key):
+        """
+        Async `get`, memory hits are served without leaving the event loop.
+        """
+        value, _ = await self._alookup(self._request(key))
+        return value
+
+    async def aput(self, key, value):
+        return await self._astore(self.item_key(key), value)
+
+    async def _astore(self, key, value):
+        if self.dummy:
+            logger.debug("Dummy put")
+            return False
+        with self._put_span():
+            item = self._prepare_put(key, value)
+            return await _in_executor(self._put_table, item)
+
+    def freshness(self, key):
+        """
+        Seconds until the entry goes stale (negative once it has), `KeyError`
+        if there is none. Peeking at the memory tier is not counted as a hit.
+        """
+        key = self.item_key(key)
+        try:
+            _, fresh = self.memory.lookup(key)
+        except KeyError:
+            _, fresh = self._lookup_tiers(key)
+        return fresh - time()
+
+    async def afreshness(self, key):
+        key = self.item_key(key)
+        try:
+            _, fresh = self.memory.lookup(key)
+        except KeyError:
+            _, fresh = await self._alookup_tiers(key)
+        return fresh - time()
+
+    def warm(self, function, *args, **kwargs):
+        """
+        Calls `function` and stores the result, cached or not; for warmers
+        that refresh entries before they go stale.
+        """
+        key = self._make_key(function, args, kwargs)
+        return self.flight.do(key, self._fill, key, function, args, kwargs)
+
+    def get_many(self, keys):
+        """
+        Cached values for the given keys (missing keys are left out), the keys
+        that are not in memory are read in batches (one BatchGetItem per 100
+        keys on dynamodb).
+        """
+        keys = {self._request(key): key for key in keys}
+        entries = self._lookup_many(list(keys))
+        return {keys[key]: value for key, (value, _) in entries.items()}
+
+    def put_many(self, values):
+        if self.dummy:
+            logger.debug("Dummy put")
+            return False
+        with self._put_span():
+            items = [
+                self._prepare_put(self.item_key(key), value)
+                for key, value in values.items()
+            ]
+            if items:
+                self._put_table_many(items)
+        return True
+
+    async def aget_many(self, keys):
+        keys = {self._request(key): key for key in keys}
+        entries = await self._alookup_many(list(keys))
+        return {keys[key]: value for key, (value, _) in entries.items()}
+
+    async def aput_many(self, values):
+        return await self._astore_many(
+            {self.item_key(key): value for key, value in values.items()}
+        )
+
+    async def _astore_many(self, values):
+        if self.dummy:
+            logger.debug("Dummy put")
+            return False
+        with self._put_span():
+            items = [self._prepare_put(key, value) for key, value in values.items()]
+            if items:
+                await _in_executor(self._put_table_many, items)
+        return True
+
+    async def amany(self, function, arguments, concurrency=8):
+        """
+        Calls the async `function` once per argument, through the cache.
+
+        Cached results are read in bulk, misses are computed concurrently (at
+        most `concurrency` at once) and written back in bulk. Returns a dict
+        argument -> result, or the exception raised for that argument.
+        """
+        arguments = list(dict.fromkeys(arguments))
+        keys = {
+            argument: self._make_key(function, (argument,), {}) for argument in arguments
         }
-        item = format_dynamo_record(item)
-        return self.table.put_item(Item=item)
+        cached = await self._alookup_many(list(dict.fromkeys(keys.values())))
+        now = time()
+        for argument in arguments:
+            entry = cached.get(keys[argument])
+            if entry is not None and entry[1] <= now:
+                self._arefresh(keys[argument], function, (argument,), {})
+        misses = [argument for argument in arguments if keys[argument] not in cached]
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def compute(argument):
+            async with semaphore:
+                return await self.flight.ado(keys[argument], function, argument)
+
+        computed = await asyncio.gather(
+            *(compute(argument) for argument in misses), return_exceptions=True
+        )
+        computed = dict(zip(misses, computed))
+        await self._astore_many(
+            {
+                keys[argument]: result
+                for argument, result in computed.items()
+                if not isinstance(result, BaseException)
+            }
+        )
+        return {
+            argument: cached[keys[argument]][0]
+            if keys[argument] in cached
+            else computed[argument]
+            for argument in arguments
+        }
+
+    def _fill(self, key, function, args, kwargs):
+        result = function(*args, **kwargs)
+        self._store(key, result)
+        return result
+
+    async def _afill(self, key, function, args, kwargs):
+        result = await function(*args, **kwargs)
+        await self._astore(key, result)
+        return result
+
+    def _claim_refresh(self, key):
+        with self.refreshing_lock:
+            if key in self.refreshing:
+                return False
+            self.refreshing.add(key)
+        self._count("cache_stale")
+        return True
+
+    def _refresh(self, key, function, args, kwargs):
+        """
+        Recomputes a stale entry in a background thread, one refresh per key at
+        a time. On Lambda the thread is frozen with the invocation, and resumes
+        with the next one.
+        """
+        if not self._claim_refresh(key):
+            return
+
+        def refresh():
+            try:
+                self._fill(key, function, args, kwargs)
+            except Exception:
+                logger.exception("Refresh failed, keeping stale value")
+                self._count("cache_refresh_error")
+            finally:
+                self.refreshing.discard(key)
+
+        threading.Thread(target=refresh, daemon=True).start()
+
+    def _arefresh(self, key, function, args, kwargs):
+        if not self._claim_refresh(key):
+            return
+
+        async def refresh():
+            deadline.unbounded()  # outlives the request that found it stale
+            try:
+                await self._afill(key, function, args, kwargs)
+            except Exception:
+                logger.exception("Refresh failed, keeping stale value")
+                self._count("cache_refresh_error")
+            finally:
+                self.refreshing.discard(key)
+
+        task = asyncio.get_running_loop().create_task(refresh())
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    def _make_key(self, function, args, kwargs):
+        if self.key is not None:
+            return self._request(self.key(*args, **kwargs))
+        return self._request(function_key(function, args, kwargs))
 
     @lru_cache()
     def __call__(self, function):
+        if asyncio.iscoroutinefunction(function):
+
+            @wraps(function)
+            async def awrapped(*args, **kwargs):
+                hasheable = self._make_key(function, args, kwargs)
+                try:
+                    result, fresh = await self._alookup(hasheable)
+                except KeyError:
+                    result = await self.flight.ado(
+                        hasheable, self._afill, hasheable, function, args, kwargs
+                    )
+                else:
+                    if fresh <= time():
+                        self._arefresh(hasheable, function, args, kwargs)
+                return result
+
+            return awrapped
+
         @wraps(function)
         def wrapped(*args, **kwargs):
-            hasheable = make_hasheable(args, kwargs)
+            hasheable = self._make_key(function, args, kwargs)
             try:
-                result = self.get(hasheable)
+                result, fresh = self._lookup(hasheable)
             except KeyError:
-                result = function(*args, **kwargs)
-                self.put(hasheable, result)
+                result = self.flight.do(
+                    hasheable, self._fill, hasheable, function, args, kwargs
+                )
+            else:
+                if fresh <= time():
+                    self._refresh(hasheable, function, args, kwargs)
             return result
 
         return wrapped
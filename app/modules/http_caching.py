@@ -0,0 +1,45 @@
+import hashlib
+import os
+
+# max-age when the remaining cache ttl is unknown (nothing cached, or DUMMY)
+DEFAULT_MAX_AGE = int(os.environ.get("HTTP_MAX_AGE", "3600"))
+# unknown pokemon stay unknown until the species index changes
+NOT_FOUND_MAX_AGE = int(os.environ.get("HTTP_NOT_FOUND_MAX_AGE", str(24*60*60)))
+
+
+def etag(*parts) -> str:
+    """
+    Strong validator for a representation, derived from what it is rendered
+    from; so it is stable across processes and deployments.
+    """
+    digest = hashlib.sha256("\x1f".join(map(str, parts)).encode("utf-8"))
+    return f'"{digest.hexdigest()[:32]}"'
+
+
+def not_modified(if_none_match, current: str) -> bool:
+    """
+    `If-None-Match` check, with the weak comparison the RFC asks for.
+    """
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    candidates = (tag.strip() for tag in if_none_match.split(","))
+    return current in (tag[2:] if tag.startswith("W/") else tag for tag in candidates)
+
+
+def cache_control(max_age) -> str:
+    """
+    `Cache-Control` for `max_age` seconds, `no-cache` (revalidate every time)
+    when it is not positive.
+    """
+    if max_age is None:
+        max_age = DEFAULT_MAX_AGE
+    max_age = int(max_age)
+    if max_age <= 0:
+        return "public, no-cache"
+    return f"public, max-age={max_age}"
+
+
+def caching_headers(current: str, max_age) -> dict:
+    return {"ETag": current, "Cache-Control": cache_control(max_age)}
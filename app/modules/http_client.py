@@ -0,0 +1,31 @@
+import asyncio
+import weakref
+
+_CLIENTS = weakref.WeakKeyDictionary()
+
+
+def get_client():
+    """
+    Shared async client, keeps keep-alive connections pooled between requests.
+
+    Connections are bound to the event loop that opened them, so there is one
+    client per running loop. httpx is imported with the first client.
+    """
+    loop = asyncio.get_running_loop()
+    client = _CLIENTS.get(loop)
+    if client is None:
+        import httpx
+
+        client = httpx.AsyncClient(
+            timeout=httpx.Timeout(10.0, connect=3.0),
+            limits=httpx.Limits(max_connections=20, max_keepalive_connections=10),
+        )
+        _CLIENTS[loop] = client
+    return client
+
+
+async def close_client():
+    loop = asyncio.get_running_loop()
+    client = _CLIENTS.pop(loop, None)
+    if client is not None:
+        await client.aclose()
@@ -0,0 +1,34 @@
+from functools import wraps
+
+
+class LazyMetrics:
+    def __init__(self, **kwargs):
+        """
+        Stands in for `doglessdata.DataDogMetrics`, which is only imported and
+        built when the first metric is sent, instead of at import time.
+        """
+        self.kwargs = kwargs
+        self._client = None
+
+    @property
+    def client(self):
+        if self._client is None:
+            from doglessdata import DataDogMetrics
+
+            self._client = DataDogMetrics(**self.kwargs)
+        return self._client
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
+
+    def timeit(self, function):
+        timed = None
+
+        @wraps(function)
+        def wrapped(*args, **kwargs):
+            nonlocal timed
+            if timed is None:
+                timed = self.client.timeit(function)
+            return timed(*args, **kwargs)
+
+        return wrapped
@@ -1,10 +1,18 @@
+from time import time
+import logging
+import os
 import re
+import sys
 
-import pokepy
+from . import bundle, deadline, http_client, shakespeare, tracing
+from .dynamo_cache import SingleFlight
 
-from . import shakespeare
-
-POKEDEX = pokepy.V2Client()
+POKEAPI_URL = os.environ.get("POKEAPI_URL", "https://pokeapi.co/api/v2")
+SPECIES_LIST_URL = f"{POKEAPI_URL}/pokemon-species/?limit=100000"
+SPECIES_CHUNK_SIZE = 16 * 1024
+SPECIES_INDEX_PATH = os.environ.get(
+    "SPECIES_INDEX", os.path.join(os.path.dirname(__file__), "species.txt")
+)
 TRANSFORMS = [
     (re.compile(r"\n"), r" "),
     (re.compile(r"\f"), r" "),
@@ -12,8 +20,71 @@ TRANSFORMS = [
 ]
 
 
+logger = logging.getLogger(__name__)
+# species lookups are hedged past their p95
+POKEAPI_LATENCY = deadline.LatencyTracker()
+
+
 class PokemonNotFoundError(ValueError):
-    pass
+    outcome = "not_found"  # span outcome
+
+
+class DescriptionNotFoundError(PokemonNotFoundError):
+    """
+    The species exists, but pokeapi has no english description for it.
+    """
+
+    def __init__(self, name=None):
+        super().__init__(
+            f"`{name or 'species'}` has no english description in national "
+            "pokedex, send a field report if this is a mistake."
+        )
+
+
+class SpeciesIndex:
+    def __init__(self, names):
+        """
+        National pokedex number <-> name index, `names` are in pokedex order.
+        """
+        self.names = tuple(names)
+        self.numbers = {name: number for number, name in enumerate(self.names, 1)}
+
+    def __len__(self):
+        return len(self.names)
+
+    @classmethod
+    def from_species_list(cls, payload):
+        """
+        Builds the index from pokeapi's `pokemon-species` list resource.
+        """
+        numbered = {
+            int(species["url"].rstrip("/").rsplit("/", 1)[-1]): species["name"]
+            for species in payload["results"]
+        }
+        return cls(numbered[number] for number in sorted(numbered))
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as species:
+            return cls(line.strip() for line in species if line.strip())
+
+    def dump(self, path):
+        with open(path, "w") as species:
+            species.writelines(f"{name}\n" for name in self.names)
+
+    def resolve(self, pokemon_id: str) -> str:
+        """
+        Canonical key (the species name) for a name or a national pokedex
+        number, zero padded or not.
+        """
+        identifier = pokemon_id.strip().lower()
+        if identifier.isdecimal():
+            number = int(identifier)
+            if 0 < number <= len(self.names):
+                return self.names[number - 1]
+        elif identifier in self.numbers:
+            return identifier
+        raise _not_found(pokemon_id)
 
 
 def _clean_description(description: str) -> str:
@@ -31,27 +102,249 @@ def _clean_description(description: str) -> str:
     return description
 
 
+def _not_found(pokemon_id: str) -> PokemonNotFoundError:
+    return PokemonNotFoundError(
+        f"`{pokemon_id}` could not be found in national pokedex, send "
+        "a live specimen if this is a mistake."
+    )
+
+
+_SPECIES_INDEX = None
+_SPECIES_INDEX_RETRY_AT = 0.0
+SPECIES_INDEX_RETRY = 60
+_SPECIES_FLIGHT = SingleFlight()
+
+
+def _load_species_index():
+    """
+    True if the index is loaded, or if it should not be fetched again yet.
+    """
+    global _SPECIES_INDEX
+    if _SPECIES_INDEX is None and os.path.exists(SPECIES_INDEX_PATH):
+        _SPECIES_INDEX = SpeciesIndex.load(SPECIES_INDEX_PATH)
+    return _SPECIES_INDEX is not None or time() < _SPECIES_INDEX_RETRY_AT
+
+
+def _store_species_index(payload):
+    global _SPECIES_INDEX, _SPECIES_INDEX_RETRY_AT
+    if payload is None:
+        _SPECIES_INDEX_RETRY_AT = time() + SPECIES_INDEX_RETRY
+    else:
+        _SPECIES_INDEX = SpeciesIndex.from_species_list(payload)
+    return _SPECIES_INDEX
+
+
+def get_species_index():
+    """
+    Species index, from the shipped file or (once per process) from pokeapi.
+    None if it could not be loaded, callers should not reject ids then.
+    Concurrent callers on a cold process share a single fetch.
+    """
+    if _load_species_index():
+        return _SPECIES_INDEX
+    return _SPECIES_FLIGHT.do(SPECIES_LIST_URL, _fetch_species_index)
+
+
+def _fetch_species_index():
+    if _load_species_index():  # fetched while waiting for the flight
+        return _SPECIES_INDEX
+    import requests  # only the sync path needs it
+
+    try:
+        response = requests.get(
+            SPECIES_LIST_URL, timeout=deadline.timeout(deadline.POKEAPI_TIMEOUT)
+        )
+        response.raise_for_status()
+        payload = response.json()
+    except Exception:
+        logger.exception("Species index unavailable")
+        payload = None
+    return _store_species_index(payload)
+
+
+async def get_species_index_async():
+    if _load_species_index():
+        return _SPECIES_INDEX
+    return await _SPECIES_FLIGHT.ado(SPECIES_LIST_URL, _fetch_species_index_async)
+
+
+async def _fetch_species_index_async():
+    if _load_species_index():
+        return _SPECIES_INDEX
+    try:
+        response = await http_client.get_client().get(
+            SPECIES_LIST_URL, timeout=deadline.timeout(deadline.POKEAPI_TIMEOUT)
+        )
+        response.raise_for_status()
+        payload = response.json()
+    except Exception:
+        logger.exception("Species index unavailable")
+        payload = None
+    return _store_species_index(payload)
+
+
+def _resolve(index, pokemon_id: str) -> str:
+    if index is None:
+        return pokemon_id.strip().lower()
+    return index.resolve(pokemon_id)
+
+
+def resolve_pokemon_id(pokemon_id: str) -> str:
+    """
+    Canonical key for any accepted identifier, so `1`, `0001` and `bulbasaur`
+    share cache entries. Unknown ids raise `PokemonNotFoundError` locally.
+    """
+    return _resolve(get_species_index(), pokemon_id)
+
+
+async def resolve_pokemon_id_async(pokemon_id: str) -> str:
+    return _resolve(await get_species_index_async(), pokemon_id)
+
+
+def description_key(pokemon_id: str) -> str:
+    return f"pokedex:{pokemon_id}"
+
+
+class SpeciesParser:
+    def __init__(self):
+        """
+        Incremental parser for pokeapi's `pokemon-species` resource: fed the
+        raw response in chunks, it keeps the name and the longest english
+        flavor text seen so far, and discards everything else as it goes.
+        """
+        import ijson  # only needed when going to pokeapi
+
+        self.name = None
+        self.longest = None
+        self.entry = {}
+        self.events = ijson.sendable_list()
+        self.parser = ijson.parse_coro(self.events)
+
+    def _consume(self):
+        for prefix, event, value in self.events:
+            if prefix == "name" and event == "string":
+                self.name = value
+            elif prefix == "flavor_text_entries.item.flavor_text":
+                self.entry["flavor_text"] = value
+            elif prefix == "flavor_text_entries.item.language.name":
+                self.entry["language"] = value
+            elif prefix == "flavor_text_entries.item" and event == "end_map":
+                text = self.entry.get("flavor_text")
+                if self.entry.get("language") == "en" and text is not None:
+                    if self.longest is None or len(text) > len(self.longest):
+                        self.longest = text
+                self.entry = {}
+        del self.events[:]
+
+    def feed(self, chunk: bytes):
+        if not chunk:  # an empty chunk would end the parse
+            return
+        self.parser.send(chunk)
+        self._consume()
+
+    def close(self):
+        """
+        `(name, description)`, the longest english flavor text, cleaned.
+        """
+        self.parser.close()
+        self._consume()
+        if self.name is None or self.longest is None:
+            raise DescriptionNotFoundError(self.name)
+        return self.name, _clean_description(self.longest)
+
+
+def _species_url(pokemon_id: str) -> str:
+    return f"{POKEAPI_URL}/pokemon-species/{pokemon_id}"
+
+
+def from_bundle(pokemon_id: str):
+    """
+    `(name, description)` from the shipped bundle, None if the species is not
+    in it (or there is no bundle).
+    """
+    shipped = bundle.get_bundle()
+    if shipped is None:
+        return None
+    try:
+        return shipped.lookup(pokemon_id)
+    except KeyError:
+        return None
+
+
 def get_pokemon_description(pokemon_id: str) -> str:
+    """
+    Description for the given pokemon, from the shipped bundle if it is there,
+    from pokeapi otherwise.
+    """
+    return from_bundle(pokemon_id) or fetch_pokemon_description(pokemon_id)
+
+
+async def get_pokemon_description_async(pokemon_id: str) -> str:
+    """
+    Same as `get_pokemon_description`, without blocking the event loop.
+    """
+    return from_bundle(pokemon_id) or await fetch_pokemon_description_async(pokemon_id)
+
+
+@tracing.traced("pokedex")
+def fetch_pokemon_description(pokemon_id: str) -> str:
     """
     Queries pokeapi in search of descriptions for the given pokemon.
     If several descriptions are available it'll return the longest one.
+
+    The response is parsed as it streams in, only the name and the english
+    flavor texts are kept. Transient failures are retried within the budget.
     """
-    try:
-        pokemon = POKEDEX.get_pokemon_species(pokemon_id)
-    except Exception as error:
-        if error.status_code == 404:
-            raise PokemonNotFoundError(
-                f"`{pokemon_id}` could not be found in national pokedex, send "
-                "a live specimen if this is a mistake."
-            )
-    description = max(
-        (
-            entry.flavor_text
-            for entry in pokemon.flavor_text_entries
-            if entry.language.name == "en"
-        ),
-        key=len,
+    return deadline.retry(_fetch_species, pokemon_id)
+
+
+def _fetch_species(pokemon_id: str):
+    import requests  # only the sync path needs it
+
+    with deadline.hop(deadline.POKEAPI_TIMEOUT) as timeout:
+        url = _species_url(pokemon_id)
+        with requests.get(url, stream=True, timeout=timeout) as response:
+            if response.status_code == 404:
+                raise _not_found(pokemon_id)
+            response.raise_for_status()
+            parser = SpeciesParser()
+            for chunk in response.iter_content(SPECIES_CHUNK_SIZE):
+                parser.feed(chunk)
+    return parser.close()
+
+
+@tracing.traced("pokedex")
+async def fetch_pokemon_description_async(pokemon_id: str) -> str:
+    """
+    Same as `fetch_pokemon_description`, without blocking the event loop.
+    Slow lookups are hedged with a duplicate request instead of retried.
+    """
+    return await deadline.hedged(
+        lambda: _fetch_species_async(pokemon_id), POKEAPI_LATENCY
     )
-    description = _clean_description(description)
-    name = pokemon.name
-    return name, description
+
+
+async def _fetch_species_async(pokemon_id: str):
+    client = http_client.get_client()
+    with deadline.hop(deadline.POKEAPI_TIMEOUT) as timeout:
+        url = _species_url(pokemon_id)
+        async with client.stream("GET", url, timeout=timeout) as response:
+            if response.status_code == 404:
+                raise _not_found(pokemon_id)
+            response.raise_for_status()
+            parser = SpeciesParser()
+            async for chunk in response.aiter_bytes():
+                parser.feed(chunk)
+    return parser.close()
+
+
+if __name__ == "__main__":
+    # Ships the species index with the artefact: python -m modules.pokedex [path]
+    import requests
+
+    path = sys.argv[1] if len(sys.argv) > 1 else SPECIES_INDEX_PATH
+    response = requests.get(SPECIES_LIST_URL)
+    response.raise_for_status()
+    index = SpeciesIndex.from_species_list(response.json())
+    index.dump(path)
+    print(f"{len(index)} species written to {path}")
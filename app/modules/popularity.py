@@ -0,0 +1,93 @@
+import hashlib
+import threading
+
+
+class CountMinSketch:
+    def __init__(self, width=1024, depth=4):
+        """
+        Approximate counts in `width * depth` counters, whatever the number of
+        keys. Estimates never undercount, and overcount by about
+        `total / width` with probability `1 - 0.5 ** depth`.
+        """
+        self.width = width
+        self.depth = depth
+        self.rows = [[0] * width for _ in range(depth)]
+
+    def _columns(self, key):
+        digest = hashlib.blake2b(key.encode("utf-8"), digest_size=4 * self.depth).digest()
+        for row in range(self.depth):
+            yield int.from_bytes(digest[4 * row : 4 * row + 4], "little") % self.width
+
+    def add(self, key, count=1):
+        """
+        Counts `key`, returns its new estimate.
+        """
+        estimate = None
+        for row, column in zip(self.rows, self._columns(key)):
+            row[column] += count
+            estimate = row[column] if estimate is None else min(estimate, row[column])
+        return estimate
+
+    def estimate(self, key):
+        return min(row[column] for row, column in zip(self.rows, self._columns(key)))
+
+    def clear(self):
+        for row in self.rows:
+            row[:] = [0] * self.width
+
+
+class TopK:
+    def __init__(self, k=100, width=1024, depth=4):
+        """
+        The `k` most counted keys, as estimated by a count-min sketch. Only
+        the candidates are kept by key, so memory does not grow with traffic.
+        """
+        self.k = k
+        self.sketch = CountMinSketch(width, depth)
+        self.candidates = {}
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.candidates)
+
+    def add(self, key, count=1):
+        with self.lock:
+            estimate = self.sketch.add(key, count)
+            if key in self.candidates or len(self.candidates) < self.k:
+                self.candidates[key] = estimate
+                return
+            weakest = min(self.candidates, key=self.candidates.get)
+            if estimate > self.candidates[weakest]:
+                del self.candidates[weakest]
+                self.candidates[key] = estimate
+
+    def top(self, n=None):
+        """
+        `(key, count)` pairs, most counted first.
+        """
+        with self.lock:
+            ranked = sorted(self.candidates.items(), key=lambda item: -item[1])
+        return ranked[:n] if n is not None else ranked
+
+    def pop(self):
+        """
+        Counts so far, and starts over.
+        """
+        with self.lock:
+            counts = dict(self.candidates)
+            self.candidates.clear()
+            self.sketch.clear()
+        return counts
+
+
+def merge(shared, counts, elapsed, half_life, k):
+    """
+    Adds `counts` to the `shared` ones, decayed by `elapsed` seconds so that
+    counts from `half_life` ago weigh half, and keeps the `k` highest.
+    """
+    decay = 0.5 ** (elapsed / half_life) if half_life else 1.0
+    merged = {key: count * decay for key, count in shared.items()}
+    for key, count in counts.items():
+        merged[key] = merged.get(key, 0) + count
+    ranked = sorted(merged.items(), key=lambda item: -item[1])[:k]
+    return {key: count for key, count in ranked}
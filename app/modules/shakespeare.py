@@ -1,10 +1,280 @@
-import requests
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from time import monotonic, sleep
+import hashlib
+import logging
+import os
+import re
+import threading
+import unicodedata
 
+from . import deadline, http_client, tracing
+from .metrics import LazyMetrics
 
+URL = os.environ.get(
+    "FUNTRANSLATIONS_URL", "https://api.funtranslations.com/translate/shakespeare.json"
+)
+WHITESPACE = re.compile(r"\s+")
+# public funtranslations plan: 5 calls per hour
+QUOTA = int(os.environ.get("TRANSLATION_QUOTA", "5"))
+QUOTA_PERIOD = float(os.environ.get("TRANSLATION_QUOTA_PERIOD", "3600"))
+# buckets are per process: the processes spending one funtranslations key
+# (gunicorn workers times containers, or concurrent lambdas) split the quota
+WORKERS = int(os.environ.get("TRANSLATION_WORKERS", "1"))
+# texts waiting for quota, past it they are not queued (asked again later)
+QUEUE_SIZE = int(os.environ.get("TRANSLATION_QUEUE_SIZE", "100"))
+
+metrics = LazyMetrics(global_tags=["funtranslations"])
+logger = logging.getLogger(__name__)
+
+# set while translating for no user in particular (exports, warming)
+_BACKGROUND = ContextVar("background", default=False)
+
+
+class TranslationPendingError(RuntimeError):
+    """
+    There is no translation quota left, the text was queued to be translated
+    as soon as there is (unless the queue was full).
+    """
+
+    outcome = "pending"  # span outcome
+
+    def __init__(self, text):
+        super().__init__("Translation pending, funtranslations quota exhausted")
+        self.text = text
+
+
+class QuotaExceededError(RuntimeError):
+    outcome = "throttled"
+
+
+class UpstreamError(RuntimeError):
+    """
+    Funtranslations answered, but not with a translation.
+    """
+
+    outcome = "error"
+
+
+class TokenBucket:
+    def __init__(self, capacity, period):
+        """
+        `capacity` tokens, refilled continuously over `period` seconds.
+        """
+        self.capacity = capacity
+        self.rate = capacity / period
+        self._tokens = capacity
+        self.updated = monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    @property
+    def tokens(self):
+        with self.lock:
+            self._refill()
+            return self._tokens
+
+    def take(self):
+        with self.lock:
+            self._refill()
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+    def drain(self):
+        """
+        Upstream says we are out of quota, whatever we thought.
+        """
+        with self.lock:
+            self._refill()
+            self._tokens = 0
+
+    def wait_time(self):
+        with self.lock:
+            self._refill()
+            return max(0.0, (1 - self._tokens) / self.rate)
+
+
+def worker_bucket(quota=QUOTA, period=QUOTA_PERIOD, workers=WORKERS):
+    """
+    This process' share of the quota: refilled at `quota / workers` tokens
+    per period, holding at least one token.
+    """
+    share = quota / workers
+    capacity = max(1.0, share)
+    return TokenBucket(capacity, period * capacity / share)
+
+
+@contextmanager
+def background():
+    """
+    Translations asked for within wait behind the ones users asked for.
+    """
+    token = _BACKGROUND.set(True)
+    try:
+        yield
+    finally:
+        _BACKGROUND.reset(token)
+
+
+class TranslationScheduler:
+    def __init__(self, bucket, size=QUEUE_SIZE):
+        """
+        Spends `bucket` tokens on translations. Texts that arrive while there
+        are none are queued once (deduplicated), and translated in a background
+        thread as tokens free up; `on_translated` callbacks get the results.
+
+        At most `size` texts are queued. The ones users asked for go first,
+        and take the place of `background` ones when the queue is full.
+        """
+        self.bucket = bucket
+        self.size = size
+        self.pending = OrderedDict()  # asked for by users
+        self.backlog = OrderedDict()  # asked for in the background
+        self.lock = threading.Lock()
+        self.worker = None
+        self.on_translated = []
+
+    def __len__(self):
+        return len(self.pending) + len(self.backlog)
+
+    def _report(self):
+        metrics.gauge("translation_queue_depth", len(self))
+        metrics.gauge("translation_tokens", self.bucket.tokens)
+
+    def acquire(self):
+        acquired = self.bucket.take()
+        self._report()
+        return acquired
+
+    def _queue(self, text, background):
+        if text in self.pending or background and text in self.backlog:
+            return True
+        if not background:
+            self.backlog.pop(text, None)
+            if len(self) >= self.size and self.backlog:
+                self.backlog.popitem()
+        if len(self) >= self.size:
+            return False
+        (self.backlog if background else self.pending)[text] = None
+        return True
+
+    def defer(self, text, throttled=False):
+        if throttled:
+            self.bucket.drain()
+        with self.lock:
+            queued = self._queue(text, _BACKGROUND.get())
+            if queued and self.worker is None:
+                self.worker = threading.Thread(target=self._drain, daemon=True)
+                self.worker.start()
+        metrics.increment("translation_deferred" if queued else "translation_dropped")
+        self._report()
+        return TranslationPendingError(text)
+
+    def _drain(self):
+        while True:
+            with self.lock:
+                queue = self.pending or self.backlog
+                if not queue:
+                    self.worker = None
+                    return
+                text = next(iter(queue))
+            wait = self.bucket.wait_time()
+            if wait > 0:
+                sleep(wait)
+            if not self.bucket.take():
+                continue
+            try:
+                translated = _translate(text)
+            except QuotaExceededError:
+                self.bucket.drain()
+                continue
+            except Exception:
+                logger.exception("Deferred translation failed, dropping it")
+            else:
+                for callback in self.on_translated:
+                    try:
+                        callback(text, translated)
+                    except Exception:
+                        logger.exception("Deferred translation callback failed")
+            with self.lock:
+                self.pending.pop(text, None)
+                self.backlog.pop(text, None)
+            self._report()
+
+
+SCHEDULER = TranslationScheduler(worker_bucket())
+
+
+def translation_key(text: str) -> str:
+    """
+    Content address of a text, translations are reused for any text that only
+    differs in unicode normalization or whitespace.
+    """
+    text = unicodedata.normalize("NFC", text)
+    text = WHITESPACE.sub(" ", text).strip()
+    digest = hashlib.sha256(text.encode("utf-8")).hexdigest()
+    return f"shakespeare:{digest}"
+
+
+def _parse(response):
+    """
+    Funtranslations answers `{"error": {"code": 429, ...}}` when throttled.
+    Other error statuses raise the client's HTTP status error, answers that
+    hold no translation `UpstreamError`.
+    """
+    try:
+        payload = response.json()
+    except ValueError:  # html error pages and the like
+        payload = None
+    error = payload.get("error") if isinstance(payload, dict) else None
+    error = error if isinstance(error, dict) else {}
+    if response.status_code == 429 or error.get("code") == 429:
+        raise QuotaExceededError(error.get("message"))
+    response.raise_for_status()
+    try:
+        return payload["contents"]["translated"]
+    except (KeyError, TypeError):
+        raise UpstreamError(f"No translation in the answer ({response.status_code})")
+
+
+def _translate(text: str) -> str:
+    import requests  # only the sync path (and the deferred queue) needs it
+
+    # not idempotent (it spends quota), so never retried nor hedged
+    with deadline.hop(deadline.TRANSLATION_TIMEOUT) as timeout:
+        response = requests.post(URL, data={"text": text}, timeout=timeout)
+    return _parse(response)
+
+
+@tracing.traced("translation")
 def get_shakesperean_translation(text: str) -> str:
-    response = requests.post(
-        "https://api.funtranslations.com/translate/shakespeare.json",
-        data={"text": text},
-    )
-    translated = response.json()["contents"]["translated"]
-    return translated
+    """
+    Raises `TranslationPendingError` if there is no quota left, the text is
+    translated later on.
+    """
+    if not SCHEDULER.acquire():
+        raise SCHEDULER.defer(text)
+    try:
+        return _translate(text)
+    except QuotaExceededError:
+        raise SCHEDULER.defer(text, throttled=True)
+
+
+@tracing.traced("translation")
+async def get_shakesperean_translation_async(text: str) -> str:
+    if not SCHEDULER.acquire():
+        raise SCHEDULER.defer(text)
+    client = http_client.get_client()
+    with deadline.hop(deadline.TRANSLATION_TIMEOUT) as timeout:
+        response = await client.post(URL, data={"text": text}, timeout=timeout)
+    try:
+        return _parse(response)
+    except QuotaExceededError:
+        raise SCHEDULER.defer(text, throttled=True)
@@ -0,0 +1,152 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from time import perf_counter
+import asyncio
+import os
+
+from .metrics import LazyMetrics
+
+SERVER_TIMING = os.environ.get("SERVER_TIMING", "False").lower() == "true"
+
+metrics = LazyMetrics(global_tags=["api"])
+
+# spans of the request being served, None outside of `trace`
+_SPANS = ContextVar("spans", default=None)
+
+
+class Span:
+    def __init__(self, stage, description=None):
+        """
+        One timed stage of a request. `outcome` can be set while it runs, it
+        defaults to `ok`, or to the `outcome` attribute of the exception that
+        ended it (`error` if there is none).
+        """
+        self.stage = stage
+        self.description = description
+        self.outcome = "ok"
+        self.duration = 0.0  # ms
+
+    def __repr__(self):
+        return f"Span({self.stage!r}, {self.outcome!r}, {self.duration:.3f}ms)"
+
+
+@contextmanager
+def trace():
+    """
+    Collects the spans of everything that runs within, in this context and
+    the tasks it starts. Threads only inherit it when run in a copy of the
+    context, the spans of any other thread are only sent as metrics.
+    """
+    spans = []
+    token = _SPANS.set(spans)
+    try:
+        yield spans
+    finally:
+        _SPANS.reset(token)
+
+
+@contextmanager
+def span(stage, description=None):
+    """
+    Times the block as `stage`, sent as a `stage_latency` histogram tagged by
+    stage and outcome, and added to the current trace if there is one.
+    """
+    current = Span(stage, description)
+    start = perf_counter()
+    try:
+        yield current
+    except BaseException as error:
+        if current.outcome == "ok":
+            current.outcome = getattr(error, "outcome", "error")
+        raise
+    finally:
+        current.duration = (perf_counter() - start) * 1e3
+        metrics.histogram(
+            "stage_latency",
+            current.duration,
+            tags=[f"stage:{stage}", f"outcome:{current.outcome}"],
+        )
+        spans = _SPANS.get()
+        if spans is not None:
+            spans.append(current)
+
+
+def traced(stage):
+    """
+    Decorator, the function (sync or async) runs within a `stage` span.
+    """
+
+    def decorator(function):
+        if asyncio.iscoroutinefunction(function):
+
+            @wraps(function)
+            async def awrapped(*args, **kwargs):
+                with span(stage):
+                    return await function(*args, **kwargs)
+
+            return awrapped
+
+        @wraps(function)
+        def wrapped(*args, **kwargs):
+            with span(stage):
+                return function(*args, **kwargs)
+
+        return wrapped
+
+    return decorator
+
+
+def _quoted(text):
+    """
+    `text` as an HTTP quoted-string, without the characters it can not hold.
+    """
+    text = "".join(char for char in str(text) if char == "\t" or " " <= char <= "~")
+    text = text.replace("\\", "\\\\").replace('"', '\\"')
+    return f'"{text}"'
+
+
+def server_timing(spans):
+    """
+    `Server-Timing` header value for the spans, in the order they finished.
+    """
+    entries = []
+    for current in spans:
+        entry = current.stage
+        if current.description:
+            entry += f";desc={_quoted(current.description)}"
+        entries.append(f"{entry};dur={current.duration:.2f}")
+    return ", ".join(entries)
+
+
+class TracingMiddleware:
+    def __init__(self, app):
+        """
+        ASGI middleware, every request is traced and timed as a `route` span
+        whose outcome is the status class. With SERVER_TIMING=true the spans
+        that finished before the response started are returned in a
+        `Server-Timing` header, along with the route time so far.
+        """
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        with trace() as spans, span("route") as route:
+            start = perf_counter()
+
+            async def send_traced(message):
+                if message["type"] == "http.response.start":
+                    route.outcome = f"{message['status'] // 100}xx"
+                    if SERVER_TIMING:
+                        elapsed = (perf_counter() - start) * 1e3
+                        timing = server_timing(spans)
+                        timing += (", " if timing else "") + f"route;dur={elapsed:.2f}"
+                        headers = list(message.get("headers", []))
+                        headers.append((b"server-timing", timing.encode("latin-1", "replace")))
+                        message = dict(message, headers=headers)
+                await send(message)
+
+            await self.app(scope, receive, send_traced)
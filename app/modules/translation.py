@@ -0,0 +1,193 @@
+import re
+
+from . import deadline, shakespeare
+
+# modern -> early modern english, matched as whole words (case insensitive,
+# the case of the original is kept); phrases win over the words they contain
+PHRASES = {
+    "you are": "thou art",
+    "you have": "thou hast",
+    "it is": "'tis",
+    "there": "thither",
+    "here": "hither",
+    "where": "whither",
+    "be": "beest",
+    "are": "art",
+    "you": "thee",
+    "your": "thy",
+    "yours": "thine",
+    "yourself": "thyself",
+    "does": "doth",
+    "has": "hath",
+    "sun": "travelling lamp",
+    "before": "ere",
+    "often": "oft",
+    "over": "o'er",
+    "never": "ne'er",
+    "ever": "e'er",
+    "nothing": "naught",
+    "anything": "aught",
+    "why": "wherefore",
+    "perhaps": "perchance",
+    "maybe": "perchance",
+    "soon": "anon",
+    "really": "verily",
+    "said": "quoth",
+    "hello": "good morrow",
+}
+# old games print pokemon names in capitals, "BULBASAUR" reads "Bulbasaur"
+SHOUTING = re.compile(r"\b[A-Z]{2,}\b")
+ELLIPSIS = re.compile(r"(?:\.{2,}|…)")
+
+
+class Engine:
+    """
+    Translates texts into shakespearean english. Engines may raise
+    `shakespeare.TranslationPendingError` when a text will only be
+    translated later.
+    """
+
+    def translate(self, text: str) -> str:
+        raise NotImplementedError
+
+    async def atranslate(self, text: str) -> str:
+        return self.translate(text)
+
+    async def atranslate_many(self, texts) -> dict:
+        """
+        Dict text -> translation, or the exception raised for that text.
+        """
+        results = {}
+        for text in dict.fromkeys(texts):
+            try:
+                results[text] = await self.atranslate(text)
+            except Exception as error:
+                results[text] = error
+        return results
+
+
+class LocalEngine(Engine):
+    def __init__(self, phrases=None):
+        """
+        Dictionary and phrase substitution, all in one compiled regex (an
+        alternation, longest phrases first): microseconds per text, no quota.
+        """
+        self.phrases = {
+            phrase.lower(): replacement
+            for phrase, replacement in (phrases or PHRASES).items()
+        }
+        alternatives = sorted(self.phrases, key=len, reverse=True)
+        self.pattern = re.compile(
+            r"\b(?:%s)\b" % "|".join(re.escape(phrase) for phrase in alternatives),
+            re.IGNORECASE,
+        )
+
+    def _replace(self, match):
+        original = match.group(0)
+        replacement = self.phrases[original.lower()]
+        if original.isupper() and len(original) > 1:
+            return replacement.upper()
+        if original[0].isupper():
+            return replacement[0].upper() + replacement[1:]
+        return replacement
+
+    def translate(self, text: str) -> str:
+        text = SHOUTING.sub(lambda match: match.group(0).capitalize(), text)
+        text = ELLIPSIS.sub(".", text)
+        return self.pattern.sub(self._replace, text)
+
+    def translate_many(self, texts) -> list:
+        return [self.translate(text) for text in texts]
+
+    async def atranslate_many(self, texts) -> dict:
+        return {text: self.translate(text) for text in dict.fromkeys(texts)}
+
+
+class RemoteEngine(Engine):
+    def __init__(self, cache, concurrency=8):
+        """
+        funtranslations, quota permitting, with its results kept in `cache`.
+        """
+        self.cache = cache
+        self.concurrency = concurrency
+        self._translate = cache(shakespeare.get_shakesperean_translation)
+        self._atranslate = cache(shakespeare.get_shakesperean_translation_async)
+
+    def translate(self, text: str) -> str:
+        return self._translate(text)
+
+    async def atranslate(self, text: str) -> str:
+        return await self._atranslate(text)
+
+    async def atranslate_many(self, texts) -> dict:
+        return await self.cache.amany(
+            shakespeare.get_shakesperean_translation_async,
+            texts,
+            concurrency=self.concurrency,
+        )
+
+
+class FallbackEngine(Engine):
+    def __init__(self, primary, fallback):
+        """
+        `primary`, or `fallback` where it fails. A pending translation stays
+        pending, with the fallback's translation in `translation` meanwhile.
+        """
+        self.primary = primary
+        self.fallback = fallback
+
+    def _recover(self, text, error):
+        if isinstance(error, shakespeare.TranslationPendingError):
+            error.translation = self.fallback.translate(text)
+            return error
+        if isinstance(
+            error,
+            (
+                shakespeare.QuotaExceededError,
+                shakespeare.UpstreamError,
+                deadline.DeadlineExceeded,
+            ),
+        ) or deadline.is_transient(error):
+            return self.fallback.translate(text)
+        return error
+
+    def translate(self, text: str) -> str:
+        try:
+            return self.primary.translate(text)
+        except Exception as error:
+            result = self._recover(text, error)
+            if isinstance(result, BaseException):
+                raise result
+            return result
+
+    async def atranslate(self, text: str) -> str:
+        try:
+            return await self.primary.atranslate(text)
+        except Exception as error:
+            result = self._recover(text, error)
+            if isinstance(result, BaseException):
+                raise result
+            return result
+
+    async def atranslate_many(self, texts) -> dict:
+        results = await self.primary.atranslate_many(texts)
+        return {
+            text: self._recover(text, result)
+            if isinstance(result, BaseException)
+            else result
+            for text, result in results.items()
+        }
+
+
+def get_engine(name, cache, concurrency=8) -> Engine:
+    """
+    `remote` (funtranslations), `local`, or `remote+local` (funtranslations,
+    the local engine where it fails or while a translation is pending).
+    """
+    if name == "local":
+        return LocalEngine()
+    if name == "remote":
+        return RemoteEngine(cache, concurrency)
+    if name == "remote+local":
+        return FallbackEngine(RemoteEngine(cache, concurrency), LocalEngine())
+    raise ValueError(f"Unknown translation engine `{name}`")
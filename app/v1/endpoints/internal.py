@@ -0,0 +1,15 @@
+from fastapi import APIRouter
+
+import controller
+
+ROUTER = APIRouter()
+
+
+@ROUTER.get("/internal/cache", include_in_schema=False)
+async def get_cache_stats():
+    """
+    Rolling statistics of every cache (since the last time they were sent as
+    gauges): hit ratio per tier, item size and latency distributions, and
+    the hottest keys. Only served on stages with internal routes.
+    """
+    return controller.cache_stats()
@@ -1,10 +1,14 @@
 from enum import Enum
-from typing import Optional
+import asyncio
+from typing import List, Optional
+import json
 import logging
 
-from fastapi import APIRouter, HTTPException, responses
-from doglessdata import DataDogMetrics
+from fastapi import APIRouter, BackgroundTasks, Header, HTTPException, Query, responses
+from pydantic import BaseModel, Field
+from starlette.datastructures import MutableHeaders
 
+from modules import compression, http_caching, tracing
 import controller
 
 ROUTER = APIRouter()
@@ -14,14 +18,81 @@ class OutputFormat(str, Enum):
     text = "text"
     json = "json"
 
-metrics = DataDogMetrics(global_tags=["api"])
+
+class BatchRequest(BaseModel):
+    ids: List[str] = Field(..., min_items=1, max_items=250)
+
+
+TRANSLATION_PENDING_HEADER = "X-Translation-Pending"
+EXPORT_CURSOR_HEADER = "X-Next-Cursor"
+
 logger = logging.getLogger(__name__)
 
 
-@metrics.timeit
+class NDJSONResponse(responses.StreamingResponse):
+    media_type = "application/x-ndjson"
+
+    async def __call__(self, scope, receive, send):
+        # streams until done or the client leaves, as starlette's does, but
+        # racing tasks: asyncio.wait no longer takes bare coroutines
+        tasks = [
+            asyncio.ensure_future(self.stream_response(send)),
+            asyncio.ensure_future(self.listen_for_disconnect(receive)),
+        ]
+        done, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        for task in pending:
+            task.cancel()
+        for task in done:
+            task.result()
+        if self.background is not None:
+            await self.background()
+
+
+@ROUTER.get("/pokemon/export")
+async def export_pokemon_descriptions(
+    after: int = Query(0, ge=0), limit: Optional[int] = Query(None, ge=1)
+):
+    """
+    Every Pokemon description, in proper bard style, as NDJSON: one
+    `{"id", "name", "description"}` object per line, in National Pokedex
+    order, streamed as it is read.
+
+    `after` is the cursor, the id of the last line already received; `limit`
+    caps the number of ids gone through. When it does, `X-Next-Cursor`
+    holds the `after` of the next page.
+
+    On Lambda `limit` is capped (EXPORT_MAX_LIMIT) and the response is only
+    sent once complete. An export that runs out of invocation time ends
+    early, resume it after the last id received.
+    """
+    limit = controller.export_limit(limit)
+    try:
+        size = await controller.export_size_async()
+    except controller.SpeciesIndexUnavailable as error:
+        raise HTTPException(status_code=503, detail=str(error))
+    headers = {}
+    if limit is not None and after + limit < size:
+        headers[EXPORT_CURSOR_HEADER] = str(after + limit)
+
+    async def lines():
+        async for number, name, description, pending in (
+            controller.export_descriptions_translated_async(after, limit)
+        ):
+            line = {"id": number, "name": name, "description": description}
+            if pending:
+                line["translation_pending"] = True
+            yield json.dumps(line) + "\n"
+
+    return NDJSONResponse(lines(), headers=headers)
+
+
 @ROUTER.get("/pokemon/{pokemon_id}")
 async def get_pokemon_description(
-    pokemon_id: str, output_format: Optional[OutputFormat] = OutputFormat.json
+    pokemon_id: str,
+    background_tasks: BackgroundTasks,
+    output_format: Optional[OutputFormat] = OutputFormat.json,
+    if_none_match: Optional[str] = Header(None),
+    accept_encoding: Optional[str] = Header(None),
 ):
     """
     Get Pokemon description, in proper bard style.
@@ -29,17 +100,128 @@ async def get_pokemon_description(
     It can be a pokemon name, or it's order id in National Pokedex.
 
     The name is case insensitive.
+
+    Bodies are compressed once per representation (gzip or brotli, as
+    negotiated), repeated requests get the same compressed bytes.
+
+    Responses carry an `ETag` and a `Cache-Control` max-age (what is left of
+    the cached description's freshness); `If-None-Match` gets a `304`.
     """
     pokemon_id = pokemon_id.lower()
+    pending = False
     try:
-        name, description = controller.get_pokemon_description_translated(pokemon_id)
+        name, description = await controller.get_pokemon_description_translated_async(
+            pokemon_id
+        )
     except controller.PokemonNotFoundError as error:
-        raise HTTPException(status_code=404, detail=str(error))
+        # cacheable too, but never a 304: preconditions only apply to 2xx
+        detail = str(error)
+        headers = http_caching.caching_headers(
+            http_caching.etag(404, detail), http_caching.NOT_FOUND_MAX_AGE
+        )
+        raise HTTPException(status_code=404, detail=detail, headers=headers)
+    except controller.TranslationPendingError as error:
+        # untranslated (but clean) description, rather than failing
+        name, description = error.name, error.description
+        pending = True
+    if controller.record_popularity(name):
+        background_tasks.add_task(controller.publish_popularity)
+
+    if pending:
+        max_age = 0  # the translation is on its way
+    else:
+        max_age = await controller.description_freshness_async(name)
+    etag = http_caching.etag(output_format.value, name, description, pending)
+    headers = http_caching.caching_headers(etag, max_age)
+    if pending:
+        headers[TRANSLATION_PENDING_HEADER] = "true"
 
     if output_format == OutputFormat.text:
-        return responses.PlainTextResponse(f"{name}: {description}", media_type="text/plain")
+        body = f"{name}: {description}"
+        size = len(body.encode())
     elif output_format == OutputFormat.json:
-        return {
+        body = {
             "name": name,
             "description": description,
         }
+        if pending:
+            body["translation_pending"] = True
+        size = _json_size(body)
+    encoding = compression.negotiate(accept_encoding)
+    if http_caching.not_modified(if_none_match, etag):
+        # validators and Vary of the representation it stands for, which is
+        # never rendered
+        headers = MutableHeaders(headers)
+        compression.represent(headers, size, encoding)
+        return compression.not_modified(headers)
+
+    with tracing.span("render"):
+        if output_format == OutputFormat.text:
+            response = responses.PlainTextResponse(
+                body, media_type="text/plain", headers=headers
+            )
+        elif output_format == OutputFormat.json:
+            response = responses.JSONResponse(body, headers=headers)
+    with tracing.span("compress"):
+        return compression.precompress(response, etag, encoding)
+
+
+def _json_size(body: dict) -> int:
+    """
+    Bytes `JSONResponse` renders a flat `body` (strings and booleans) in,
+    worked out from its values: its compact separators, no indentation.
+    """
+    size = 1 + len(body)  # braces and commas
+    for key, value in body.items():
+        size += len(json.encoder.encode_basestring(key).encode()) + 1
+        if isinstance(value, str):
+            size += len(json.encoder.encode_basestring(value).encode())
+        else:
+            size += len(json.dumps(value))
+    return size
+
+
+@ROUTER.post("/pokemon/batch")
+async def get_pokemon_descriptions(
+    batch: BatchRequest, output_format: Optional[OutputFormat] = OutputFormat.json
+):
+    """
+    Get several Pokemon descriptions at once, in proper bard style.
+
+    Repeated ids are answered once. Ids that can't be found are reported
+    inline (with their 404 detail), the rest of the batch is still answered.
+    """
+    pokemon_ids = [pokemon_id.lower() for pokemon_id in batch.ids]
+    results = await controller.get_pokemon_descriptions_translated_async(pokemon_ids)
+
+    if output_format == OutputFormat.text:
+        lines = []
+        for pokemon_id, result in results.items():
+            if isinstance(result, controller.PokemonNotFoundError):
+                lines.append(f"{pokemon_id}: 404 {result}")
+            elif isinstance(result, controller.TranslationPendingError):
+                lines.append(f"{result.name}: {result.description}")
+            else:
+                name, description = result
+                lines.append(f"{name}: {description}")
+        return responses.PlainTextResponse("\n".join(lines), media_type="text/plain")
+    elif output_format == OutputFormat.json:
+        body = []
+        for pokemon_id, result in results.items():
+            if isinstance(result, controller.PokemonNotFoundError):
+                body.append(
+                    {"id": pokemon_id, "status_code": 404, "detail": str(result)}
+                )
+            elif isinstance(result, controller.TranslationPendingError):
+                body.append(
+                    {
+                        "id": pokemon_id,
+                        "name": result.name,
+                        "description": result.description,
+                        "translation_pending": True,
+                    }
+                )
+            else:
+                name, description = result
+                body.append({"id": pokemon_id, "name": name, "description": description})
+        return body
@@ -1,6 +1,11 @@
 from fastapi import APIRouter
-from .endpoints import pokemon
+from .endpoints import internal, pokemon
 
 router = APIRouter()
 
 router.include_router(pokemon.ROUTER, tags=["pokemon"])
+
+# operational routes, only included on stages that allow them
+internal_router = APIRouter()
+
+internal_router.include_router(internal.ROUTER, tags=["internal"])
@@ -0,0 +1,99 @@
+"""
+Cache value encoding: json + format_dynamo_record (the legacy item layout)
+against the binary `encode_value` layout. Reports encode/decode time and the
+DynamoDB item size, which is what read/write capacity units are billed on.
+
+    python -m bench.encoding [--output results.json]
+"""
+from time import perf_counter, time
+import argparse
+import json
+
+from modules.dynamo_cache import decode_value, encode_value, format_dynamo_record
+
+DESCRIPTION = (
+    "Charizard flies around the sky in search of powerful opponents. It "
+    "breathes fire of such great heat that it melts anything. However, it "
+    "never turns its fiery breath on any opponent weaker than itself."
+)
+SAMPLES = {
+    "short": ("bulbasaur", "A strange seed was planted on its back at birth."),
+    "description": ("charizard", DESCRIPTION),
+    "batch": [("charizard", DESCRIPTION)] * 50,
+}
+KEY = "pokedex:charizard"
+
+
+def item_size(item):
+    """
+    DynamoDB item size: attribute names plus values (numbers are roughly one
+    byte per two significant digits, plus one).
+    """
+    size = 0
+    for name, value in item.items():
+        size += len(name.encode())
+        if isinstance(value, str):
+            size += len(value.encode())
+        elif isinstance(value, bytes):
+            size += len(value)
+        else:
+            size += len(str(value).replace(".", "").lstrip("0")) // 2 + 1
+    return size
+
+
+def legacy_item(value):
+    item = {"key": KEY, "value": json.dumps(value), "ttl": time() + 3600}
+    return format_dynamo_record(item)
+
+
+def binary_item(value):
+    return {"key": KEY, "blob": encode_value(value), "ttl": int(time() + 3600)}
+
+
+def timed(function, argument, repeat):
+    start = perf_counter()
+    for _ in range(repeat):
+        function(argument)
+    return (perf_counter() - start) / repeat * 1e6  # µs
+
+
+def run(repeat=20000):
+    results = {}
+    for name, value in SAMPLES.items():
+        legacy = legacy_item(value)
+        binary = binary_item(value)
+        results[name] = {
+            "legacy": {
+                "encode_us": timed(legacy_item, value, repeat),
+                "decode_us": timed(json.loads, legacy["value"], repeat),
+                "item_bytes": item_size(legacy),
+            },
+            "binary": {
+                "encode_us": timed(binary_item, value, repeat),
+                "decode_us": timed(decode_value, binary["blob"], repeat),
+                "item_bytes": item_size(binary),
+            },
+        }
+        results[name]["size_reduction"] = 1 - (
+            results[name]["binary"]["item_bytes"]
+            / results[name]["legacy"]["item_bytes"]
+        )
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--output", help="write results as json to this file")
+    parser.add_argument("--repeat", type=int, default=20000)
+    arguments = parser.parse_args()
+
+    results = run(arguments.repeat)
+    output = json.dumps(results, indent=2)
+    if arguments.output:
+        with open(arguments.output, "w") as destination:
+            destination.write(output)
+    print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+Cold start report: import time of `main` broken down per top-level package
+(from `python -X importtime`), and the time each lazily built client takes
+on first use.
+
+    python -m bench.importtime [--output results.json]
+"""
+from time import perf_counter
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+ENVIRONMENT = {
+    "CACHE_TABLE": "importtime",
+    "AWS_DEFAULT_REGION": "eu-west-1",
+}
+
+
+def _environment():
+    environment = dict(ENVIRONMENT)
+    environment.update(os.environ)
+    return environment
+
+
+def import_breakdown():
+    """
+    Import time (µs) spent in each top-level package while importing `main`.
+    """
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"],
+        env=_environment(),
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+        check=True,
+    )
+    packages = {}
+    for line in process.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        own, _, name = line[len("import time:") :].split("|")
+        package = name.strip().split(".")[0]
+        packages[package] = packages.get(package, 0) + int(own)
+    return dict(sorted(packages.items(), key=lambda item: -item[1]))
+
+
+def _timed(function):
+    start = perf_counter()
+    function()
+    return (perf_counter() - start) * 1e3  # ms
+
+
+def init_breakdown():
+    """
+    Runs in a fresh interpreter: time to import `main`, then time to build
+    each lazy client on first use (ms).
+    """
+    timings = {}
+    timings["import main"] = _timed(lambda: __import__("main"))
+
+    import main
+    from modules import cache_backends
+
+    timings["datadog client"] = _timed(lambda: main.tracing.metrics.client)
+    timings["boto3 dynamodb resource"] = _timed(cache_backends._dynamodb_resource)
+    timings["ijson"] = _timed(lambda: __import__("ijson"))
+    timings["httpx"] = _timed(lambda: __import__("httpx"))
+    timings["mangum"] = _timed(lambda: __import__("mangum"))
+    return timings
+
+
+def run():
+    process = subprocess.run(
+        [sys.executable, "-m", "bench.importtime", "--init"],
+        env=_environment(),
+        stdout=subprocess.PIPE,
+        universal_newlines=True,
+        check=True,
+    )
+    return {
+        "import_us": import_breakdown(),
+        "init_ms": json.loads(process.stdout),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--output", help="write results as json to this file")
+    parser.add_argument("--init", action="store_true", help=argparse.SUPPRESS)
+    arguments = parser.parse_args()
+
+    if arguments.init:
+        print(json.dumps(init_breakdown()))
+        return
+
+    results = run()
+    for package, microseconds in results["import_us"].items():
+        print(f"{microseconds / 1000:10.1f} ms  import {package}")
+    for step, milliseconds in results["init_ms"].items():
+        print(f"{milliseconds:10.1f} ms  {step}")
+    if arguments.output:
+        with open(arguments.output, "w") as destination:
+            json.dump(results, destination, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,197 @@
+"""
+Replays an access log against the in-process service, with the upstreams
+replaced by the local stand-ins (see `bench.standins`), to size caches and
+TTLs against real traffic instead of guessing.
+
+The log is JSON lines, one request each:
+
+    {"timestamp": 1603000000.5, "path": "/pokemon/25", "query": "output_format=text"}
+
+`timestamp` is epoch seconds or ISO 8601, `query` a string or an object;
+`method` (GET) and a json `body` are optional. Lines without a `path` are
+skipped.
+
+    python -m bench.replay access.jsonl [--speed 10] [--output results.json]
+
+`--speed 1` keeps the original timing, `--speed N` is N times faster, and
+`--speed 0` sends everything as fast as `--concurrency` allows.
+"""
+from datetime import datetime
+from time import perf_counter
+from urllib.parse import urlencode
+import argparse
+import asyncio
+import json
+
+from bench import standins
+from bench.service import percentile, summarize
+
+TIERS = ("memory", "dynamodb")
+
+
+def _timestamp(value):
+    if isinstance(value, (int, float)):
+        return float(value)
+    return datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp()
+
+
+def load(path, limit=None):
+    """
+    Log entries as `(timestamp, method, url, body)`, in timestamp order.
+    """
+    entries = []
+    with open(path) as log:
+        for line in log:
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            if "path" not in record:
+                continue
+            query = record.get("query") or ""
+            if isinstance(query, dict):
+                query = urlencode(query)
+            url = f"{record['path']}?{query}" if query else record["path"]
+            entries.append(
+                (
+                    _timestamp(record.get("timestamp", 0)),
+                    record.get("method", "GET").upper(),
+                    url,
+                    record.get("body"),
+                )
+            )
+            if limit and len(entries) >= limit:
+                break
+    entries.sort(key=lambda entry: entry[0])
+    return entries
+
+
+async def replay(app, entries, speed=1.0, concurrency=16):
+    """
+    Sends the entries to `app`. With a `speed`, each request starts at its
+    (scaled) offset from the first one, however many are still in flight;
+    `lag` is how late they started. Without one, `concurrency` at a time.
+    """
+    import httpx
+
+    latencies = []
+    statuses = []
+    lags = []
+    semaphore = asyncio.Semaphore(concurrency) if not speed else None
+    first = entries[0][0] if entries else 0.0
+
+    # unhandled errors are answered with a 500, as a server would
+    transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+    async with httpx.AsyncClient(transport=transport, base_url="http://replay") as client:
+        start = perf_counter()
+
+        async def send(timestamp, method, url, body):
+            if speed:
+                offset = (timestamp - first) / speed
+                await asyncio.sleep(max(0.0, offset - (perf_counter() - start)))
+                lags.append(max(0.0, perf_counter() - start - offset))
+                await request(method, url, body)
+            else:
+                async with semaphore:
+                    await request(method, url, body)
+
+        async def request(method, url, body):
+            sent = perf_counter()
+            response = await client.request(method, url, json=body)
+            latencies.append(perf_counter() - sent)
+            statuses.append(response.status_code)
+
+        await asyncio.gather(*(send(*entry) for entry in entries))
+        elapsed = perf_counter() - start
+
+    results = summarize(latencies, elapsed, statuses)
+    if lags:
+        results["lag_p99_ms"] = percentile(lags, 0.99) * 1e3
+    return results
+
+
+def hit_ratios(caches):
+    """
+    Hit ratio of each cache tier, out of the lookups that reached it.
+    """
+    ratios = {}
+    for name, cache in caches.items():
+        ratios[name] = {}
+        for tier in TIERS:
+            hits = cache.counters[("cache_hit", tier)]
+            misses = cache.counters[("cache_miss", tier)]
+            ratios[name][tier] = {
+                "hits": hits,
+                "misses": misses,
+                "ratio": hits / (hits + misses) if hits + misses else None,
+            }
+        ratios[name]["stale"] = cache.counters[("cache_stale", None)]
+    return ratios
+
+
+def run(path, speed=1.0, concurrency=16, limit=None, pokeapi_latency=0.05,
+        translation_latency=0.1, dynamodb_latency=0.005, error_rate=0.0):
+    entries = load(path, limit)
+    if not entries:
+        raise SystemExit(f"No requests to replay in {path}")
+    upstreams = standins.FakeUpstreams(
+        pokeapi=standins.Upstream(pokeapi_latency, error_rate),
+        funtranslations=standins.Upstream(translation_latency, error_rate),
+    ).start()
+    dynamodb = standins.InMemoryDynamoDB(latency=dynamodb_latency)
+    try:
+        app, caches = standins.install(upstreams, dynamodb)
+
+        async def main():
+            from modules import http_client
+
+            try:
+                return await replay(app, entries, speed, concurrency)
+            finally:
+                await http_client.close_client()
+
+        results = asyncio.run(main())
+    finally:
+        upstreams.stop()
+    results["log_duration_s"] = entries[-1][0] - entries[0][0]
+    results["speed"] = speed
+    results["cache"] = hit_ratios(caches)
+    results["upstream_calls"] = dict(upstreams.calls)
+    results["dynamodb_calls"] = dict(dynamodb.calls)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("log", help="json lines access log")
+    parser.add_argument("--output", help="write results as json to this file")
+    parser.add_argument("--speed", type=float, default=1.0)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--limit", type=int, help="replay only the first entries")
+    parser.add_argument("--pokeapi-latency", type=float, default=0.05)
+    parser.add_argument("--translation-latency", type=float, default=0.1)
+    parser.add_argument("--dynamodb-latency", type=float, default=0.005)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    arguments = parser.parse_args()
+
+    results = run(
+        arguments.log,
+        speed=arguments.speed,
+        concurrency=arguments.concurrency,
+        limit=arguments.limit,
+        pokeapi_latency=arguments.pokeapi_latency,
+        translation_latency=arguments.translation_latency,
+        dynamodb_latency=arguments.dynamodb_latency,
+        error_rate=arguments.error_rate,
+    )
+    output = json.dumps(results, indent=2)
+    if arguments.output:
+        with open(arguments.output, "w") as destination:
+            destination.write(output)
+    print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,216 @@
+"""
+End to end latency of `GET /pokemon/{id}`, against local stand-ins for
+pokeapi, funtranslations and dynamodb (see `bench.standins`), plus timings of
+the hot helpers. Nothing leaves the machine.
+
+Workloads:
+    cold   every request is for a pokemon that is in no cache tier
+    warm   every request is for a pokemon in the memory tier
+    mixed  80% of the requests go to 20% of the pokemon, starting cold
+
+    python -m bench.service [--output results.json] [--requests 500]
+        [--concurrency 16] [--pokeapi-latency 0.05] [--error-rate 0.0]
+"""
+from time import perf_counter, time
+import argparse
+import asyncio
+import json
+import random
+import statistics
+
+from bench import standins
+
+DESCRIPTION = (
+    "It is said that the Pokémon's\nflame burns\fbrighter  when it is angry. "
+    "When it flies around the sky it breathes fire of such great heat."
+)
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(fraction * len(ordered)) - 1))
+    return ordered[index]
+
+
+def summarize(latencies, elapsed, statuses):
+    """
+    Latency percentiles in ms, requests per second and status code counts.
+    """
+    return {
+        "requests": len(latencies),
+        "rps": len(latencies) / elapsed,
+        "p50_ms": percentile(latencies, 0.50) * 1e3,
+        "p95_ms": percentile(latencies, 0.95) * 1e3,
+        "p99_ms": percentile(latencies, 0.99) * 1e3,
+        "mean_ms": statistics.mean(latencies) * 1e3,
+        "statuses": {str(status): statuses.count(status) for status in set(statuses)},
+    }
+
+
+async def drive(app, paths, concurrency):
+    """
+    Requests every path in-process, `concurrency` at a time.
+    """
+    import httpx
+
+    latencies = []
+    statuses = []
+    queue = iter(paths)
+
+    # unhandled errors are answered with a 500, as a server would
+    transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+
+        async def worker():
+            for path in queue:
+                start = perf_counter()
+                response = await client.get(path)
+                latencies.append(perf_counter() - start)
+                statuses.append(response.status_code)
+
+        start = perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = perf_counter() - start
+    return summarize(latencies, elapsed, statuses)
+
+
+def workloads(requests, seed=0):
+    """
+    Pokedex numbers to request, per workload. `warm` needs its pokemon to be
+    cached first, those are under `warmup`.
+    """
+    rng = random.Random(seed)
+    numbers = list(range(1, standins.SPECIES_COUNT + 1))
+    rng.shuffle(numbers)
+    cold = numbers[:requests]
+    hot = numbers[:50]
+    popular = numbers[: max(1, len(numbers) // 5)]
+    mixed = [
+        rng.choice(popular) if rng.random() < 0.8 else rng.choice(numbers)
+        for _ in range(requests)
+    ]
+    return {
+        "cold": {"warmup": [], "paths": cold},
+        "warm": {"warmup": hot, "paths": [rng.choice(hot) for _ in range(requests)]},
+        "mixed": {"warmup": [], "paths": mixed},
+    }
+
+
+async def run_workloads(app, caches, dynamodb, upstreams, requests, concurrency):
+    from modules import http_client
+
+    results = {}
+    for name, workload in workloads(requests).items():
+        standins.reset(caches, dynamodb)
+        if workload["warmup"]:
+            await drive(app, [f"/pokemon/{n}" for n in workload["warmup"]], concurrency)
+        calls = dict(upstreams.calls)
+        results[name] = await drive(
+            app, [f"/pokemon/{n}" for n in workload["paths"]], concurrency
+        )
+        results[name]["upstream_calls"] = {
+            upstream: count - calls.get(upstream, 0)
+            for upstream, count in upstreams.calls.items()
+        }
+    await http_client.close_client()
+    return results
+
+
+def timed(function, repeat):
+    start = perf_counter()
+    for _ in range(repeat):
+        function()
+    return (perf_counter() - start) / repeat * 1e6  # µs
+
+
+def components(caches, repeat=20000):
+    """
+    Mean time (µs) of the helpers on the request path.
+    """
+    from modules import dynamo_cache, pokedex
+
+    cache = caches["descriptions"]
+    value = ("charizard", DESCRIPTION)
+    record = {"key": "pokedex:charizard", "value": json.dumps(value), "ttl": time() + 60}
+    cache.put("bench:table", value)
+    cache.memory.clear()
+
+    def get_from_table():
+        cache.memory.clear()
+        cache.get("bench:table")
+
+    return {
+        "_clean_description": timed(lambda: pokedex._clean_description(DESCRIPTION), repeat),
+        "make_hasheable": timed(
+            lambda: dynamo_cache.make_hasheable(("charizard",), {"lang": "en"}), repeat
+        ),
+        "format_dynamo_record": timed(
+            lambda: dynamo_cache.format_dynamo_record(record), repeat
+        ),
+        "Cache.put": timed(lambda: cache.put("bench:put", value), repeat),
+        "Cache.get memory": timed(lambda: cache.get("bench:put"), repeat),
+        "Cache.get dynamodb": timed(get_from_table, repeat),
+    }
+
+
+def run(requests=500, concurrency=16, pokeapi_latency=0.05, translation_latency=0.1,
+        dynamodb_latency=0.005, error_rate=0.0, repeat=20000):
+    upstreams = standins.FakeUpstreams(
+        pokeapi=standins.Upstream(pokeapi_latency, error_rate),
+        funtranslations=standins.Upstream(translation_latency, error_rate),
+    ).start()
+    dynamodb = standins.InMemoryDynamoDB(latency=dynamodb_latency)
+    try:
+        app, caches = standins.install(upstreams, dynamodb)
+        results = {
+            "settings": {
+                "requests": requests,
+                "concurrency": concurrency,
+                "pokeapi_latency": pokeapi_latency,
+                "translation_latency": translation_latency,
+                "dynamodb_latency": dynamodb_latency,
+                "error_rate": error_rate,
+            },
+            "workloads": asyncio.run(
+                run_workloads(app, caches, dynamodb, upstreams, requests, concurrency)
+            ),
+        }
+        dynamodb.latency = 0.0
+        for table in dynamodb.tables.values():
+            table.latency = 0.0
+        results["components_us"] = components(caches, repeat)
+    finally:
+        upstreams.stop()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--output", help="write results as json to this file")
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--pokeapi-latency", type=float, default=0.05)
+    parser.add_argument("--translation-latency", type=float, default=0.1)
+    parser.add_argument("--dynamodb-latency", type=float, default=0.005)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--repeat", type=int, default=20000)
+    arguments = parser.parse_args()
+
+    results = run(
+        requests=arguments.requests,
+        concurrency=arguments.concurrency,
+        pokeapi_latency=arguments.pokeapi_latency,
+        translation_latency=arguments.translation_latency,
+        dynamodb_latency=arguments.dynamodb_latency,
+        error_rate=arguments.error_rate,
+        repeat=arguments.repeat,
+    )
+    output = json.dumps(results, indent=2)
+    if arguments.output:
+        with open(arguments.output, "w") as destination:
+            destination.write(output)
+    print(output)
+
+
+if __name__ == "__main__":
+    main()
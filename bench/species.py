@@ -0,0 +1,133 @@
+"""
+Species fetch: pokepy (the full model of every language, version and nested
+resource), a plain `json` parse, and the streaming `SpeciesParser` that only
+keeps the name and the english flavor texts. Time per fetch and peak memory
+allocated per fetch, against the local pokeapi stand-in.
+
+    python -m bench.species [--output results.json] [--repeat 200]
+
+pokepy is a development requirement, only this benchmark uses it.
+"""
+from time import perf_counter
+import argparse
+import json
+import os
+import tracemalloc
+
+from bench import standins
+from bench.service import percentile
+
+NUMBERS = [1, 6, 25, 150]
+
+
+def pokepy_path(url):
+    import pokepy
+
+    class LocalClient(pokepy.V2Client):
+        class Meta(pokepy.V2Client.Meta):
+            base_url = url
+
+    client = LocalClient()
+
+    def fetch(pokemon_id):
+        from modules import pokedex
+
+        species = client.get_pokemon_species(pokemon_id)
+        # pokepy 0.6 returns a list of one resource
+        species = species[0] if isinstance(species, list) else species
+        description = max(
+            (
+                entry.flavor_text
+                for entry in species.flavor_text_entries
+                if entry.language.name == "en"
+            ),
+            key=len,
+        )
+        return species.name, pokedex._clean_description(description)
+
+    return fetch
+
+
+def json_path(url):
+    import requests
+
+    session = requests.Session()
+
+    def fetch(pokemon_id):
+        from modules import pokedex
+
+        species = session.get(f"{url}/pokemon-species/{pokemon_id}").json()
+        description = max(
+            (
+                entry["flavor_text"]
+                for entry in species["flavor_text_entries"]
+                if entry["language"]["name"] == "en"
+            ),
+            key=len,
+        )
+        return species["name"], pokedex._clean_description(description)
+
+    return fetch
+
+
+def streaming_path(url):
+    from modules import pokedex
+
+    return pokedex.fetch_pokemon_description
+
+
+def measure(fetch, repeat):
+    expected = fetch(NUMBERS[0])  # warm up imports and connections
+    timings = []
+    for attempt in range(repeat):
+        start = perf_counter()
+        fetch(NUMBERS[attempt % len(NUMBERS)])
+        timings.append(perf_counter() - start)
+
+    peaks = []
+    for number in NUMBERS:
+        tracemalloc.start()
+        fetch(number)
+        peaks.append(tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+    return expected, {
+        "mean_ms": sum(timings) / len(timings) * 1e3,
+        "p95_ms": percentile(timings, 0.95) * 1e3,
+        "peak_kib": max(peaks) / 1024,
+    }
+
+
+def run(repeat=200):
+    with standins.fake_upstreams() as upstreams:
+        os.environ.update(upstreams.environment)
+        url = upstreams.environment["POKEAPI_URL"]
+        payload_kib = len(json.dumps(standins.species_payload(NUMBERS[0]))) / 1024
+        paths = {
+            "pokepy": pokepy_path(url),
+            "json": json_path(url),
+            "streaming": streaming_path(url),
+        }
+        results = {"payload_kib": payload_kib}
+        answers = {}
+        for name, fetch in paths.items():
+            answers[name], results[name] = measure(fetch, repeat)
+    assert len(set(answers.values())) == 1, answers
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--output", help="write results as json to this file")
+    parser.add_argument("--repeat", type=int, default=200)
+    arguments = parser.parse_args()
+
+    results = run(arguments.repeat)
+    output = json.dumps(results, indent=2)
+    if arguments.output:
+        with open(arguments.output, "w") as destination:
+            destination.write(output)
+    print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,364 @@
+"""
+Local stand-ins for the services the API depends on, so benchmarks never
+touch the network: a fake pokeapi + funtranslations HTTP server, and an
+in-memory DynamoDB resource.
+
+Latency and error rates are configurable per upstream.
+"""
+from collections import Counter
+from contextlib import contextmanager
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from time import sleep
+from urllib.parse import parse_qs
+import json
+import os
+import random
+import re
+import threading
+
+SPECIES_COUNT = 1010
+FLAVOR_TEXT = (
+    "There is a plant seed on its back right from the day this {name} is "
+    "born.\nThe seed slowly grows larger.\fIt can go for days without eating."
+)
+WORDS = {"There": "Thither", "is": "is", "the": "the", "be": "beest", "sun": "travelling lamp"}
+LANGUAGES = ["ja-Hrkt", "ko", "zh-Hant", "fr", "de", "es", "it", "en", "ja", "zh-Hans"]
+VERSIONS = [
+    "red", "blue", "yellow", "gold", "silver", "crystal", "ruby", "sapphire",
+    "emerald", "firered", "leafgreen", "diamond", "pearl", "platinum",
+    "heartgold", "soulsilver", "black", "white", "black-2", "white-2", "x", "y",
+    "omega-ruby", "alpha-sapphire", "lets-go-pikachu", "lets-go-eevee", "sword",
+]
+SPECIES_PATH = re.compile(r"^/api/v2/pokemon-species/(?P<pokemon_id>[^/?]+)/?$")
+
+
+def species_name(number):
+    return f"pokemon{number}"
+
+
+def _resource(kind, name, number=1):
+    return {"name": name, "url": f"/api/v2/{kind}/{number}/"}
+
+
+def species_payload(number):
+    """
+    Same shape and (roughly) size as pokeapi's: every language, every game
+    version, and the nested resources the service never reads.
+    """
+    name = species_name(number)
+    flavor_text_entries = []
+    for version_number, version in enumerate(VERSIONS, 1):
+        for language_number, language in enumerate(LANGUAGES, 1):
+            if language == "en":
+                text = FLAVOR_TEXT.format(name=name) * (1 + (number + version_number) % 3)
+            else:
+                text = f"{name} ({language}) " * 8
+            flavor_text_entries.append(
+                {
+                    "flavor_text": text,
+                    "language": _resource("language", language, language_number),
+                    "version": _resource("version", version, version_number),
+                }
+            )
+    return {
+        "id": number,
+        "name": name,
+        "order": number,
+        "base_happiness": 70,
+        "capture_rate": 45,
+        "color": _resource("pokemon-color", "green", 5),
+        "egg_groups": [_resource("egg-group", "monster", 1), _resource("egg-group", "plant", 7)],
+        "evolution_chain": {"url": f"/api/v2/evolution-chain/{number}/"},
+        "evolves_from_species": None,
+        "flavor_text_entries": flavor_text_entries,
+        "form_descriptions": [],
+        "forms_switchable": False,
+        "gender_rate": 1,
+        "genera": [
+            {"genus": f"{name} genus", "language": _resource("language", language, n)}
+            for n, language in enumerate(LANGUAGES, 1)
+        ],
+        "generation": _resource("generation", "generation-i", 1),
+        "growth_rate": _resource("growth-rate", "medium-slow", 4),
+        "habitat": _resource("pokemon-habitat", "grassland", 3),
+        "has_gender_differences": False,
+        "hatch_counter": 20,
+        "is_baby": False,
+        "is_legendary": False,
+        "is_mythical": False,
+        "names": [
+            {"name": f"{name}-{language}", "language": _resource("language", language, n)}
+            for n, language in enumerate(LANGUAGES, 1)
+        ],
+        "pal_park_encounters": [
+            {"area": _resource("pal-park-area", "field", 2), "base_score": 50, "rate": 30}
+        ],
+        "pokedex_numbers": [
+            {"entry_number": number, "pokedex": _resource("pokedex", pokedex, n)}
+            for n, pokedex in enumerate(["national", "kanto", "original-johto", "updated-kanto"], 1)
+        ],
+        "shape": _resource("pokemon-shape", "quadruped", 8),
+        "varieties": [{"is_default": True, "pokemon": _resource("pokemon", name, number)}],
+    }
+
+
+@lru_cache(maxsize=None)
+def species_body(number):
+    """
+    Rendered once, so serving it costs (and allocates) next to nothing.
+    """
+    return json.dumps(species_payload(number)).encode()
+
+
+def species_list_payload():
+    return {
+        "count": SPECIES_COUNT,
+        "results": [
+            {
+                "name": species_name(number),
+                "url": f"/api/v2/pokemon-species/{number}/",
+            }
+            for number in range(1, SPECIES_COUNT + 1)
+        ],
+    }
+
+
+class Upstream:
+    def __init__(self, latency=0.0, error_rate=0.0):
+        """
+        Behaviour of one fake upstream: `latency` seconds per response, and
+        the fraction of responses that are errors.
+        """
+        self.latency = latency
+        self.error_rate = error_rate
+
+
+class FakeUpstreams:
+    def __init__(self, pokeapi=None, funtranslations=None, seed=0):
+        """
+        Fake pokeapi and funtranslations, served by one threaded HTTP server.
+        `calls` counts requests per upstream.
+        """
+        self.pokeapi = pokeapi or Upstream()
+        self.funtranslations = funtranslations or Upstream()
+        self.calls = Counter()
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.server = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address
+        return f"http://{host}:{port}"
+
+    @property
+    def environment(self):
+        """
+        Environment variables that point the service at the stand-ins.
+        """
+        return {
+            "POKEAPI_URL": f"{self.url}/api/v2",
+            "FUNTRANSLATIONS_URL": f"{self.url}/translate/shakespeare.json",
+        }
+
+    def _fails(self, upstream):
+        with self.lock:
+            return self.random.random() < upstream.error_rate
+
+    def handle(self, method, path, body):
+        """
+        `(status, payload)` for a request.
+        """
+        if path.startswith("/api/v2/"):
+            upstream, name = self.pokeapi, "pokeapi"
+        else:
+            upstream, name = self.funtranslations, "funtranslations"
+        with self.lock:
+            self.calls[name] += 1
+        if upstream.latency:
+            sleep(upstream.latency)
+        if self._fails(upstream):
+            if name == "funtranslations":
+                return 429, {"error": {"code": 429, "message": "Too Many Requests"}}
+            return 500, {"detail": "Internal Server Error"}
+
+        if method == "POST" and path == "/translate/shakespeare.json":
+            text = parse_qs(body)["text"][0]
+            translated = " ".join(WORDS.get(word, word) for word in text.split(" "))
+            return 200, {"contents": {"translated": translated, "text": text}}
+        if path.startswith("/api/v2/pokemon-species/?") or path == "/api/v2/pokemon-species/":
+            return 200, species_list_payload()
+        match = SPECIES_PATH.match(path)
+        if match:
+            pokemon_id = match.group("pokemon_id")
+            if pokemon_id.isdecimal():
+                number = int(pokemon_id)
+            else:
+                number = int(pokemon_id[len("pokemon") :] or 0)
+            if 0 < number <= SPECIES_COUNT:
+                return 200, species_body(number)
+        return 404, {"detail": "Not Found"}
+
+    def start(self):
+        upstreams = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # keep-alive, like the real ones
+
+            def _respond(self, method):
+                length = int(self.headers.get("Content-Length") or 0)
+                body = self.rfile.read(length).decode() if length else ""
+                status, payload = upstreams.handle(method, self.path, body)
+                if isinstance(payload, bytes):
+                    content = payload
+                else:
+                    content = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+
+            def do_GET(self):
+                self._respond("GET")
+
+            def do_POST(self):
+                self._respond("POST")
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@contextmanager
+def fake_upstreams(**kwargs):
+    upstreams = FakeUpstreams(**kwargs).start()
+    try:
+        yield upstreams
+    finally:
+        upstreams.stop()
+
+
+class InMemoryTable:
+    def __init__(self, name, latency=0.0):
+        """
+        The subset of a boto3 DynamoDB Table the cache uses, `latency` seconds
+        per round trip.
+        """
+        self.name = name
+        self.latency = latency
+        self.items = {}
+        self.calls = Counter()
+        self.lock = threading.Lock()
+
+    def _round_trip(self, operation):
+        with self.lock:
+            self.calls[operation] += 1
+        if self.latency:
+            sleep(self.latency)
+
+    def get_item(self, Key, **kwargs):
+        self._round_trip("get_item")
+        item = self.items.get(Key["key"])
+        return {"Item": dict(item)} if item else {}
+
+    def put_item(self, Item, **kwargs):
+        self._round_trip("put_item")
+        self.items[Item["key"]] = dict(Item)
+        return {}
+
+
+class InMemoryDynamoDB:
+    def __init__(self, latency=0.0):
+        """
+        The subset of a boto3 DynamoDB resource the cache uses.
+        """
+        self.latency = latency
+        self.tables = {}
+
+    def Table(self, name):
+        if name not in self.tables:
+            self.tables[name] = InMemoryTable(name, self.latency)
+        return self.tables[name]
+
+    def batch_get_item(self, RequestItems, **kwargs):
+        responses = {}
+        for name, request in RequestItems.items():
+            table = self.Table(name)
+            table._round_trip("batch_get_item")
+            responses[name] = [
+                dict(table.items[key["key"]])
+                for key in request["Keys"]
+                if key["key"] in table.items
+            ]
+        return {"Responses": responses, "UnprocessedKeys": {}}
+
+    def batch_write_item(self, RequestItems, **kwargs):
+        for name, requests in RequestItems.items():
+            table = self.Table(name)
+            table._round_trip("batch_write_item")
+            for request in requests:
+                item = request["PutRequest"]["Item"]
+                table.items[item["key"]] = dict(item)
+        return {"UnprocessedItems": {}}
+
+    @property
+    def calls(self):
+        calls = Counter()
+        for table in self.tables.values():
+            calls.update(table.calls)
+        return calls
+
+    def clear(self):
+        for table in self.tables.values():
+            table.items.clear()
+
+
+ENVIRONMENT = {
+    "CACHE_TABLE": "bench",
+    "DUMMY": "false",
+    "AWS_DEFAULT_REGION": "eu-west-1",
+    "TRANSLATION_QUOTA": "1000000000",  # the stand-in has no quota
+    "SPECIES_INDEX": "/nonexistent/species.txt",  # measure the fetched index
+    "POKEDEX_BUNDLE": "/nonexistent/pokedex.sqlite",  # and the pokeapi path
+}
+
+
+def install(upstreams, dynamodb):
+    """
+    Points the service at the stand-ins and returns `(APP, caches)`. Must run
+    before anything imports `main`, the upstream urls are read at import.
+    """
+    os.environ.update(ENVIRONMENT)
+    os.environ.update(upstreams.environment)
+    import main
+    from controller import pokedex as controller
+
+    caches = {
+        "descriptions": controller.DESCRIPTIONS,
+        "translations": controller.TRANSLATIONS,
+    }
+    # shared by every cache, possibly behind a write-behind buffer
+    backend = getattr(controller.BACKEND, "backend", controller.BACKEND)
+    backend.dynamodb = dynamodb
+    backend.table = dynamodb.Table(backend.table_name)
+    return main.APP, caches
+
+
+def reset(caches, dynamodb):
+    """
+    Back to a cold service: empty memory tiers, table and counters.
+    """
+    for cache in caches.values():
+        cache.memory.clear()
+        cache.counters.clear()
+    dynamodb.clear()
@@ -3,6 +3,11 @@ import re
 import urllib
 
 from pytest import fixture
+import httpx
+import requests_mock as requests_mock_module
+import respx
+
+from modules import shakespeare
 
 SHAKESPEAREAN_TRANSLATION_CASES = {
     "There is a seed on its back. By soaking up the sun’s rays, the seed...": "Thither is a seed on its back. By soaking up the travelling lamp’s rays, the seed.",
@@ -48,8 +53,38 @@ POKE_API_CHARIZARD = {
 }
 
 
+POKE_API_SPECIES_LIST = {
+    "count": 6,
+    "results": [
+        {"name": name, "url": f"https://pokeapi.co/api/v2/pokemon-species/{number}/"}
+        for number, name in enumerate(
+            [
+                "bulbasaur",
+                "ivysaur",
+                "venusaur",
+                "charmander",
+                "charmeleon",
+                "charizard",
+            ],
+            1,
+        )
+    ],
+}
+
+
+@fixture(autouse=True)
+def translation_quota(monkeypatch):
+    """
+    A fresh, generous, funtranslations quota for every test.
+    """
+    scheduler = shakespeare.TranslationScheduler(shakespeare.TokenBucket(100, 3600))
+    scheduler.on_translated = shakespeare.SCHEDULER.on_translated
+    monkeypatch.setattr(shakespeare, "SCHEDULER", scheduler)
+    return scheduler
+
+
 @fixture
-def mock_network(requests_mock):
+def mock_network(requests_mock, mock_async_network):
 
     # Funtranslations Server
     def shakespeare_callback(request, context):
@@ -67,6 +102,10 @@ def mock_network(requests_mock):
     )
 
     # PokeAPI Server
+    requests_mock.get(
+        "https://pokeapi.co/api/v2/pokemon-species/?limit=100000",
+        text=json.dumps(POKE_API_SPECIES_LIST),
+    )
     requests_mock.get(
         "https://pokeapi.co/api/v2/pokemon-species/not_a_pokemon",
         text="Not Found",
@@ -92,6 +131,47 @@ def mock_network(requests_mock):
     )
 
     # Test Server
-    requests_mock.get(re.compile(r"^http://testserver/.*"), real_http=True)
+    requests_mock.register_uri(
+        requests_mock_module.ANY, re.compile(r"^http://testserver/.*"), real_http=True
+    )
 
     return requests_mock
+
+
+@fixture
+def mock_async_network():
+    """
+    Same servers as `mock_network`, for the async (httpx) clients.
+    """
+    router = respx.mock(assert_all_called=False)
+
+    def shakespeare_callback(request):
+        text = request.content.decode()
+        text = text[len("text=") :]
+        text = urllib.parse.unquote_plus(text)
+        translated = SHAKESPEAREAN_TRANSLATION_CASES[text]
+        return httpx.Response(200, json={"contents": {"translated": translated}})
+
+    router.post(
+        "https://api.funtranslations.com/translate/shakespeare.json",
+    ).mock(side_effect=shakespeare_callback)
+
+    router.get(
+        "https://pokeapi.co/api/v2/pokemon-species/?limit=100000",
+    ).mock(return_value=httpx.Response(200, json=POKE_API_SPECIES_LIST))
+
+    species = {
+        "1": POKE_API_1,
+        "bulbasaur": POKE_API_1,
+        "charizard": POKE_API_CHARIZARD,
+    }
+    for pokemon_id, payload in species.items():
+        router.get(
+            f"https://pokeapi.co/api/v2/pokemon-species/{pokemon_id}",
+        ).mock(return_value=httpx.Response(200, json=payload))
+    router.get(
+        "https://pokeapi.co/api/v2/pokemon-species/not_a_pokemon",
+    ).mock(return_value=httpx.Response(404, text="Not Found"))
+
+    with router:
+        yield router
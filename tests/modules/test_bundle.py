@@ -0,0 +1,67 @@
+import asyncio
+
+from pytest import fixture, raises
+
+from modules import bundle, pokedex
+
+
+@fixture
+def shipped_bundle(tmp_path, monkeypatch):
+    path = str(tmp_path / "pokedex.sqlite")
+    bundle.write_bundle(
+        path,
+        [(6, "charizard", "It spits fire that is hot enough to melt boulders.")],
+    )
+    monkeypatch.setattr(bundle, "BUNDLE_PATH", path)
+    monkeypatch.setattr(bundle, "_BUNDLE", None)
+    return path
+
+
+def test_bundle__lookup(shipped_bundle):
+    shipped = bundle.Bundle(shipped_bundle)
+
+    assert shipped.lookup("charizard") == (
+        "charizard",
+        "It spits fire that is hot enough to melt boulders.",
+    )
+    assert shipped.lookup("6")[0] == "charizard"
+    with raises(KeyError):
+        shipped.lookup("bulbasaur")
+    with raises(KeyError):
+        shipped.lookup("²")
+
+
+def test_get_pokemon_description__from_bundle(shipped_bundle, mock_network):
+    name, description = pokedex.get_pokemon_description("charizard")
+
+    assert name == "charizard"
+    assert description == "It spits fire that is hot enough to melt boulders."
+    assert mock_network.call_count == 0
+
+
+def test_get_pokemon_description__not_in_bundle(shipped_bundle, mock_network):
+    name, _ = pokedex.get_pokemon_description("1")
+
+    assert name == "bulbasaur"
+    assert mock_network.call_count == 1
+
+
+def test_get_pokemon_description_async__from_bundle(
+    shipped_bundle, mock_async_network
+):
+    name, _ = asyncio.run(pokedex.get_pokemon_description_async("6"))
+
+    assert name == "charizard"
+    assert mock_async_network.calls.call_count == 0
+
+
+def test_build(tmp_path, mock_async_network):
+    index_path = str(tmp_path / "species.txt")
+    path = str(tmp_path / "pokedex.sqlite")
+    pokedex.SpeciesIndex(["bulbasaur"]).dump(index_path)
+
+    assert bundle.build(path, index_path) == 1
+    assert bundle.Bundle(path).lookup("1") == (
+        "bulbasaur",
+        "There is a seed on its back. By soaking up the sun’s rays, the seed...",
+    )
@@ -0,0 +1,201 @@
+from time import sleep, time
+
+from pytest import fixture, raises
+
+from modules import cache_backends, dynamo_cache
+
+
+def item(key, blob=b"\x01\x00value", ttl=60, fresh=None):
+    expires = time() + ttl
+    return {"key": key, "blob": blob, "ttl": expires, "fresh": fresh or expires}
+
+
+@fixture
+def backend(tmp_path):
+    return cache_backends.SQLiteBackend(str(tmp_path / "cache.sqlite"), "test-table")
+
+
+def test_sqlite__put_get(backend):
+    backend.put(item("a"))
+
+    assert backend.get("a")["blob"] == b"\x01\x00value"
+    assert backend.get("b") is None
+
+
+def test_sqlite__expired_items_are_not_returned(backend):
+    backend.put_many([item("expired", ttl=-1), item("live")])
+
+    assert backend.get("expired") is None
+    assert list(backend.get_many(["expired", "live", "missing"])) == ["live"]
+
+    backend.purge()
+
+    count = backend._connect().execute(f"SELECT count(*) FROM {backend.table_name}")
+    assert count.fetchone() == (1,)
+
+
+def test_sqlite__get_many_in_batches(backend, monkeypatch):
+    monkeypatch.setattr(cache_backends, "SQLITE_BATCH_SIZE", 3)
+    backend.put_many([item(str(number)) for number in range(10)])
+
+    items = backend.get_many([str(number) for number in range(12)])
+
+    assert sorted(items) == sorted(str(number) for number in range(10))
+
+
+def test_sqlite__shared_file(backend):
+    other = cache_backends.SQLiteBackend(backend.path, "test-table")
+
+    backend.put(item("a", blob=b"first"))
+    other.put(item("a", blob=b"second"))
+
+    assert backend.get("a")["blob"] == b"second"
+
+
+def test_sqlite__put_if(backend):
+    other = cache_backends.SQLiteBackend(backend.path, "test-table")
+
+    assert backend.put_if(item("a", blob=b"first"), None)
+    assert not other.put_if(item("a", blob=b"other"), None)
+    assert other.put_if(item("a", blob=b"second"), b"first")
+    assert not backend.put_if(item("a", blob=b"third"), b"first")
+    assert backend.get("a")["blob"] == b"second"
+
+    backend.put(item("expired", ttl=-1))
+    assert backend.put_if(item("expired"), None)
+
+
+def test_cache__update_merges_concurrent_writes(backend):
+    cache = dynamo_cache.Cache(ttl=60, backend=backend, memory_items=0)
+    other = dynamo_cache.Cache(ttl=60, backend=backend, memory_items=0)
+    calls = []
+
+    def add_one(value):
+        calls.append(value)
+        if len(calls) == 1:  # another process writes in between
+            other.update("counter", lambda value: (value or 0) + 10)
+        return (value or 0) + 1
+
+    assert cache.update("counter", add_one) == 11
+    assert calls == [None, 10]
+    assert cache.get("counter") == 11
+
+
+def test_cache__sqlite_backend(backend):
+    cache = dynamo_cache.Cache(ttl=60, soft_ttl=30, backend=backend)
+    cache.put("key", ("name", "description"))
+    cache.memory.clear()
+
+    assert cache.get("key") == ("name", "description")
+    assert cache.counters[("cache_hit", "sqlite")] == 1
+    assert 0 < cache.freshness("key") <= 30
+    with raises(KeyError):
+        cache.get("missing")
+    assert cache.counters[("cache_miss", "sqlite")] == 1
+
+
+def test_get_backend(tmp_path):
+    backend = cache_backends.get_backend("dynamodb", "test")
+    assert isinstance(backend, cache_backends.DynamoDBBackend)
+    assert backend.table_name == "test"
+
+    path = str(tmp_path / "cache.sqlite")
+    assert isinstance(
+        cache_backends.get_backend("sqlite", "test", path), cache_backends.SQLiteBackend
+    )
+    with raises(ValueError):
+        cache_backends.get_backend("redis", "test")
+
+
+class RecordingBackend(cache_backends.Backend):
+    tier = "recording"
+
+    def __init__(self, failures=0):
+        self.items = {}
+        self.batches = []
+        self.failures = failures
+
+    def get(self, key):
+        return self.items.get(key)
+
+    def put_many(self, items):
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError("unreachable")
+        self.batches.append([item["key"] for item in items])
+        self.items.update({item["key"]: item for item in items})
+
+
+def test_write_behind__coalesces_and_reads_buffered():
+    backend = RecordingBackend()
+    buffered = cache_backends.WriteBehindBackend(backend, delay=60)
+
+    buffered.put(item("a", blob=b"first"))
+    buffered.put(item("a", blob=b"second"))
+
+    assert backend.batches == []
+    assert buffered.get("a")["blob"] == b"second"
+    assert buffered.flush() == 1
+    assert backend.batches == [["a"]]
+    assert len(buffered) == 0
+    assert buffered.get("a")["blob"] == b"second"
+
+
+def test_write_behind__batches_of_25():
+    backend = RecordingBackend()
+    buffered = cache_backends.WriteBehindBackend(backend, delay=60)
+    buffered.wake.set = lambda: None  # no background flush
+
+    buffered.put_many([item(str(number)) for number in range(60)])
+
+    assert buffered.flush() == 60
+    assert [len(batch) for batch in backend.batches] == [25, 25, 10]
+
+
+def test_write_behind__flushes_in_the_background_once_a_batch_is_full():
+    backend = RecordingBackend()
+    buffered = cache_backends.WriteBehindBackend(backend, delay=60)
+
+    buffered.put_many([item(str(number)) for number in range(25)])
+
+    for _ in range(100):
+        if backend.batches:
+            break
+        sleep(0.01)
+    assert len(backend.batches[0]) == 25
+
+
+def test_write_behind__failed_batches_stay_buffered():
+    backend = RecordingBackend(failures=1)
+    buffered = cache_backends.WriteBehindBackend(backend, delay=60, max_items=3)
+
+    buffered.put_many([item("a"), item("b")])
+    with raises(ConnectionError):
+        buffered.flush()
+    buffered.put_many([item("c"), item("d")])
+
+    assert list(buffered.buffer) == ["b", "c", "d"]  # the oldest put dropped
+    assert buffered.flush() == 3
+
+
+def test_dynamodb__put_many_resends_unprocessed_items():
+    class DynamoDB:
+        def __init__(self):
+            self.requests = []
+
+        def batch_write_item(self, RequestItems):
+            requests = RequestItems["test"]
+            self.requests.append(len(requests))
+            if len(self.requests) == 1:
+                return {"UnprocessedItems": {"test": requests[:2]}}
+            return {"UnprocessedItems": {}}
+
+    class Table:
+        name = "test"
+
+    backend = cache_backends.DynamoDBBackend("test", DynamoDB())
+    backend.table = Table()
+
+    backend.put_many([item(str(number % 30)) for number in range(40)])
+
+    assert backend.dynamodb.requests == [25, 2, 5]
@@ -0,0 +1,76 @@
+from pytest import approx
+
+from modules.cache_stats import CacheStats, Histogram
+
+
+class RecordingMetrics:
+    def __init__(self):
+        self.gauges = []
+
+    def gauge(self, name, value, tags=None):
+        self.gauges.append((name, value, tags))
+
+
+def test_histogram__percentiles():
+    histogram = Histogram()
+    for value in range(1, 1001):
+        histogram.record(value)
+    histogram.record(0)
+
+    assert histogram.count == 1001
+    assert histogram.maximum == 1000
+    assert histogram.percentile(0.5) == approx(500, rel=0.19)
+    assert histogram.percentile(0.99) == approx(990, rel=0.19)
+    assert histogram.percentile(0) == 0
+
+
+def test_histogram__empty():
+    assert Histogram().summary() == {
+        "count": 0, "mean": 0.0, "p50": 0.0, "p95": 0.0, "p99": 0.0, "max": 0.0
+    }
+
+
+def test_cache_stats__snapshot():
+    stats = CacheStats(hot_keys=2, sample=1)
+    for key in ["bulbasaur", "bulbasaur", "bulbasaur", "charizard", "charizard", "pikachu"]:
+        stats.requested(key)
+    stats.count("cache_hit", "memory")
+    stats.count("cache_miss", "memory")
+    stats.count("cache_hit", "dynamodb")
+    stats.count("cache_stale", None)
+    stats.got(0.002)
+    stats.stored(300)
+
+    snapshot = stats.snapshot()
+
+    assert snapshot["hot_keys"] == [("bulbasaur", 3), ("charizard", 2)]
+    assert snapshot["tiers"] == {
+        "dynamodb": {"hits": 1, "misses": 0, "ratio": 1.0},
+        "memory": {"hits": 1, "misses": 1, "ratio": 0.5},
+    }
+    assert snapshot["get_latency"]["max"] == approx(2)
+    assert snapshot["item_size"]["count"] == 1
+
+
+def test_cache_stats__sampled_hot_keys():
+    stats = CacheStats(hot_keys=1, sample=8)
+    for _ in range(80):
+        stats.requested("bulbasaur")
+
+    assert stats.snapshot()["hot_keys"] == [("bulbasaur", 80)]
+
+
+def test_cache_stats__publish_starts_over():
+    stats = CacheStats()
+    metrics = RecordingMetrics()
+    stats.count("cache_hit", "memory")
+    stats.put(0.001)
+
+    stats.publish(metrics, ["namespace:test"])
+
+    assert ("cache_hit_ratio", 1.0, ["namespace:test", "tier:memory"]) in metrics.gauges
+    assert (
+        "cache_put_latency", approx(1), ["namespace:test", "statistic:max"]
+    ) in metrics.gauges
+    assert stats.snapshot()["tiers"] == {}
+    assert stats.snapshot()["put_latency"]["count"] == 0
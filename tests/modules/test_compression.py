@@ -0,0 +1,111 @@
+import gzip
+
+from pytest import mark
+from starlette.responses import JSONResponse
+from starlette.testclient import TestClient
+
+from modules import compression
+
+BODY = {"description": "Thither is a seed on its back. " * 40}
+
+
+def app(response):
+    async def asgi(scope, receive, send):
+        await response(scope, receive, send)
+
+    return compression.CompressionMiddleware(asgi, minimum_size=100)
+
+
+@mark.parametrize(
+    "accept_encoding, encoding",
+    [
+        ("gzip, deflate", "gzip"),
+        ("br;q=0.5, gzip;q=0.8", "gzip"),
+        ("gzip;q=0, *", "br"),
+        ("identity", None),
+        ("*;q=0", None),
+        (None, None),
+    ],
+)
+def test_negotiate(accept_encoding, encoding, monkeypatch):
+    monkeypatch.setattr(compression, "ENCODINGS", ("br", "gzip"))
+
+    assert compression.negotiate(accept_encoding) == encoding
+
+
+def test_negotiate__without_brotli(monkeypatch):
+    monkeypatch.setattr(compression, "ENCODINGS", ("gzip",))
+
+    assert compression.negotiate("br") is None
+    assert compression.negotiate("br, gzip") == "gzip"
+
+
+def test_middleware__compresses():
+    response = JSONResponse(BODY, headers={"ETag": '"abc"'})
+    client = TestClient(app(response))
+
+    response = client.get("/", headers={"Accept-Encoding": "gzip"})
+
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert response.headers["Vary"] == "Accept-Encoding"
+    assert response.headers["ETag"] == 'W/"abc"'
+    assert int(response.headers["Content-Length"]) < len(str(BODY))
+    assert response.json() == BODY
+
+
+def test_middleware__identity():
+    client = TestClient(app(JSONResponse(BODY)))
+
+    response = client.get("/", headers={"Accept-Encoding": "identity"})
+
+    assert "Content-Encoding" not in response.headers
+    assert response.headers["Vary"] == "Accept-Encoding"
+    assert response.json() == BODY
+
+
+def test_middleware__small_bodies_are_left_alone():
+    client = TestClient(app(JSONResponse({"name": "bulbasaur"})))
+
+    response = client.get("/", headers={"Accept-Encoding": "gzip"})
+
+    assert "Content-Encoding" not in response.headers
+    assert "Vary" not in response.headers
+
+
+def test_middleware__streams():
+    async def lines(scope, receive, send):
+        headers = [(b"content-type", b"application/x-ndjson")]
+        await send({"type": "http.response.start", "status": 200, "headers": headers})
+        for number in range(3):
+            body = f'{{"id": {number}}}\n'.encode()
+            await send({"type": "http.response.body", "body": body, "more_body": True})
+        await send({"type": "http.response.body", "body": b""})
+
+    client = TestClient(compression.CompressionMiddleware(lines))
+
+    response = client.get("/", headers={"Accept-Encoding": "gzip"})
+
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert "Content-Length" not in response.headers
+    assert response.text.splitlines() == ['{"id": 0}', '{"id": 1}', '{"id": 2}']
+
+
+def test_precompress__once_per_key(monkeypatch):
+    compressed = []
+    compress = compression.compress
+
+    def counting(body, encoding, best=False):
+        compressed.append(encoding)
+        return compress(body, encoding, best)
+
+    monkeypatch.setattr(compression, "compress", counting)
+    monkeypatch.setattr(compression, "PRECOMPRESSED", compression.MemoryCache())
+
+    for _ in range(3):
+        response = compression.precompress(JSONResponse(BODY), '"key"', "gzip", 100)
+
+    assert compressed == ["gzip"]
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert gzip.decompress(response.body) == JSONResponse(BODY).body
+    small = compression.precompress(JSONResponse({}), '"small"', "gzip", 100)
+    assert "Content-Encoding" not in small.headers
@@ -0,0 +1,116 @@
+from time import sleep
+import asyncio
+
+from pytest import raises
+
+from modules import deadline
+
+
+class FlakyError(ConnectionError):
+    pass
+
+
+def test_budget__nests_within_the_enclosing_one():
+    assert deadline.remaining() is None
+    with deadline.budget(0.5):
+        with deadline.budget(10):
+            assert deadline.remaining() <= 0.5
+            assert deadline.timeout(3) <= 0.5
+        assert deadline.timeout(0.1) == 0.1
+    assert deadline.remaining() is None
+
+
+def test_timeout__nothing_left():
+    with deadline.budget(0):
+        with raises(deadline.DeadlineExceeded):
+            deadline.timeout(3)
+
+
+def test_hop__timeouts_past_the_budget_are_deadline_exceeded():
+    with deadline.budget(0.01):
+        with raises(deadline.DeadlineExceeded):
+            with deadline.hop(3):
+                sleep(0.02)
+                raise TimeoutError()
+
+
+def test_retry__only_transient_errors():
+    calls = []
+
+    def flaky():
+        calls.append(1)
+        if len(calls) < 3:
+            raise FlakyError()
+        return "ok"
+
+    def broken():
+        calls.append(1)
+        raise ValueError()
+
+    assert deadline.retry(flaky, backoff=0) == "ok"
+    calls.clear()
+    with raises(ValueError):
+        deadline.retry(broken, backoff=0)
+    assert len(calls) == 1
+
+
+def trained_tracker(latency=0.01):
+    tracker = deadline.LatencyTracker(minimum=0)
+    for _ in range(tracker.samples):
+        tracker.record(latency)
+    return tracker
+
+
+def test_hedged__duplicate_wins():
+    delays = [1, 0]
+
+    async def lookup():
+        await asyncio.sleep(delays.pop(0))
+        return "found"
+
+    async def run():
+        start = asyncio.get_running_loop().time()
+        result = await deadline.hedged(lookup, trained_tracker())
+        return result, asyncio.get_running_loop().time() - start
+
+    result, elapsed = asyncio.run(run())
+
+    assert result == "found"
+    assert elapsed < 0.5
+
+
+def test_hedged__retries_transient_errors():
+    calls = []
+
+    async def lookup():
+        calls.append(1)
+        if len(calls) == 1:
+            raise FlakyError()
+        return "found"
+
+    assert asyncio.run(deadline.hedged(lookup, deadline.LatencyTracker())) == "found"
+    assert len(calls) == 2
+
+
+def test_hedged__raises_other_errors():
+    calls = []
+
+    async def lookup():
+        calls.append(1)
+        raise KeyError("missing")
+
+    with raises(KeyError):
+        asyncio.run(deadline.hedged(lookup, deadline.LatencyTracker()))
+    assert len(calls) == 1
+
+
+def test_hedged__budget():
+    async def hung():
+        await asyncio.sleep(10)
+
+    async def run():
+        with deadline.budget(0.05):
+            await deadline.hedged(hung, trained_tracker())
+
+    with raises(deadline.DeadlineExceeded):
+        asyncio.run(run())
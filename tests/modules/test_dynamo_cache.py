@@ -0,0 +1,504 @@
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+from time import sleep, time
+import asyncio
+import json
+import threading
+
+from pytest import fixture, raises
+
+from modules import deadline, dynamo_cache
+from modules.dynamo_cache import function_key, make_hasheable
+
+
+class FakeTable:
+    name = "test"
+
+    def __init__(self):
+        self.items = {}
+        self.calls = []
+
+    def get_item(self, Key):
+        self.calls.append("get_item")
+        item = self.items.get(Key["key"])
+        return {"Item": item} if item else {}
+
+    def put_item(self, Item):
+        self.calls.append("put_item")
+        self.items[Item["key"]] = Item
+        return {}
+
+
+class FakeDynamoDB:
+    def __init__(self, table):
+        self.table = table
+
+    def batch_get_item(self, RequestItems):
+        self.table.calls.append("batch_get_item")
+        keys = RequestItems[self.table.name]["Keys"]
+        assert len(keys) <= 100
+        items = [self.table.items[key["key"]] for key in keys if key["key"] in self.table.items]
+        return {"Responses": {self.table.name: items}, "UnprocessedKeys": {}}
+
+    def batch_write_item(self, RequestItems):
+        self.table.calls.append("batch_write_item")
+        requests = RequestItems[self.table.name]
+        assert len(requests) <= 25
+        for request in requests:
+            item = request["PutRequest"]["Item"]
+            self.table.items[item["key"]] = item
+        return {"UnprocessedItems": {}}
+
+
+@fixture
+def cache():
+    cache = dynamo_cache.Cache(table_name="test", ttl=60)
+    cache.table = cache.backend.table = FakeTable()
+    cache.backend.dynamodb = FakeDynamoDB(cache.table)
+    return cache
+
+
+def test_memory_cache__evicts_by_count():
+    memory = dynamo_cache.MemoryCache(max_items=2)
+    expires = time() + 60
+
+    memory.put("a", "1", expires)
+    memory.put("b", "2", expires)
+    memory.get("a")
+    memory.put("c", "3", expires)
+
+    assert memory.get("a") == "1"
+    assert memory.get("c") == "3"
+    with raises(KeyError):
+        memory.get("b")
+
+
+def test_memory_cache__evicts_by_size():
+    memory = dynamo_cache.MemoryCache(max_size=10)
+    expires = time() + 60
+
+    memory.put("a", "12345", expires)
+    memory.put("b", "123456", expires)
+    memory.put("c", "12345678901", expires)
+
+    assert len(memory) == 1
+    assert memory.size == 6
+    assert memory.get("b") == "123456"
+
+
+def test_memory_cache__expires():
+    memory = dynamo_cache.MemoryCache()
+
+    memory.put("a", "1", time() - 1)
+
+    with raises(KeyError):
+        memory.get("a")
+    assert len(memory) == 0
+
+
+def test_cache__put_fills_memory(cache):
+    cache.put("key", ["bulbasaur", "a seed"])
+
+    assert cache.get("key") == ["bulbasaur", "a seed"]
+    assert cache.table.calls == ["put_item"]
+    assert cache.counters[("cache_hit", "memory")] == 1
+
+
+def test_cache__dynamodb_hit_fills_memory(cache):
+    cache.put("key", ["bulbasaur", "a seed"])
+    cache.memory.clear()
+
+    assert cache.get("key") == ["bulbasaur", "a seed"]
+    assert cache.get("key") == ["bulbasaur", "a seed"]
+    assert cache.table.calls == ["put_item", "get_item"]
+    assert cache.counters[("cache_miss", "memory")] == 1
+    assert cache.counters[("cache_hit", "dynamodb")] == 1
+    assert cache.counters[("cache_hit", "memory")] == 1
+
+
+def test_cache__expired_dynamodb_item_is_a_miss(cache):
+    cache.put("key", "value")
+    cache.memory.clear()
+    cache.table.items[cache.item_key("key")]["ttl"] = time() - 1
+
+    with raises(KeyError):
+        cache.get("key")
+    assert cache.counters[("cache_miss", "dynamodb")] == 1
+
+
+def test_cache__decorator(cache):
+    calls = []
+
+    @cache
+    def double(number):
+        calls.append(number)
+        return number * 2
+
+    assert double(2) == 4
+    assert double(2) == 4
+    assert calls == [2]
+    assert cache.table.calls == ["get_item", "put_item"]
+
+
+def test_cache__async_decorator(cache):
+    calls = []
+
+    @cache
+    async def double(number):
+        calls.append(number)
+        return number * 2
+
+    assert asyncio.run(double(2)) == 4
+    assert asyncio.run(double(2)) == 4
+    assert calls == [2]
+    assert cache.table.calls == ["get_item", "put_item"]
+
+
+def test_single_flight__threads():
+    flight = dynamo_cache.SingleFlight()
+    release = threading.Event()
+    calls = []
+
+    def slow(number):
+        calls.append(number)
+        release.wait(5)
+        return number * 2
+
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        futures = [pool.submit(flight.do, "key", slow, 2) for _ in range(4)]
+        while flight.coalesced < 3:
+            sleep(0.001)
+        release.set()
+        results = [future.result() for future in futures]
+
+    assert results == [4, 4, 4, 4]
+    assert calls == [2]
+    assert flight.coalesced == 3
+
+
+def test_single_flight__threads_share_errors():
+    flight = dynamo_cache.SingleFlight()
+    release = threading.Event()
+
+    def failing():
+        release.wait(5)
+        raise ValueError("upstream is down")
+
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        futures = [pool.submit(flight.do, "key", failing) for _ in range(2)]
+        while flight.coalesced < 1:
+            sleep(0.001)
+        release.set()
+        for future in futures:
+            with raises(ValueError):
+                future.result()
+
+
+def test_single_flight__cancelled_leader():
+    flight = dynamo_cache.SingleFlight()
+    calls = []
+
+    async def slow(number):
+        calls.append(number)
+        await asyncio.sleep(0.01)
+        return number * 2
+
+    async def run():
+        leader = asyncio.ensure_future(flight.ado("key", slow, 2))
+        await asyncio.sleep(0)
+        followers = [asyncio.ensure_future(flight.ado("key", slow, 2)) for _ in range(3)]
+        await asyncio.sleep(0)
+        leader.cancel()
+        with raises(asyncio.CancelledError):
+            await leader
+        return await asyncio.gather(*followers)
+
+    assert asyncio.run(run()) == [4, 4, 4]
+    assert calls == [2, 2]
+
+
+def test_cache__async_decorator_coalesces(cache):
+    calls = []
+
+    @cache
+    async def slow_double(number):
+        calls.append(number)
+        await asyncio.sleep(0.01)
+        return number * 2
+
+    async def burst():
+        return await asyncio.gather(*(slow_double(2) for _ in range(5)))
+
+    assert asyncio.run(burst()) == [4] * 5
+    assert calls == [2]
+    assert cache.flight.coalesced == 4
+    assert cache.table.calls.count("put_item") == 1
+
+
+def test_cache__async_decorator_coalesces_errors(cache):
+    @cache
+    async def failing():
+        await asyncio.sleep(0.01)
+        raise ValueError("upstream is down")
+
+    async def burst():
+        return await asyncio.gather(
+            *(failing() for _ in range(3)), return_exceptions=True
+        )
+
+    results = asyncio.run(burst())
+
+    assert all(isinstance(result, ValueError) for result in results)
+    assert cache.flight.coalesced == 2
+    assert "put_item" not in cache.table.calls
+
+
+def test_cache__custom_key(cache):
+    cache.key = lambda text: f"length:{len(text)}"
+    calls = []
+
+    @cache
+    def upper(text):
+        calls.append(text)
+        return text.upper()
+
+    assert upper("abc") == "ABC"
+    assert upper("xyz") == "ABC"
+    assert calls == ["abc"]
+    assert list(cache.table.items) == [cache.item_key("length:3")]
+
+
+def test_make_hasheable__canonical():
+    key = make_hasheable((1, "a"), {"lang": "en", "version": "red"})
+
+    assert key == make_hasheable((1, "a"), {"version": "red", "lang": "en"})
+    assert key != make_hasheable((1, "a"), {"lang": "es", "version": "red"})
+    assert make_hasheable(({"b", "a"},), {}) == make_hasheable(({"a", "b"},), {})
+    with raises(TypeError):
+        make_hasheable((object(),), {})
+
+
+def test_cache__functions_do_not_share_entries(cache):
+    @cache
+    def double(number):
+        return number * 2
+
+    @cache
+    def triple(number):
+        return number * 3
+
+    assert double(2) == 4
+    assert triple(2) == 6
+    assert len(cache.table.items) == 2
+
+
+def test_cache__keys_have_a_fixed_length(cache):
+    short = cache.item_key("a")
+    long = cache.item_key("seed " * 1000)
+
+    assert len(short) == len(long) == len("cache:v1:") + 32
+    assert short.startswith("cache:v1:")
+
+
+def test_cache__version_bump_leaves_entries_behind(cache):
+    cache.put("key", "old")
+    cache.memory.clear()
+    cache.version = 2
+
+    with raises(KeyError):
+        cache.get("key")
+    cache.put("key", "new")
+    assert cache.get("key") == "new"
+    assert len(cache.table.items) == 2
+
+
+def test_cache__get_many(cache):
+    cache.put_many({f"key{number}": number for number in range(150)})
+    cache.memory.clear()
+    cache.put("key0", "in memory")
+
+    values = cache.get_many(["key0", "key1", "key149", "missing"])
+
+    assert values == {"key0": "in memory", "key1": 1, "key149": 149}
+    assert cache.table.calls.count("batch_write_item") == 6
+    assert cache.table.calls.count("batch_get_item") == 1
+    assert "get_item" not in cache.table.calls
+
+
+def test_cache__amany(cache):
+    calls = []
+
+    async def double(number):
+        calls.append(number)
+        if number < 0:
+            raise ValueError(number)
+        return number * 2
+
+    cache.put(function_key(double, (1,), {}), 2)
+
+    results = asyncio.run(cache.amany(double, [1, 2, 3, 2, -1], concurrency=2))
+
+    assert results[1] == 2
+    assert results[2] == 4
+    assert results[3] == 6
+    assert isinstance(results[-1], ValueError)
+    assert sorted(calls) == [-1, 2, 3]
+    assert cache.get(function_key(double, (3,), {})) == 6
+
+
+def test_cache__async_bulk_calls_keep_the_deadline(cache):
+    async def get_many():
+        with deadline.budget(0.001):
+            await asyncio.sleep(0.002)
+            return await cache.aget_many(["key0", "key1"])
+
+    async def put_many():
+        with deadline.budget(0.001):
+            await asyncio.sleep(0.002)
+            return await cache.aput_many({"key0": 0, "key1": 1})
+
+    with raises(deadline.DeadlineExceeded):
+        asyncio.run(get_many())
+    with raises(deadline.DeadlineExceeded):
+        asyncio.run(put_many())
+    assert "batch_get_item" not in cache.table.calls
+    assert "batch_write_item" not in cache.table.calls
+
+
+@fixture
+def stale_cache(cache):
+    cache.soft_ttl = 30
+    cache.key = lambda number: f"number:{number}"
+    cache.put("number:2", "stale")
+    for key, (serialized, expires, fresh) in list(cache.memory.items.items()):
+        cache.memory.items[key] = (serialized, expires, time() - 1)
+    return cache
+
+
+def test_cache__stale_while_revalidate(stale_cache):
+    refreshed = threading.Event()
+
+    @stale_cache
+    def double(number):
+        refreshed.set()
+        return number * 2
+
+    assert double(2) == "stale"
+    assert refreshed.wait(5)
+    for _ in range(100):
+        if not stale_cache.refreshing:
+            break
+        sleep(0.01)
+    assert double(2) == 4
+    assert stale_cache.counters[("cache_stale", None)] == 1
+
+
+def test_cache__failed_refresh_keeps_stale_value(stale_cache):
+    @stale_cache
+    def failing(number):
+        raise ValueError("upstream is down")
+
+    assert failing(2) == "stale"
+    for _ in range(100):
+        if not stale_cache.refreshing:
+            break
+        sleep(0.01)
+    assert failing(2) == "stale"
+    assert stale_cache.counters[("cache_refresh_error", None)] >= 1
+
+
+def test_cache__async_stale_while_revalidate(stale_cache):
+    calls = []
+
+    @stale_cache
+    async def double(number):
+        calls.append(number)
+        await asyncio.sleep(0.01)
+        return number * 2
+
+    async def requests():
+        first = await asyncio.gather(double(2), double(2), double(2))
+        await asyncio.gather(*stale_cache.tasks)
+        return first, await double(2)
+
+    stale, fresh = asyncio.run(requests())
+
+    assert stale == ["stale"] * 3
+    assert fresh == 4
+    assert calls == [2]
+
+
+@fixture(
+    params=[
+        ("bulbasaur", "A strange seed was planted on its back at birth."),
+        ["a", ("nested", ("tuple",)), {"key": (1, 2.5, None, True)}],
+        {"big": "seed " * 500},
+        "",
+    ]
+)
+def cache_value(request):
+    return request.param
+
+
+def test_encode_value__round_trip(cache_value):
+    encoded = dynamo_cache.encode_value(cache_value)
+
+    assert isinstance(encoded, bytes)
+    assert encoded[0] == dynamo_cache.FORMAT_VERSION
+    assert dynamo_cache.decode_value(encoded) == cache_value
+    assert type(dynamo_cache.decode_value(encoded)) is type(cache_value)
+
+
+def test_encode_value__compresses_big_values():
+    value = {"big": "seed " * 500}
+
+    encoded = dynamo_cache.encode_value(value)
+
+    assert encoded[1] == 1  # zlib
+    assert len(encoded) < len(json.dumps(value)) / 10
+
+
+def test_cache__reads_legacy_json_items(cache):
+    cache.table.items[cache.item_key("key")] = {
+        "key": cache.item_key("key"),
+        "value": '["bulbasaur", "a seed"]',
+        "ttl": Decimal(str(time() + 60)),
+    }
+
+    assert cache.get("key") == ["bulbasaur", "a seed"]
+    assert cache.get("key") == ["bulbasaur", "a seed"]
+    assert cache.counters[("cache_hit", "memory")] == 1
+
+
+def test_cache__stores_binary_items(cache):
+    cache.put("key", ("bulbasaur", "a seed"))
+    cache.memory.clear()
+
+    item = cache.table.items[cache.item_key("key")]
+    assert isinstance(item["blob"], bytes)
+    assert isinstance(item["ttl"], int)
+    assert "value" not in item
+    assert cache.get("key") == ("bulbasaur", "a seed")
+
+
+def test_cache__freshness(cache):
+    cache.soft_ttl = 30
+    cache.put("key", "value")
+
+    assert 29 < cache.freshness("key") <= 30
+    with raises(KeyError):
+        cache.freshness("missing")
+
+
+def test_cache__warm_recomputes_cached_entries(cache):
+    calls = []
+
+    def double(number):
+        calls.append(number)
+        return number * 2
+
+    cache.put(function_key(double, (2,), {}), "old")
+
+    assert cache.warm(double, 2) == 4
+    assert cache.get(function_key(double, (2,), {})) == 4
+    assert calls == [2]
@@ -0,0 +1,27 @@
+from modules import http_caching
+
+
+def test_etag__is_stable():
+    etag = http_caching.etag("json", "bulbasaur", "A seed", False)
+
+    assert etag == http_caching.etag("json", "bulbasaur", "A seed", False)
+    assert etag != http_caching.etag("text", "bulbasaur", "A seed", False)
+    assert etag.startswith('"') and etag.endswith('"')
+
+
+def test_not_modified():
+    etag = '"abc"'
+
+    assert http_caching.not_modified('"abc"', etag)
+    assert http_caching.not_modified('"x", W/"abc"', etag)
+    assert http_caching.not_modified("*", etag)
+    assert not http_caching.not_modified('"x"', etag)
+    assert not http_caching.not_modified(None, etag)
+
+
+def test_cache_control():
+    assert http_caching.cache_control(90.7) == "public, max-age=90"
+    assert http_caching.cache_control(-5) == "public, no-cache"
+    assert http_caching.cache_control(None) == (
+        f"public, max-age={http_caching.DEFAULT_MAX_AGE}"
+    )
@@ -1,8 +1,11 @@
+import asyncio
 import json
 
 from pytest import fixture, raises
+import httpx
 
-from modules import pokedex
+from modules import http_client, pokedex
+from conftest import POKE_API_SPECIES_LIST
 
 CLEAN_DESCRIPTION_CASES = [
     {
@@ -79,3 +82,125 @@ def test_get_pokemon_description__success(mock_network):
 def test_get_pokemon_description__not_a_pokemon(mock_network):
     with raises(pokedex.PokemonNotFoundError) as error:
         result = pokedex.get_pokemon_description("not_a_pokemon")
+
+
+def test_get_pokemon_description_async__success(mock_async_network):
+    result = asyncio.run(pokedex.get_pokemon_description_async("1"))
+
+    name, description = result
+    assert name == "bulbasaur"
+    assert description == "There is a seed on its back. By soaking up the sun’s rays, the seed..."
+    assert mock_async_network.calls.call_count == 1
+
+
+def test_get_pokemon_description_async__not_a_pokemon(mock_async_network):
+    with raises(pokedex.PokemonNotFoundError) as error:
+        asyncio.run(pokedex.get_pokemon_description_async("not_a_pokemon"))
+
+
+@fixture
+def species_index(monkeypatch):
+    monkeypatch.setattr(pokedex, "SPECIES_INDEX_PATH", "/nonexistent")
+    monkeypatch.setattr(pokedex, "_SPECIES_INDEX", None)
+    monkeypatch.setattr(pokedex, "_SPECIES_INDEX_RETRY_AT", 0.0)
+
+
+@fixture(params=["1", "01", "0001", "bulbasaur", "Bulbasaur", " bulbasaur "])
+def bulbasaur_id(request):
+    return request.param
+
+
+def test_resolve_pokemon_id__canonical(species_index, bulbasaur_id, mock_network):
+    assert pokedex.resolve_pokemon_id(bulbasaur_id) == "bulbasaur"
+    assert pokedex.resolve_pokemon_id("6") == "charizard"
+    assert mock_network.call_count == 1
+
+
+def test_resolve_pokemon_id__unknown_is_rejected_locally(species_index, mock_network):
+    for pokemon_id in ["not_a_pokemon", "0", "7", "²"]:
+        with raises(pokedex.PokemonNotFoundError):
+            pokedex.resolve_pokemon_id(pokemon_id)
+
+    assert mock_network.call_count == 1
+
+
+def test_resolve_pokemon_id_async__canonical(species_index, mock_async_network):
+    result = asyncio.run(pokedex.resolve_pokemon_id_async("0006"))
+
+    assert result == "charizard"
+    assert mock_async_network.calls.call_count == 1
+
+
+def test_resolve_pokemon_id_async__cold_burst(species_index, monkeypatch):
+    calls = []
+
+    class SlowClient:
+        async def get(self, url, timeout=None):
+            calls.append(url)
+            await asyncio.sleep(0.01)
+            request = httpx.Request("GET", url)
+            return httpx.Response(200, json=POKE_API_SPECIES_LIST, request=request)
+
+    monkeypatch.setattr(http_client, "get_client", SlowClient)
+
+    async def burst():
+        return await asyncio.gather(
+            *(pokedex.resolve_pokemon_id_async("1") for _ in range(20))
+        )
+
+    assert asyncio.run(burst()) == ["bulbasaur"] * 20
+    assert calls == [pokedex.SPECIES_LIST_URL]
+
+
+def test_resolve_pokemon_id__without_index(species_index, requests_mock):
+    requests_mock.get(pokedex.SPECIES_LIST_URL, status_code=500)
+
+    assert pokedex.resolve_pokemon_id("Not_A_Pokemon") == "not_a_pokemon"
+    assert pokedex.resolve_pokemon_id("1") == "1"
+    assert requests_mock.call_count == 1
+
+
+def test_species_index__dump_and_load(tmp_path):
+    path = str(tmp_path / "species.txt")
+    pokedex.SpeciesIndex(["bulbasaur", "ivysaur"]).dump(path)
+
+    index = pokedex.SpeciesIndex.load(path)
+
+    assert index.resolve("2") == "ivysaur"
+    assert len(index) == 2
+
+
+SPECIES_PAYLOAD = {
+    "id": 6,
+    "names": [{"name": "Glurak", "language": {"name": "de"}}],
+    "flavor_text_entries": [
+        {"flavor_text": "Spits fire.", "language": {"name": "en"}},
+        {"flavor_text": "Crache du feu qui fait fondre la pierre.", "language": {"name": "fr"}},
+        {"language": {"name": "en"}, "flavor_text": "It breathes\ffire of such great heat."},
+        {"flavor_text": "Ñ" * 100, "language": {"name": "es"}},
+    ],
+    "name": "charizard",
+}
+
+
+@fixture(params=[1, 7, 1 << 20])
+def chunk_size(request):
+    return request.param
+
+
+def test_species_parser__keeps_name_and_longest_english(chunk_size):
+    payload = json.dumps(SPECIES_PAYLOAD, ensure_ascii=False).encode("utf-8")
+    parser = pokedex.SpeciesParser()
+
+    for start in range(0, len(payload), chunk_size):
+        parser.feed(payload[start : start + chunk_size])
+
+    assert parser.close() == ("charizard", "It breathes fire of such great heat.")
+
+
+def test_species_parser__without_english():
+    parser = pokedex.SpeciesParser()
+    parser.feed(json.dumps({"name": "glurak", "flavor_text_entries": []}).encode())
+
+    with raises(pokedex.DescriptionNotFoundError):
+        parser.close()
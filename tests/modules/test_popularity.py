@@ -0,0 +1,40 @@
+from modules import popularity
+
+
+def test_count_min_sketch__never_undercounts():
+    sketch = popularity.CountMinSketch(width=16, depth=3)
+
+    for number in range(100):
+        sketch.add(f"pokemon{number}")
+    for _ in range(50):
+        sketch.add("pikachu")
+
+    assert sketch.estimate("pikachu") >= 50
+    assert all(sketch.estimate(f"pokemon{number}") >= 1 for number in range(100))
+
+
+def test_top_k__keeps_the_most_counted():
+    top = popularity.TopK(k=2)
+
+    for name in ["pikachu"] * 5 + ["eevee"] * 3 + ["ditto"] + ["bulbasaur"] * 4:
+        top.add(name)
+
+    assert top.top() == [("pikachu", 5), ("bulbasaur", 4)]
+    assert top.top(1) == [("pikachu", 5)]
+
+
+def test_top_k__pop_starts_over():
+    top = popularity.TopK(k=2)
+    top.add("pikachu")
+
+    assert top.pop() == {"pikachu": 1}
+    assert len(top) == 0
+    assert top.sketch.estimate("pikachu") == 0
+
+
+def test_merge__decays_shared_counts():
+    shared = {"pikachu": 8, "eevee": 2}
+
+    merged = popularity.merge(shared, {"eevee": 3, "ditto": 1}, 60, 60, k=2)
+
+    assert merged == {"pikachu": 4, "eevee": 4}
@@ -1,9 +1,12 @@
+import asyncio
+import threading
 import json
 import urllib
 
 from pytest import fixture, raises
+import httpx
 
-from modules import shakespeare
+from modules import deadline, shakespeare
 from conftest import SHAKESPEAREAN_TRANSLATION_CASES
 
 
@@ -30,3 +33,120 @@ def test__shakesperean_translation__cases(
     result = shakespeare.get_shakesperean_translation(original_description)
 
     assert mock_network.call_count == 2
+
+
+def test__shakesperean_translation_async__cases(
+    shakespeareean_translation_cases, mock_async_network
+):
+    original_description = shakespeareean_translation_cases[
+        "original_description"
+    ]
+    answer = shakespeareean_translation_cases["answer"]
+
+    result = asyncio.run(
+        shakespeare.get_shakesperean_translation_async(original_description)
+    )
+
+    assert result == answer
+    assert mock_async_network.calls.call_count == 1
+
+
+def test_translation_key__normalized():
+    key = shakespeare.translation_key("There is a seed\non its  back.")
+
+    assert key == shakespeare.translation_key(" There is a seed on its back. ")
+    assert key != shakespeare.translation_key("There is a seed on its back")
+    assert key.startswith("shakespeare:")
+    assert len(key) == len("shakespeare:") + 64
+
+
+def test_token_bucket():
+    bucket = shakespeare.TokenBucket(2, 3600)
+
+    assert bucket.take()
+    assert bucket.take()
+    assert not bucket.take()
+    assert 0 < bucket.wait_time() <= 1800
+
+
+def test_worker_bucket__splits_the_quota():
+    bucket = shakespeare.worker_bucket(5, 3600, workers=10)
+
+    assert bucket.capacity == 1
+    assert bucket.rate == 0.5 / 3600
+    assert shakespeare.worker_bucket(10, 3600, workers=2).capacity == 5
+
+
+def test_scheduler__users_first_and_bounded():
+    scheduler = shakespeare.TranslationScheduler(shakespeare.TokenBucket(1, 3600), size=2)
+    scheduler.bucket.drain()
+    scheduler.on_translated = []
+
+    with shakespeare.background():
+        for text in ["one", "two", "three"]:
+            scheduler.defer(text)
+    scheduler.defer("mine")
+    scheduler.defer("yours")
+    scheduler.defer("theirs")
+
+    assert list(scheduler.pending) == ["mine", "yours"]
+    assert list(scheduler.backlog) == []
+
+
+def test__shakesperean_translation__quota_exhausted(translation_quota, mock_network):
+    text = "BULBASAUR can be seen napping in bright sunlight."
+    translation_quota.bucket = shakespeare.TokenBucket(1, 0.05)
+    translation_quota.bucket.take()
+    translated = threading.Event()
+    translation_quota.on_translated = [lambda text, result: translated.set()]
+
+    with raises(shakespeare.TranslationPendingError) as error:
+        shakespeare.get_shakesperean_translation(text)
+    with raises(shakespeare.TranslationPendingError):
+        shakespeare.get_shakesperean_translation(text)
+
+    assert error.value.text == text
+    assert translated.wait(5)
+    assert mock_network.call_count == 1
+
+
+def test__shakesperean_translation__throttled_upstream(translation_quota, requests_mock):
+    requests_mock.post(
+        shakespeare.URL,
+        status_code=429,
+        json={"error": {"code": 429, "message": "Too Many Requests"}},
+    )
+    translation_quota.on_translated = []
+
+    with raises(shakespeare.TranslationPendingError):
+        shakespeare.get_shakesperean_translation("There is a seed on its back.")
+
+    assert translation_quota.bucket.tokens < 1
+    assert len(translation_quota) == 1
+
+
+def test__shakesperean_translation__upstream_errors(requests_mock):
+    requests_mock.post(shakespeare.URL, status_code=503, text="<html>down</html>")
+
+    with raises(Exception) as error:
+        shakespeare.get_shakesperean_translation("There is a seed on its back.")
+
+    assert deadline.is_transient(error.value)
+
+    requests_mock.post(shakespeare.URL, status_code=200, json={"success": {}})
+
+    with raises(shakespeare.UpstreamError):
+        shakespeare.get_shakesperean_translation("There is a seed on its back.")
+
+
+def test__shakesperean_translation_async__upstream_errors(mock_async_network):
+    mock_async_network.post(shakespeare.URL).mock(
+        return_value=httpx.Response(503, json={"error": {"code": 503}})
+    )
+
+    with raises(Exception) as error:
+        asyncio.run(
+            shakespeare.get_shakesperean_translation_async("There is a seed on its back.")
+        )
+
+    assert deadline.is_transient(error.value)
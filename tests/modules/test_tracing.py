@@ -0,0 +1,95 @@
+import asyncio
+
+from pytest import raises
+
+from modules import tracing
+
+
+def test_span__outside_of_a_trace():
+    with tracing.span("pokedex") as current:
+        pass
+
+    assert current.outcome == "ok"
+    assert current.duration >= 0
+
+
+def test_trace__collects_spans():
+    with tracing.trace() as spans:
+        with tracing.span("cache_get", "descriptions") as current:
+            current.outcome = "miss"
+        with tracing.span("render"):
+            pass
+
+    assert [(span.stage, span.outcome) for span in spans] == [
+        ("cache_get", "miss"),
+        ("render", "ok"),
+    ]
+
+
+def test_span__outcome_of_exceptions():
+    class PendingError(RuntimeError):
+        outcome = "pending"
+
+    with tracing.trace() as spans:
+        with raises(PendingError):
+            with tracing.span("translation"):
+                raise PendingError()
+        with raises(ValueError):
+            with tracing.span("pokedex"):
+                raise ValueError()
+
+    assert [span.outcome for span in spans] == ["pending", "error"]
+
+
+def test_traced__async_tasks_share_the_trace():
+    @tracing.traced("pokedex")
+    async def describe(name):
+        await asyncio.sleep(0)
+        return name
+
+    async def run():
+        with tracing.trace() as spans:
+            await asyncio.gather(describe("a"), describe("b"))
+        return spans
+
+    spans = asyncio.run(run())
+
+    assert [span.stage for span in spans] == ["pokedex", "pokedex"]
+
+
+def test_server_timing():
+    cache = tracing.Span("cache_get", "descriptions")
+    cache.duration = 1.234
+    render = tracing.Span("render")
+    render.duration = 0.5
+
+    assert tracing.server_timing([cache, render]) == (
+        'cache_get;desc="descriptions";dur=1.23, render;dur=0.50'
+    )
+
+
+def test_server_timing__quotes_descriptions():
+    cache = tracing.Span("cache_get", 'say "hi"\r\nX-Injected: 1')
+    cache.duration = 1
+
+    assert tracing.server_timing([cache]) == (
+        'cache_get;desc="say \\"hi\\"X-Injected: 1";dur=1.00'
+    )
+
+
+def test_tracing_middleware__leaves_the_path_out(monkeypatch):
+    monkeypatch.setattr(tracing, "SERVER_TIMING", True)
+    sent = []
+
+    async def app(scope, receive, send):
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b""})
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {"type": "http", "path": '/pokemon/"\r\nX-Injected: 1'}
+    asyncio.run(tracing.TracingMiddleware(app)(scope, None, send))
+
+    (timing,) = [value for name, value in sent[0]["headers"] if name == b"server-timing"]
+    assert timing.startswith(b"route;dur=")
@@ -0,0 +1,96 @@
+import asyncio
+
+from pytest import mark, raises
+
+from modules import deadline, shakespeare, translation
+from modules.dynamo_cache import Cache
+from conftest import SHAKESPEAREAN_TRANSLATION_CASES
+
+LOCAL_CASES = list(SHAKESPEAREAN_TRANSLATION_CASES.items())[:2]
+
+
+class FailingEngine(translation.Engine):
+    def __init__(self, error):
+        self.error = error
+        self.calls = 0
+
+    def translate(self, text):
+        self.calls += 1
+        raise self.error
+
+
+@mark.parametrize("text, answer", LOCAL_CASES)
+def test_local_engine__cases(text, answer):
+    assert translation.LocalEngine().translate(text) == answer
+
+
+@mark.parametrize(
+    "text, answer",
+    [
+        ("you are here", "thou art hither"),
+        ("You have it.", "Thou hast it."),
+        ("WHERE are YOU", "Whither art Thee"),
+        ("Sunny days are over", "Sunny days art o'er"),
+        ("It is nothing…", "'tis naught."),
+    ],
+)
+def test_local_engine__phrases(text, answer):
+    assert translation.LocalEngine().translate(text) == answer
+
+
+def test_local_engine__batch():
+    engine = translation.LocalEngine()
+    texts = [text for text, _ in LOCAL_CASES]
+    answers = [answer for _, answer in LOCAL_CASES]
+
+    assert engine.translate_many(texts) == answers
+    assert asyncio.run(engine.atranslate_many(texts + texts)) == dict(LOCAL_CASES)
+
+
+def test_fallback_engine__transient_error():
+    error = deadline.DeadlineExceeded()
+    engine = translation.FallbackEngine(FailingEngine(error), translation.LocalEngine())
+    text, answer = LOCAL_CASES[0]
+
+    assert engine.translate(text) == answer
+    assert asyncio.run(engine.atranslate(text)) == answer
+    assert asyncio.run(engine.atranslate_many([text])) == {text: answer}
+
+
+def test_fallback_engine__remote_upstream_errors(requests_mock):
+    requests_mock.post(shakespeare.URL, status_code=503, text="<html>down</html>")
+    remote = translation.RemoteEngine(Cache(dummy=True))
+    engine = translation.FallbackEngine(remote, translation.LocalEngine())
+    text, answer = LOCAL_CASES[0]
+
+    assert engine.translate(text) == answer
+
+    requests_mock.post(shakespeare.URL, status_code=200, text="<html>oops</html>")
+
+    assert engine.translate(text) == answer
+
+
+def test_fallback_engine__pending():
+    text, answer = LOCAL_CASES[1]
+    primary = FailingEngine(shakespeare.TranslationPendingError(text))
+    engine = translation.FallbackEngine(primary, translation.LocalEngine())
+
+    with raises(shakespeare.TranslationPendingError) as error:
+        engine.translate(text)
+
+    assert error.value.translation == answer
+
+
+def test_fallback_engine__other_errors():
+    engine = translation.FallbackEngine(
+        FailingEngine(KeyError("contents")), translation.LocalEngine()
+    )
+
+    with raises(KeyError):
+        engine.translate("There")
+
+
+def test_get_engine():
+    assert isinstance(translation.get_engine("local", None), translation.LocalEngine)
+    with raises(ValueError):
+        translation.get_engine("google", None)
@@ -0,0 +1,19 @@
+from fastapi.testclient import TestClient
+
+from main import APP
+
+client = TestClient(APP)
+
+
+def test__GET_internal_cache(mock_network):
+    client.get("/pokemon/bulbasaur")
+
+    response = client.get("/internal/cache")
+
+    assert response.status_code == 200
+    stats = response.json()
+    assert set(stats) == {"descriptions", "translations", "popularity"}
+    assert stats["descriptions"]["get_latency"]["count"] >= 1
+    assert set(stats["descriptions"]) == {
+        "tiers", "item_size", "get_latency", "put_latency", "hot_keys"
+    }
@@ -1,6 +1,27 @@
+from time import time
+import asyncio
+import gzip
+import json
+
+from fastapi import responses
 from fastapi.testclient import TestClient
+import httpx
 
 from main import APP
+from controller import pokedex as controller_pokedex
+from modules import (
+    bundle,
+    cache_backends,
+    compression,
+    deadline,
+    pokedex,
+    popularity,
+    tracing,
+    translation,
+)
+from modules.cache_stats import CacheStats
+from modules.dynamo_cache import Cache
+from v1.endpoints import pokemon as pokemon_endpoint
 
 client = TestClient(APP)
 
@@ -71,3 +92,368 @@ def test__GET_pokemon__charizard__as_html(mock_network):
     assert response.json()["detail"][0]["msg"] == (
         "value is not a valid enumeration member; permitted: 'text', 'json'"
     )
+
+
+def test__POST_pokemon_batch(mock_network):
+    response = client.post(
+        "/pokemon/batch", json={"ids": ["charizard", "1", "not_a_pokemon", "1"]}
+    )
+
+    assert response.status_code == 200
+    assert response.json() == [
+        {
+            "id": "charizard",
+            "name": "charizard",
+            "description": (
+                "Charizard flies around the sky in search of powerful opponents. "
+                "It breathes fire of such most heat it mealt stone."
+            ),
+        },
+        {
+            "id": "1",
+            "name": "bulbasaur",
+            "description": (
+                "Thither is a seed on its back. By soaking up the travelling "
+                "lamp’s rays, the seed."
+            ),
+        },
+        {
+            "id": "not_a_pokemon",
+            "status_code": 404,
+            "detail": (
+                "`not_a_pokemon` could not be found in national pokedex, send a "
+                "live specimen if this is a mistake."
+            ),
+        },
+    ]
+
+
+def test__POST_pokemon_batch__without_description(mock_network, mock_async_network):
+    mock_async_network.get("https://pokeapi.co/api/v2/pokemon-species/ivysaur").mock(
+        return_value=httpx.Response(200, json={"name": "ivysaur", "flavor_text_entries": []})
+    )
+
+    response = client.post("/pokemon/batch", json={"ids": ["2", "1"]})
+
+    assert response.status_code == 200
+    ivysaur, bulbasaur = response.json()
+    assert ivysaur["status_code"] == 404
+    assert "no english description" in ivysaur["detail"]
+    assert bulbasaur["name"] == "bulbasaur"
+
+
+def test__POST_pokemon_batch__bundled_species_skip_the_cache(
+    mock_network, tmp_path, monkeypatch
+):
+    path = str(tmp_path / "pokedex.sqlite")
+    bundle.write_bundle(
+        path,
+        [(1, "bulbasaur", "BULBASAUR can be seen napping in bright sunlight.")],
+    )
+    monkeypatch.setattr(bundle, "BUNDLE_PATH", path)
+    monkeypatch.setattr(bundle, "_BUNDLE", None)
+    monkeypatch.setattr(controller_pokedex.DESCRIPTIONS, "stats", CacheStats(sample=1))
+
+    response = client.post("/pokemon/batch", json={"ids": ["1", "6"]})
+    assert response.status_code == 200
+    assert client.get("/pokemon/bulbasaur").status_code == 200
+
+    hot_keys = controller_pokedex.DESCRIPTIONS.stats.snapshot()["hot_keys"]
+    assert [key for key, _ in hot_keys] == [pokedex.description_key("charizard")]
+
+
+def test__POST_pokemon_batch__as_text(mock_network):
+    response = client.post(
+        "/pokemon/batch?output_format=text", json={"ids": ["bulbasaur", "not_a_pokemon"]}
+    )
+
+    assert response.status_code == 200
+    assert response.text == (
+        "bulbasaur: "
+        "Thither is a seed on its back. By soaking up the travelling lamp’s "
+        "rays, the seed.\n"
+        "not_a_pokemon: 404 "
+        "`not_a_pokemon` could not be found in national pokedex, send a "
+        "live specimen if this is a mistake."
+    )
+
+
+def test__POST_pokemon_batch__empty():
+    response = client.post("/pokemon/batch", json={"ids": []})
+
+    assert response.status_code == 422
+
+
+def test__GET_pokemon_export(mock_network):
+    response = client.get("/pokemon/export?limit=1")
+
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    assert response.headers["X-Next-Cursor"] == "1"
+    assert [json.loads(line) for line in response.text.splitlines()] == [
+        {
+            "id": 1,
+            "name": "bulbasaur",
+            "description": (
+                "Thither is a seed on its back. By soaking up the travelling "
+                "lamp’s rays, the seed."
+            ),
+        },
+    ]
+
+
+def test__GET_pokemon_export__resumes_after_the_cursor(mock_network, monkeypatch):
+    monkeypatch.setattr(controller_pokedex, "EXPORT_PAGE_SIZE", 1)
+    response = client.get("/pokemon/export?after=5")
+
+    assert response.status_code == 200
+    assert "X-Next-Cursor" not in response.headers
+    assert [json.loads(line)["name"] for line in response.text.splitlines()] == [
+        "charizard"
+    ]
+
+
+def test__GET_pokemon_export__skips_species_without_description(
+    mock_network, mock_async_network, monkeypatch
+):
+    monkeypatch.setattr(controller_pokedex, "EXPORT_PAGE_SIZE", 1)
+    mock_async_network.get("https://pokeapi.co/api/v2/pokemon-species/ivysaur").mock(
+        return_value=httpx.Response(200, json={"name": "ivysaur", "flavor_text_entries": []})
+    )
+
+    response = client.get("/pokemon/export?limit=2")
+
+    assert response.status_code == 200
+    assert [json.loads(line)["id"] for line in response.text.splitlines()] == [1]
+
+
+def test__GET_pokemon_export__capped(mock_network, monkeypatch):
+    monkeypatch.setattr(controller_pokedex, "EXPORT_MAX_LIMIT", 1)
+
+    response = client.get("/pokemon/export")
+
+    assert response.headers["X-Next-Cursor"] == "1"
+    assert [json.loads(line)["id"] for line in response.text.splitlines()] == [1]
+
+
+def test__GET_pokemon_export__ends_before_the_server_deadline(mock_network, monkeypatch):
+    monkeypatch.setattr(controller_pokedex, "EXPORT_PAGE_SIZE", 1)
+    get_many = controller_pokedex.get_pokemon_descriptions_translated_async
+
+    async def slow(pokemon_ids):
+        await asyncio.sleep(0.2)
+        return await get_many(pokemon_ids)
+
+    monkeypatch.setattr(controller_pokedex, "get_pokemon_descriptions_translated_async", slow)
+
+    with deadline.budget(0.3):
+        response = client.get("/pokemon/export")
+
+    assert response.status_code == 200
+    assert [json.loads(line)["id"] for line in response.text.splitlines()] == [1]
+
+
+def test__GET_pokemon__translation_pending(mock_network, translation_quota):
+    translation_quota.bucket.drain()
+    translation_quota.on_translated = []
+
+    response = client.get("/pokemon/bulbasaur")
+
+    assert response.status_code == 200
+    assert response.headers["X-Translation-Pending"] == "true"
+    assert response.json() == {
+        "name": "bulbasaur",
+        "description": (
+            "There is a seed on its back. By soaking up the sun’s rays, the seed..."
+        ),
+        "translation_pending": True,
+    }
+    assert response.headers["Cache-Control"] == "public, no-cache"
+
+
+def test__GET_pokemon__translation_pending_local_fallback(
+    mock_network, translation_quota, monkeypatch
+):
+    translation_quota.bucket.drain()
+    translation_quota.on_translated = []
+    engine = translation.get_engine("remote+local", controller_pokedex.TRANSLATIONS)
+    monkeypatch.setattr(controller_pokedex, "ENGINE", engine)
+
+    response = client.get("/pokemon/bulbasaur")
+
+    assert response.status_code == 200
+    assert response.headers["X-Translation-Pending"] == "true"
+    assert response.json()["description"] == (
+        "Thither is a seed on its back. By soaking up the travelling lamp’s rays, the seed."
+    )
+    assert response.headers["Cache-Control"] == "public, no-cache"
+
+
+def test__GET_pokemon__server_timing(mock_network, monkeypatch):
+    monkeypatch.setattr(tracing, "SERVER_TIMING", True)
+
+    response = client.get("/pokemon/bulbasaur")
+
+    stages = [
+        entry.split(";")[0] for entry in response.headers["Server-Timing"].split(", ")
+    ]
+    assert response.status_code == 200
+    assert stages == [
+        "cache_get",
+        "pokedex",
+        "cache_get",
+        "translation",
+        "render",
+        "compress",
+        "route",
+    ]
+    assert 'cache_get;desc="translations"' in response.headers["Server-Timing"]
+
+
+def test__GET_pokemon__no_server_timing_by_default(mock_network):
+    response = client.get("/pokemon/bulbasaur")
+
+    assert "Server-Timing" not in response.headers
+
+
+def test__GET_pokemon__feeds_the_warmer(mock_network, monkeypatch):
+    monkeypatch.setattr(controller_pokedex, "POPULARITY", popularity.TopK())
+
+    for pokemon_id in ["bulbasaur", "1", "charizard"]:
+        client.get(f"/pokemon/{pokemon_id}")
+
+    assert controller_pokedex.POPULARITY.top() == [("bulbasaur", 2), ("charizard", 1)]
+    assert controller_pokedex.warm_popular() == ["bulbasaur", "charizard"]
+
+
+def test__publish_popularity__decays_by_the_shared_age(monkeypatch, tmp_path):
+    backend = cache_backends.SQLiteBackend(str(tmp_path / "cache.sqlite"))
+    popular = Cache(ttl=60, backend=backend, memory_items=0, name="popularity")
+    monkeypatch.setattr(controller_pokedex, "POPULAR", popular)
+    monkeypatch.setattr(controller_pokedex, "POPULARITY", popularity.TopK())
+    half_life = controller_pokedex.POPULARITY_HALF_LIFE
+    popular.put(controller_pokedex.POPULARITY_KEY, (time() - half_life, {"ditto": 8}))
+    controller_pokedex.POPULARITY.add("eevee")
+
+    counts = controller_pokedex.publish_popularity()
+
+    assert round(counts["ditto"], 3) == 4
+    assert counts["eevee"] == 1
+    _, shared = popular.get(controller_pokedex.POPULARITY_KEY)
+    assert shared == counts
+
+
+def test__warm_popular__translation_budget(mock_network, monkeypatch):
+    monkeypatch.setattr(controller_pokedex, "POPULARITY", popularity.TopK())
+    controller_pokedex.POPULARITY.add("bulbasaur")
+    controller_pokedex.POPULARITY.add("charizard")
+
+    warmed = controller_pokedex.warm_popular(translations=1)
+
+    assert warmed == ["bulbasaur", "charizard"]
+    translations = [
+        request
+        for request in mock_network.request_history
+        if "funtranslations" in request.url
+    ]
+    assert len(translations) == 1
+
+
+def test__GET_pokemon__etag(mock_network):
+    response = client.get("/pokemon/bulbasaur")
+    as_text = client.get("/pokemon/bulbasaur?output_format=text")
+
+    assert response.headers["ETag"] == client.get("/pokemon/1").headers["ETag"]
+    assert response.headers["ETag"] != as_text.headers["ETag"]
+    assert response.headers["Cache-Control"].startswith("public, max-age=")
+
+
+def test__GET_pokemon__not_modified(mock_network):
+    for output_format in ["json", "text"]:
+        url = f"/pokemon/bulbasaur?output_format={output_format}"
+        etag = client.get(url).headers["ETag"]
+
+        response = client.get(url, headers={"If-None-Match": f'"other", W/{etag}'})
+
+        assert response.status_code == 304
+        assert response.content == b""
+        assert response.headers["ETag"] == etag
+
+
+def test__GET_pokemon__precompressed(mock_network, monkeypatch):
+    monkeypatch.setattr(compression, "MINIMUM_SIZE", 0)
+
+    response = client.get("/pokemon/charizard", headers={"Accept-Encoding": "gzip"})
+
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert response.headers["Vary"] == "Accept-Encoding"
+    assert response.headers["ETag"].startswith('W/"')
+    assert response.json()["name"] == "charizard"
+    key = f'{response.headers["ETag"][2:]}:gzip'
+    assert gzip.decompress(compression.PRECOMPRESSED.get(key)) == response.content
+
+    revalidated = client.get(
+        "/pokemon/charizard",
+        headers={"Accept-Encoding": "gzip", "If-None-Match": response.headers["ETag"]},
+    )
+    assert revalidated.status_code == 304
+    assert revalidated.headers["ETag"] == response.headers["ETag"]
+    assert revalidated.headers["Vary"] == "Accept-Encoding"
+    assert "Content-Encoding" not in revalidated.headers
+
+
+def test__GET_pokemon__not_modified_without_rendering(mock_network, monkeypatch):
+    monkeypatch.setattr(compression, "MINIMUM_SIZE", 0)
+    etag = client.get("/pokemon/charizard", headers={"Accept-Encoding": "gzip"}).headers[
+        "ETag"
+    ]
+
+    def render(self, content):
+        raise AssertionError("rendered")
+
+    monkeypatch.setattr(responses.JSONResponse, "render", render)
+    response = client.get(
+        "/pokemon/charizard", headers={"Accept-Encoding": "gzip", "If-None-Match": etag}
+    )
+
+    assert response.status_code == 304
+    assert response.headers["ETag"] == etag
+    assert response.headers["Vary"] == "Accept-Encoding"
+
+
+def test_json_size():
+    for body in [
+        {"name": "mr-mime", "description": 'Ünïcode "quoted" \\ tab\t'},
+        {"name": "bulbasaur", "description": "", "translation_pending": True},
+    ]:
+        assert pokemon_endpoint._json_size(body) == len(responses.JSONResponse(body).body)
+
+
+def test__GET_pokemon__superscript_number(mock_network):
+    response = client.get("/pokemon/%C2%B2")
+
+    assert response.status_code == 404
+
+
+def test__GET_pokemon__not_found_is_cacheable(mock_network):
+    response = client.get("/pokemon/not_a_pokemon")
+    revalidated = client.get(
+        "/pokemon/not_a_pokemon", headers={"If-None-Match": response.headers["ETag"]}
+    )
+
+    assert response.status_code == 404
+    assert response.headers["Cache-Control"] == "public, max-age=86400"
+    assert revalidated.status_code == 404
+
+
+def test__GET_pokemon__gateway_timeout(mock_network, monkeypatch):
+    async def hung(pokemon_id):
+        await asyncio.sleep(10)
+
+    monkeypatch.setattr(pokedex, "_fetch_species_async", hung)
+
+    with deadline.budget(0.1):
+        response = client.get("/pokemon/bulbasaur")
+
+    assert response.status_code == 504
+    assert "budget" in response.json()["detail"]
@@ -1,6 +1,8 @@
 from fastapi.testclient import TestClient
 
 from main import APP
+from modules import http_client
+import main
 
 client = TestClient(APP)
 
@@ -9,3 +11,35 @@ def test_read_main():
     response = client.get("/")
     assert response.status_code == 200
     assert "<title>OpenBard - Swagger UI</title>" in response.text
+
+
+def test_lambda_handler__keeps_the_http_client(monkeypatch):
+    closed = []
+
+    async def close_client():
+        closed.append(True)
+
+    monkeypatch.setattr(http_client, "close_client", close_client)
+    event = {
+        "resource": "/",
+        "path": "/",
+        "httpMethod": "GET",
+        "headers": {},
+        "multiValueHeaders": {},
+        "queryStringParameters": None,
+        "multiValueQueryStringParameters": None,
+        "requestContext": {
+            "resourcePath": "/",
+            "httpMethod": "GET",
+            "path": "/",
+            "stage": "dev",
+            "identity": {"sourceIp": "127.0.0.1"},
+        },
+        "body": None,
+        "isBase64Encoded": False,
+    }
+
+    for _ in range(2):
+        assert main.lambda_handler(event, None)["statusCode"] == 301
+
+    assert closed == []